@@ -0,0 +1,329 @@
+"""
+Audio alerts
+
+Alerts are queued from the notification handler (never blocking it) and
+played by one long-lived worker thread. The tones are rendered once at start;
+on Linux and macOS they are streamed to a single persistent aplay, pacat or
+SoX play process instead of starting a new process for every beep. macOS has
+none of these by default; without SoX it falls back to one afplay per alert.
+"""
+import io
+import math
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+from array import array
+
+SAMPLE_RATE = 22050
+
+# (frequency in Hz, seconds) pieces of each alert tone; frequency 0 is silence
+TONES = {
+    "below_target": [(800, 0.25)],
+    "above_ceiling": [(1200, 0.12), (0, 0.06), (1200, 0.12)],
+    "zone_up": [(660, 0.1), (880, 0.1)],
+    "zone_down": [(880, 0.1), (660, 0.1)],
+    "signal_lost": [(400, 0.5)],
+}
+
+
+def render_tone(pieces, volume=0.5):
+    """
+    16-bit mono PCM samples of a tone.
+    """
+    samples = array("h")
+    fade = int(SAMPLE_RATE * 0.005)
+    for frequency, seconds in pieces:
+        count = int(SAMPLE_RATE * seconds)
+        for i in range(count):
+            if frequency == 0:
+                samples.append(0)
+                continue
+            # Short fade in and out to avoid clicks
+            envelope = min(1.0, i / fade, (count - i) / fade)
+            samples.append(int(32767 * volume * envelope * math.sin(2 * math.pi * frequency * i / SAMPLE_RATE)))
+    if sys.byteorder == "big":
+        samples.byteswap()
+    return samples.tobytes()
+
+
+def to_wav(pcm):
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(SAMPLE_RATE)
+        f.writeframes(pcm)
+    return buffer.getvalue()
+
+
+class TonePlayer:
+    """
+    Plays the pre-rendered alert tones with whatever the platform offers,
+    falling back to the terminal bell.
+    """
+    def __init__(self):
+        self.tones = {kind: render_tone(pieces) for kind, pieces in TONES.items()}
+        self.process = None
+        self.wav_dir = None
+
+    def play(self, kind):
+        try:
+            if sys.platform.startswith("linux") or sys.platform == "darwin":
+                if self._play_stream(self.tones[kind]):
+                    return
+                if sys.platform == "darwin":
+                    # afplay only plays files, so it needs a process per alert
+                    subprocess.run(["afplay", self._wav_file(kind)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                else:
+                    self._bell()
+            elif sys.platform == "win32":
+                import winsound
+                winsound.PlaySound(to_wav(self.tones[kind]), winsound.SND_MEMORY)
+            else:
+                self._bell()
+        except Exception:
+            self._bell()
+
+    def _play_stream(self, pcm):
+        # Start the helper once and keep feeding it raw samples; False if there is none
+        if self.process is None or self.process.poll() is not None:
+            self.process = self._start_helper()
+        if self.process is None:
+            return False
+        try:
+            self.process.stdin.write(pcm)
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError):
+            self.process = None
+            return False
+        return True
+
+    def _start_helper(self):
+        if shutil.which("aplay"):
+            command = ["aplay", "-q", "-t", "raw", "-f", "S16_LE", "-c", "1", "-r", str(SAMPLE_RATE), "--buffer-time=100000"]
+        elif shutil.which("pacat"):
+            command = ["pacat", "--playback", "--format=s16le", "--channels=1", f"--rate={SAMPLE_RATE}", "--latency-msec=100"]
+        elif shutil.which("play"):
+            # SoX, e.g. from Homebrew on macOS
+            command = ["play", "-q", "-t", "raw", "-e", "signed", "-b", "16", "-L", "-c", "1", "-r", str(SAMPLE_RATE), "-"]
+        else:
+            return None
+        return subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def _wav_file(self, kind):
+        # afplay needs a file, so each tone is written once
+        if self.wav_dir is None:
+            self.wav_dir = tempfile.mkdtemp(prefix="heartrate_alerts_")
+        path = os.path.join(self.wav_dir, kind + ".wav")
+        if not os.path.exists(path):
+            with open(path, "wb") as f:
+                f.write(to_wav(self.tones[kind]))
+        return path
+
+    def _bell(self):
+        print('\a', end='', flush=True)
+
+    def close(self):
+        if self.process and self.process.poll() is None:
+            try:
+                self.process.stdin.close()
+            except OSError:
+                pass
+            self.process.terminate()
+        self.process = None
+        if self.wav_dir:
+            shutil.rmtree(self.wav_dir, ignore_errors=True)
+            self.wav_dir = None
+
+
+class AlertWorker:
+    """
+    Background thread playing queued alerts. The same alert of a device is
+    queued at most once (coalescing) and not repeated within its minimum
+    interval; other devices' alerts are independent. Watchers are called with
+    the monotonic time about every tick seconds.
+    """
+    _STOP = object()
+
+    def __init__(self, player=None, tick=0.5):
+        self.player = player or TonePlayer()
+        self.tick = tick
+        self._queue = queue.Queue()
+        self._queued = set()
+        self._last = {}
+        self._watchers = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def alert(self, kind, min_interval=5.0, device=None):
+        """
+        Queue an alert of a device. Never blocks; returns False if it was coalesced or rate limited.
+        """
+        now = time.monotonic()
+        key = (device, kind)
+        with self._lock:
+            if self._closed or key in self._queued:
+                return False
+            if key in self._last and now - self._last[key] < min_interval:
+                return False
+            self._queued.add(key)
+            self._last[key] = now
+        self._queue.put_nowait(key)
+        return True
+
+    def watch(self, check):
+        with self._lock:
+            self._watchers.append(check)
+
+    def unwatch(self, check):
+        with self._lock:
+            if check in self._watchers:
+                self._watchers.remove(check)
+
+    def close(self):
+        """
+        Stop the worker and release the audio helper. Safe to call more than once.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._queue.put(self._STOP)
+        self._thread.join()
+        self.player.close()
+
+    def _run(self):
+        while True:
+            try:
+                key = self._queue.get(timeout=self.tick)
+            except queue.Empty:
+                key = None
+            if key is self._STOP:
+                break
+            if key:
+                with self._lock:
+                    self._queued.discard(key)
+                self.player.play(key[1])
+
+            with self._lock:
+                watchers = list(self._watchers)
+            now = time.monotonic()
+            for check in watchers:
+                check(now)
+
+
+_default_worker = None
+_default_lock = threading.Lock()
+
+
+def default_worker():
+    """
+    The alert worker shared by all sessions, started on first use.
+    """
+    global _default_worker
+    with _default_lock:
+        if _default_worker is None:
+            _default_worker = AlertWorker()
+        return _default_worker
+
+
+def shutdown():
+    """
+    Stop the shared alert worker if it was started.
+    """
+    global _default_worker
+    with _default_lock:
+        worker, _default_worker = _default_worker, None
+    if worker:
+        worker.close()
+
+
+class AlertRules:
+    """
+    Alert rules of one session, evaluated in constant time per sample:
+        below_target   heart rate below the target heart rate
+        above_ceiling  heart rate above the ceiling
+        zone_up/down   entering a higher or lower heart rate zone
+        signal_lost    no heart rate (or no skin contact) for signal_lost seconds
+    Alerts of the same kind are repeated at most every `repeat` seconds for
+    the same device.
+    """
+    def __init__(self, target_hr=None, ceiling=None, zones=None, signal_lost=None, repeat=5.0, worker=None, device=None):
+        self.device = device
+        self.target_hr = target_hr
+        self.ceiling = ceiling
+        self.zones = zones
+        self.signal_lost = signal_lost
+        self.repeat = repeat
+        self.worker = worker
+
+        self.zone = None
+        self.last_signal = None
+        self.lost = False
+        if signal_lost:
+            self._worker().watch(self.check)
+
+    @classmethod
+    def from_profile(cls, profile, target_hr=None, zones=None, worker=None, device=None):
+        """
+        Rules from the "alerts" section of a profile, e.g.
+        {"ceiling": 175, "zone_changes": true, "signal_lost": 10}.
+        The below target alert is on whenever there is a target heart rate.
+        """
+        settings = (profile or {}).get("alerts", {})
+        return cls(
+            target_hr=target_hr if settings.get("below_target", True) else None,
+            ceiling=settings.get("ceiling"),
+            zones=zones if settings.get("zone_changes") else None,
+            signal_lost=settings.get("signal_lost"),
+            repeat=settings.get("repeat", 5.0),
+            worker=worker,
+            device=device,
+        )
+
+    def update(self, heart_rate, sensor_contact, now):
+        """
+        Evaluate the rules for one sample; now is the monotonic time.
+        """
+        if sensor_contact is not False:
+            self.last_signal = now
+            self.lost = False
+
+        if self.target_hr and heart_rate < self.target_hr:
+            self._fire("below_target")
+        if self.ceiling and heart_rate > self.ceiling:
+            self._fire("above_ceiling")
+
+        if self.zones:
+            zone = self.zones.zone(heart_rate)
+            if self.zone is not None and zone != self.zone:
+                self._fire("zone_up" if zone > self.zone else "zone_down")
+            self.zone = zone
+
+    def check(self, now):
+        # Called by the alert worker, as lost signal means no samples to evaluate
+        if self.last_signal is None or self.lost:
+            return
+        if now - self.last_signal >= self.signal_lost:
+            self.lost = True
+            self._fire("signal_lost")
+
+    def close(self):
+        # Don't start the shared worker just to stop watching
+        worker = self.worker or _default_worker
+        if self.signal_lost and worker:
+            worker.unwatch(self.check)
+
+    def _worker(self):
+        return self.worker or default_worker()
+
+    def _fire(self, kind):
+        self._worker().alert(kind, self.repeat, self.device)
@@ -1,153 +1,419 @@
 import argparse
+import glob
 import os
-import pandas as pd
-import matplotlib.pyplot as plt
-import numpy as np
-from utilities import calculate_calories_burned, get_heart_rate_zones, calculate_age
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from utilities import calculate_calories_burned, calculate_age
+from hrv import hrv_metrics
+from binary_format import load_dataframe, load_records, rr_intervals_ms
+from analysis_cache import AnalysisCache
+from zones import ZoneModel, ZONE_COLOURS
 import json
 
-####################################################################
-# Parse command line arguments
-parser = argparse.ArgumentParser(description="Profile Manager")
-parser.add_argument("-p", "--path", type=str, help="Path to the data to analyse")
-args = parser.parse_args()
-
-####################################################################
-# Check if provided path exists
-if not os.path.exists(args.path):
-    print(f"Error: Path '{args.path}' does not exist.")
-    exit()
-else:
-    print(f"Data in '{args.path}' exists.")
-    csv_path = args.path
-
-# Load .csv as a pandas DataFrame
-print(f"Loading data from '{csv_path}'...")
-df = pd.read_csv(csv_path)
-
-# Remove ".csv" from the path and add "_meta.json"
-workout_name = csv_path.replace(".csv", "").split("/")[-1]
-json_path = 'data/' + workout_name + "_meta.json"
-
-# Check if the JSON file exists
-if os.path.exists(json_path):
+# pandas, numpy and matplotlib are imported where they are used, so the
+# summary helpers (and --help) don't pay for them
+
+# Bump when the analysis or the plot changes so cached results are recomputed
+ANALYSIS_VERSION = "6"
+
+
+def analyse_workout(csv_path, show=True, cache=None, timings=None):
+    """
+    Analyse one recording, save the plot to workout_plots/ and return the summary values.
+    If timings is a dict, the seconds spent loading, computing and rendering are stored in it.
+    """
+    # Remove the extension from the path and add "_meta.json"
+    workout_name = os.path.splitext(os.path.basename(csv_path))[0]
+    json_path = os.path.join(os.path.dirname(csv_path), workout_name + "_meta.json")
+    if not os.path.exists(json_path):
+        json_path = 'data/' + workout_name + "_meta.json"
+    plot_path = "workout_plots/" + workout_name + ".png"
+
+    # Serve unchanged workouts from the cache
+    if cache:
+        key = cache.key(csv_path, json_path, ANALYSIS_VERSION)
+        metrics = cache.get(key)
+        if metrics and "cached_plot" in metrics:
+            print(f"Using cached analysis of '{csv_path}'.")
+            os.makedirs("workout_plots", exist_ok=True)
+            shutil.copyfile(metrics.pop("cached_plot"), plot_path)
+            if show:
+                show_image(plot_path)
+            return metrics
+
+    import numpy as np
+    import pandas as pd
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
+    from streaming_analysis import WorkoutAccumulator
+    from cleaning import remove_artifacts, resample, downsample
+
+    ####################################################################
+    # Load .csv (or memory-mapped binary .hrb) as a pandas DataFrame
+    stage_start = time.perf_counter()
+    print(f"Loading data from '{csv_path}'...")
+    if csv_path.endswith(".hrb"):
+        df = load_dataframe(csv_path)
+        rr_ms = rr_intervals_ms(load_records(csv_path)[1])
+    else:
+        df = pd.read_csv(csv_path)
+        rr_ms = None
+
+    # Load the workout metadata (profile and target HR) if it exists
+    meta_data = load_metadata(json_path)
+    zone_model = ZoneModel.from_profile(meta_data) if meta_data and "max_hr" in meta_data else None
+    stage_start = _record_stage(timings, "load", stage_start)
+
+    ####################################################################
+    # Duration, average/maximum heart rate, kcal and zones of the cleaned
+    # samples, computed with the same accumulator as the streaming analysis
+    # (the whole file is one chunk)
+    ## Convert first column to datetime
+    if not pd.api.types.is_datetime64_any_dtype(df["Timestamp"]):
+        df["Timestamp"] = pd.to_datetime(df["Timestamp"])
+    ## Dropouts and spikes become gaps (NaN)
+    raw_count = df["Heart Rate"].count()
+    df["Heart Rate"] = remove_artifacts(df["Heart Rate"])
+    if raw_count > df["Heart Rate"].count():
+        print(f"Removed {raw_count - df['Heart Rate'].count()} artifacts (implausible values and spikes).")
+    accumulator = WorkoutAccumulator(zone_model)
+    accumulator.add_chunk(df["Timestamp"], df["Heart Rate"])
+    if accumulator.hr_count == 0:
+        return no_samples(csv_path, workout_name)
+    metrics = summarise(accumulator, meta_data, workout_name)
+    target_hr = metrics["target_hr"]
+
+    # Calculate HRV from the RR intervals (recordings made before RR logging don't have them)
+    hrv_str = ""
+    if rr_ms is None and "RR Intervals" in df.columns:
+        rr_text = " ".join(df["RR Intervals"].dropna().astype(str))
+        rr_ms = np.array(rr_text.split(), dtype=float)
+    if rr_ms is not None:
+        rmssd, sdnn, pnn50 = hrv_metrics(rr_ms)
+        if rmssd is not None:
+            hrv_str = f"\nRMSSD: {rmssd} ms, SDNN: {sdnn} ms, pNN50: {pnn50}%"
+
+    # Create one string with all the information
+    summary = summary_string(metrics) + hrv_str
+    stage_start = _record_stage(timings, "compute", stage_start)
+
+    ####################################################################
+    # Re-create main plot with 1 x 2 layout
+    fig, ax = plt.subplots(1,2,figsize=(12,6))
+
+    # Uniform 1 s grid (gaps stay gaps), downsampled to a few thousand points
+    times_ns = df["Timestamp"].to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    grid_ns, heart_rates = resample(times_ns, df["Heart Rate"])
+    plot_ns, plot_hr = downsample(grid_ns, heart_rates)
+    ax[0].plot(plot_ns.astype("datetime64[ns]"), plot_hr, color='black')
+
+    # Add target HR line if specified
+    if target_hr:
+        ax[0].axhline(y=target_hr, color='red', linestyle='--', alpha=0.7)
+
+    ax[0].set_xlabel('Time')
+    ax[0].xaxis.set_major_locator(mdates.AutoDateLocator(maxticks=6))
+    ax[0].xaxis.set_major_formatter(mdates.DateFormatter("%H:%M"))
+    ax[0].set_ylabel('Heart Rate (bpm)')
+    ax[0].set_title(summary)
+    ax[0].relim()
+    ax[0].autoscale_view()
+
+    ####################################################################
+    # Time spent in each heart rate zone (seconds, see zones.py for the zone models)
+        # Zone 1	Very light	50–60%
+        # Zone 2	Light	    60–70%
+        # Zone 3	Moderate    70–80%
+        # Zone 4	Hard	    80–90%
+        # Zone 5	Maximum	    90–100%
+    if metrics["zones"]:
+        # Prepare the heart rate zones
+        hr_zones_labels = list(metrics["zones"].keys())
+        hr_zones_colours = ZONE_COLOURS
+        hr_zones_values = list(metrics["zones"].values())
+
+        # Drop zone that is zero
+        hr_zones_labels = [label for label, value in zip(hr_zones_labels, hr_zones_values) if value > 0]
+        hr_zones_colours = [colour for colour, value in zip(hr_zones_colours, hr_zones_values) if value > 0]
+        hr_zones_values = [value for value in hr_zones_values if value > 0]
+
+        # # Create a pie chart using hr_zones_colours
+        ax[1].pie(hr_zones_values, labels=hr_zones_labels, autopct='%1.1f%%', colors=hr_zones_colours)
+        ax[1].set_title("Heart Rate Zones")
+
+    ####################################################################
+    # Add a title to the plot
+    plt.suptitle(f"Workout summary from {metrics['date']} by {metrics['name']}",fontsize = 16)
+
+    ####################################################################
+    # Save the plot
+    # Create workout_plots directory
+    os.makedirs("workout_plots", exist_ok=True)
+
+    # Save the plot
+    plt.savefig(plot_path)
+    _record_stage(timings, "render", stage_start)
+
+    # Show
+    if show:
+        plt.show(block=True)
+    plt.close(fig)
+
+    metrics["plot"] = plot_path
+    if cache:
+        cache.put(key, metrics, plot_path)
+    return metrics
+
+
+def _record_stage(timings, stage, stage_start):
+    # Store the time since stage_start and start the next stage
+    now = time.perf_counter()
+    if timings is not None:
+        timings[stage] = now - stage_start
+    return now
+
+
+def load_metadata(json_path):
+    """
+    Workout metadata (profile and target HR), or None if there is none.
+    """
+    # Check if the JSON file exists
+    if not os.path.exists(json_path):
+        print(f"Metadata file '{json_path}' does not exist.")
+        return None
     print(f"Metadata file '{json_path}' exists.")
-    use_meta = True
-else:
-    print(f"Metadata file '{json_path}' does not exist.")
-    use_meta = False
-
-####################################################################
-# Caclulate the duration of the workout in HH:MM:SS
-## Convert first column to datetime
-df["Timestamp"] = pd.to_datetime(df["Timestamp"])
-## Calculate the time difference between beginning and end
-duration = df["Timestamp"].iloc[-1] - df["Timestamp"].iloc[0]
-## Convert the time difference to HH:MM:SS and remove days
-duration_str = str(duration).split(".")[0].split(" ")[-1]
-## Calculate the duration in minutes
-duration_min = duration.total_seconds() / 60
-
-# Calculate the average heart rate
-avg_hr = round(df["Heart Rate"].mean(), 1)
-# Calculate the maximum heart rate
-max_hr = df["Heart Rate"].max()
-
-# Initialize target_hr as None
-target_hr = None
-
-# Calculate the calories burned
-if use_meta:
     with open(json_path, "r") as file:
-        meta_data = json.load(file)
-    weight = float(meta_data["weight"])
-    sex = meta_data["sex"]
-    max_hr_meta = float(meta_data["max_hr"])
-    name = meta_data["name"]
-    
-    # Get target_hr from workout metadata if available
-    if "target_hr" in meta_data:
-        target_hr = int(meta_data["target_hr"])
-        print(f"Using target HR from workout metadata: {target_hr} bpm")
-
-    # Calculate exact age based on the DOB
-    age = calculate_age(meta_data["dob"])
+        return json.load(file)
+
+
+def summarise(accumulator, meta_data, workout_name):
+    """
+    Summary values of a workout from its accumulator and metadata. Raises
+    ValueError if no sample is left after cleaning.
+    """
+    if accumulator.hr_count == 0:
+        raise ValueError("no samples")
+    ## Calculate the time difference between beginning and end
+    duration = accumulator.duration
+    ## Convert the time difference to HH:MM:SS and remove days
+    duration_str = str(duration).split(".")[0].split(" ")[-1]
+    ## Calculate the duration in minutes
+    duration_min = duration.total_seconds() / 60
+
+    # Initialize target_hr as None
+    target_hr = None
+    cb = None
+
+    # Profile name from the file name (e.g. 'heartrate_data_mengya_20241109_184307')
+    name = workout_name.split("_")[2]
 
     # Calculate the calories burned
-    cb = calculate_calories_burned(age, weight, avg_hr, duration_min, sex)
+    if meta_data:
+        weight = float(meta_data["weight"])
+        sex = meta_data["sex"]
+        name = meta_data["name"]
 
-    # Calculate heart rate zones
-    hr_zones = get_heart_rate_zones(max_hr_meta)
+        # Get target_hr from workout metadata if available
+        if "target_hr" in meta_data:
+            target_hr = int(meta_data["target_hr"])
+            print(f"Using target HR from workout metadata: {target_hr} bpm")
 
+        # Calculate exact age based on the DOB
+        age = calculate_age(meta_data["dob"])
+
+        # Calculate the calories burned
+        cb = calculate_calories_burned(age, weight, accumulator.avg_hr, duration_min, sex)
+
+    # Get date from workout_name (e.g. 'heartrate_data_mengya_20241109_184307')
+    date = workout_name.split("_")[3]
+    time = workout_name.split("_")[4]
+    date = date[:4] + "-" + date[4:6] + "-" + date[6:]
+    time = time[:2] + ":" + time[2:4]
+
+    zones = None
+    if accumulator.zone_seconds:
+        zones = dict(zip(accumulator.zone_labels, accumulator.zone_seconds))
+
+    return {
+        "workout": workout_name,
+        "name": name,
+        "date": f"{date} {time}",
+        "start": accumulator.first_time.strftime("%Y-%m-%d %H:%M:%S"),
+        "end": accumulator.last_time.strftime("%Y-%m-%d %H:%M:%S"),
+        "duration": duration_str,
+        "duration_min": duration_min,
+        "avg_hr": float(accumulator.avg_hr),
+        "max_hr": accumulator.max_hr,
+        "min_hr": accumulator.min_hr,
+        "samples": accumulator.hr_count,
+        "kcal": cb,
+        "zones": zones,
+        "target_hr": target_hr,
+    }
+
+
+def no_samples(csv_path, workout_name):
+    # Empty recordings (or only artifacts) have nothing to summarise
+    print(f"❌ No samples in '{csv_path}'.")
+    return {"workout": workout_name, "error": "no samples"}
+
+
+def summary_string(metrics):
     # Create one string with all the information
-    summary = f"Duration: {duration_str}, Max HR: {max_hr}, Avg HR: {avg_hr}, kcal: {cb}"
-else:
-    # Create one string with all the information
-    summary = f"Duration: {duration_str}, Max HR: {max_hr}, Avg HR: {avg_hr}"
-
-####################################################################
-# Re-create main plot with 1 x 2 layout
-fig, ax = plt.subplots(1,2,figsize=(12,6))
-ax[0].plot(np.arange(1, df.shape[0] + 1), df["Heart Rate"], color='black')
-
-# Add target HR line if specified
-if target_hr:
-    ax[0].axhline(y=target_hr, color='red', linestyle='--', alpha=0.7)
-
-ax[0].set_xlabel('Sample')
-ax[0].set_ylabel('Heart Rate (bpm)')
-ax[0].set_title(summary)                   
-ax[0].relim()
-ax[0].autoscale_view()
-
-####################################################################
-# Calculate time spend in each heart rate zone
-    # Zone 1	Very light	50–60%
-    # Zone 2	Light	    60–70%
-    # Zone 3	Moderate    70–80%
-    # Zone 4	Hard	    80–90%
-    # Zone 5	Maximum	    90–100%
-if use_meta:
-    # Prepare the heart rate zones
-    hr_zones_labels = ["Rest", "Very light", "Light", "Moderate", "Hard", "Maximum"]
-    hr_zones_colours = ["#FFFFFF", "#C8C8C8", "#3AD3F4", "#73B42B", "#FFD100", "#E70067"]
-    hr_zones_values = []
-
-    # Calculate the time spent in each zone by summing boolean
-    hr_zones_values.append(sum(df["Heart Rate"] < hr_zones['zone1'][0]))
-    hr_zones_values.append(sum((df["Heart Rate"] >= hr_zones['zone1'][0]) & (df["Heart Rate"] < hr_zones['zone1'][1])))
-    hr_zones_values.append(sum((df["Heart Rate"] >= hr_zones['zone2'][0]) & (df["Heart Rate"] < hr_zones['zone2'][1])))
-    hr_zones_values.append(sum((df["Heart Rate"] >= hr_zones['zone3'][0]) & (df["Heart Rate"] < hr_zones['zone3'][1])))
-    hr_zones_values.append(sum((df["Heart Rate"] >= hr_zones['zone4'][0]) & (df["Heart Rate"] < hr_zones['zone4'][1])))
-    hr_zones_values.append(sum(df["Heart Rate"] >= hr_zones['zone5'][0]))
-
-    # Drop zone that is zero
-    hr_zones_labels = [label for label, value in zip(hr_zones_labels, hr_zones_values) if value > 0]
-    hr_zones_colours = [colour for colour, value in zip(hr_zones_colours, hr_zones_values) if value > 0]
-    hr_zones_values = [value for value in hr_zones_values if value > 0]
-
-    # # Create a pie chart using hr_zones_colours
-    ax[1].pie(hr_zones_values, labels=hr_zones_labels, autopct='%1.1f%%', colors=hr_zones_colours)
-    ax[1].set_title("Heart Rate Zones")
-
-####################################################################
-# Add a title to the plot
-# Get date from workout_name (e.g. 'heartrate_data_mengya_20241109_184307')
-date = workout_name.split("_")[3]
-time = workout_name.split("_")[4]
-date = date[:4] + "-" + date[4:6] + "-" + date[6:]
-time = time[:2] + ":" + time[2:4]
-
-plt.suptitle(f"Workout summary from {date} {time} by {name}",fontsize = 16)
-
-####################################################################
-# Save the plot
-# Create workout_plots directory 
-if not os.path.exists("workout_plots"):
-    os.mkdir("workout_plots")
-
-# Save the plot
-plt.savefig("workout_plots/" + workout_name + ".png")
-
-# Show
-plt.show(block=True)
\ No newline at end of file
+    summary = f"Duration: {metrics['duration']}, Max HR: {metrics['max_hr']}, Avg HR: {metrics['avg_hr']}"
+    if metrics["kcal"] is not None:
+        summary += f", kcal: {metrics['kcal']}"
+    return summary
+
+
+def analyse_workout_streaming(csv_path, chunksize=100000):
+    """
+    Summary values of a recording of any length, read in chunks of chunksize samples.
+    """
+    workout_name = os.path.splitext(os.path.basename(csv_path))[0]
+    json_path = os.path.join(os.path.dirname(csv_path), workout_name + "_meta.json")
+    if not os.path.exists(json_path):
+        json_path = 'data/' + workout_name + "_meta.json"
+    meta_data = load_metadata(json_path)
+    zone_model = ZoneModel.from_profile(meta_data) if meta_data and "max_hr" in meta_data else None
+    from streaming_analysis import analyse_stream
+
+    print(f"Streaming data from '{csv_path}' in chunks of {chunksize} samples...")
+    accumulator = analyse_stream(csv_path, zone_model, chunksize)
+    if accumulator.hr_count == 0:
+        return no_samples(csv_path, workout_name)
+    metrics = summarise(accumulator, meta_data, workout_name)
+
+    print(summary_string(metrics))
+    if metrics["zones"]:
+        for label, seconds in metrics["zones"].items():
+            print(f"  {label}: {round(seconds)} s")
+    return metrics
+
+
+def show_image(path):
+    # Show an already rendered plot
+    import matplotlib.pyplot as plt
+    plt.imshow(plt.imread(path))
+    plt.axis("off")
+    plt.tight_layout()
+    plt.show(block=True)
+
+
+def _analyse_headless(path, cache=None):
+    # Worker for the batch mode: render with Agg and never open a window
+    import matplotlib.pyplot as plt
+    plt.switch_backend("Agg")
+    try:
+        return analyse_workout(path, show=False, cache=cache)
+    except Exception as e:
+        return {"workout": os.path.basename(path), "error": str(e)}
+
+
+def find_recordings(pattern):
+    """
+    Recordings in a directory or matching a glob pattern.
+    """
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, "heartrate_data_*")
+    return sorted(path for path in glob.glob(pattern) if path.endswith((".csv", ".hrb")))
+
+
+def analyse_batch(pattern, workers=None, cache=None):
+    """
+    Analyse all recordings in parallel and print a summary table.
+    """
+    paths = find_recordings(pattern)
+    if not paths:
+        print(f"No recordings found for '{pattern}'.")
+        return []
+
+    print(f"Analysing {len(paths)} workouts...")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(partial(_analyse_headless, cache=cache), paths))
+
+    # Print the summary table
+    print(f"\n{'Workout':<45} {'Name':<10} {'Duration':>9} {'Avg HR':>7} {'Max HR':>7} {'kcal':>8}")
+    for result in results:
+        if "error" in result:
+            print(f"{result['workout']:<45} ❌ {result['error']}")
+            continue
+        kcal = "" if result["kcal"] is None else result["kcal"]
+        print(f"{result['workout']:<45} {result['name']:<10} {result['duration']:>9} {result['avg_hr']:>7} {result['max_hr']:>7} {kcal:>8}")
+
+    return results
+
+
+def analyse_trends(period="week", name=None, since=None, until=None, data="data"):
+    """
+    Print and plot the weekly or monthly trends of every profile (or one).
+    """
+    from catalogue import WorkoutCatalogue, CATALOGUE_PATH
+    from trends import refresh, trends, print_trends, plot_trends
+
+    with WorkoutCatalogue(os.path.join(data, os.path.basename(CATALOGUE_PATH))) as catalogue:
+        # Only new or changed workouts are indexed and only their periods recomputed
+        catalogue.update(data)
+        refresh(catalogue)
+        rows = trends(catalogue, name, period, since, until)
+    if not rows:
+        print("No workouts found.")
+        return []
+
+    print_trends(rows)
+    for profile in sorted({row["name"] for row in rows}):
+        plot_path = plot_trends([row for row in rows if row["name"] == profile], profile, period)
+        print(f"Saved {plot_path}")
+    return rows
+
+
+def main(argv=None):
+    ####################################################################
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description="Profile Manager")
+    parser.add_argument("-p", "--path", type=str, help="Path to the data to analyse")
+    parser.add_argument("-b", "--batch", type=str, help="Directory or glob pattern of recordings to analyse without showing plots")
+    parser.add_argument("-j", "--jobs", type=int, help="Number of worker processes for --batch (default: number of CPUs)")
+    parser.add_argument("-s", "--stream", action="store_true", help="Summarise the recording in chunks with bounded memory (no plot)")
+    parser.add_argument("--chunk-size", type=int, default=100000, help="Samples per chunk for --stream")
+    parser.add_argument("--no-cache", action="store_true", help="Recompute the analysis even if it is cached")
+    parser.add_argument("--cache-size", type=float, default=200, help="Maximum size of the analysis cache (MB)")
+    parser.add_argument("-t", "--trends", type=str, choices=["week", "month"], help="Weekly or monthly trends of all workouts in data/ (no windows)")
+    parser.add_argument("-n", "--name", type=str, help="Profile name for --trends (default: all profiles)")
+    parser.add_argument("--since", type=str, help="First day for --trends (YYYY-MM-DD)")
+    parser.add_argument("--until", type=str, help="Last day for --trends (YYYY-MM-DD)")
+    args = parser.parse_args(argv)
+
+    # Cache of computed metrics and rendered plots
+    cache = None if args.no_cache else AnalysisCache(max_bytes=int(args.cache_size * 1024 * 1024))
+
+    if args.batch:
+        import matplotlib
+        matplotlib.use("Agg")
+        analyse_batch(args.batch, args.jobs, cache)
+        return
+
+    if args.trends:
+        import matplotlib
+        matplotlib.use("Agg")
+        analyse_trends(args.trends, args.name, args.since, args.until)
+        return
+
+    ####################################################################
+    # Check if provided path exists
+    if not args.path or not os.path.exists(args.path):
+        print(f"Error: Path '{args.path}' does not exist.")
+        return
+    else:
+        print(f"Data in '{args.path}' exists.")
+
+    if args.stream:
+        analyse_workout_streaming(args.path, args.chunk_size)
+    else:
+        analyse_workout(args.path, cache=cache)
+
+
+if __name__ == "__main__":
+    main()
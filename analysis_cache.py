@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+
+class AnalysisCache:
+    """
+    Content-addressed cache of workout analysis results (metrics as JSON plus the
+    rendered plot), evicting the least recently used entries above max_bytes.
+    files/ remembers the digest of every analysed file by its size and
+    modification time; entries of files that are gone are removed when evicting.
+    """
+    def __init__(self, directory=".analysis_cache", max_bytes=200 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(directory, "files"), exist_ok=True)
+
+    def key(self, data_path, meta_path=None, version=""):
+        """
+        Key from the contents of the data and metadata files and the analysis version.
+        """
+        digest = hashlib.sha256(version.encode())
+        digest.update(self._file_digest(data_path).encode())
+        if meta_path and os.path.exists(meta_path):
+            digest.update(self._file_digest(meta_path).encode())
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        Cached metrics (with "cached_plot" pointing at the cached PNG, if any) or None.
+        """
+        json_path = os.path.join(self.directory, key + ".json")
+        try:
+            with open(json_path, "r") as f:
+                metrics = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        # Mark as recently used
+        os.utime(json_path)
+        plot_path = os.path.join(self.directory, key + ".png")
+        if os.path.exists(plot_path):
+            metrics["cached_plot"] = plot_path
+        return metrics
+
+    def put(self, key, metrics, plot_path=None):
+        """
+        Store the metrics and a copy of the rendered plot.
+        """
+        if plot_path:
+            self._atomic_copy(plot_path, os.path.join(self.directory, key + ".png"))
+        self._atomic_write(os.path.join(self.directory, key + ".json"), json.dumps(metrics))
+        self.evict()
+
+    def evict(self):
+        """
+        Remove the digests of files that no longer exist, then the least recently
+        used entries until the cache fits in max_bytes.
+        """
+        total = self._evict_digests()
+        entries = []
+        for file_name in os.listdir(self.directory):
+            if not file_name.endswith(".json"):
+                continue
+            key = file_name[:-5]
+            paths = [os.path.join(self.directory, key + extension) for extension in (".json", ".png")]
+            try:
+                size = sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+                used = os.path.getmtime(paths[0])
+            except OSError:
+                continue
+            entries.append((used, size, paths))
+            total += size
+
+        # Oldest first
+        for used, size, paths in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            for path in paths:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+
+    def _evict_digests(self):
+        # Returns the size of the digests that are kept
+        directory = os.path.join(self.directory, "files")
+        total = 0
+        for file_name in os.listdir(directory):
+            index_path = os.path.join(directory, file_name)
+            try:
+                with open(index_path, "r") as f:
+                    fields = f.read().split(" ", 3)
+                if len(fields) == 4 and os.path.exists(fields[3]):
+                    total += os.path.getsize(index_path)
+                    continue
+                os.remove(index_path)
+            except OSError:
+                pass
+        return total
+
+    def _file_digest(self, path):
+        # Only re-hash a file when its size or modification time changed
+        stat = os.stat(path)
+        path = os.path.abspath(path)
+        index_path = os.path.join(self.directory, "files", hashlib.sha1(path.encode()).hexdigest())
+        try:
+            with open(index_path, "r") as f:
+                size, mtime_ns, digest, _ = f.read().split(" ", 3)
+            if int(size) == stat.st_size and int(mtime_ns) == stat.st_mtime_ns:
+                return digest
+        except (OSError, ValueError):
+            pass
+
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        digest = digest.hexdigest()
+        # The path tells evict() when the file is gone
+        self._atomic_write(index_path, f"{stat.st_size} {stat.st_mtime_ns} {digest} {path}")
+        return digest
+
+    def _atomic_write(self, path, text):
+        # Write to a temporary file and rename, so parallel workers never see half a file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    def _atomic_copy(self, source, path):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        os.close(fd)
+        shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, path)
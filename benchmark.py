@@ -0,0 +1,376 @@
+"""
+Benchmarks of the acquisition and analysis hot paths
+
+    handler       notifications per second through the notification handler
+                  (decode, record, HRV, statistics) for .csv and .hrb recordings,
+                  with the pipeline metrics switched on and through the sample bus
+    latency       notification-to-disk and notification-to-screen latency
+                  percentiles with simulated devices sending at a fixed rate
+    summary       cost of current_summary (and RunningStats.update) vs. the
+                  number of samples already seen
+    analyse       analyse_workout.py load/compute/render time vs. file size
+
+Results are written as JSON so runs of different versions can be compared
+with --compare.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from measurement import parse_heart_rate_measurement, encode_heart_rate_measurement
+from metrics import Metrics
+from session import WorkoutSession
+from monitor import DetailedHeartRateMonitor, HEART_RATE_MEASUREMENT_CHARACTERISTIC_UUID
+from bus import SampleBus, make_sample, DROP_OLDEST
+import simulator
+from utilities import RunningStats, current_summary
+from zones import ZoneModel
+
+BENCHMARKS = ["handler", "latency", "summary", "analyse"]
+
+
+def percentiles(values):
+    """
+    Latency percentiles in ms.
+    """
+    if not values:
+        return None
+    values = sorted(values)
+
+    def at(fraction):
+        return round(values[min(len(values) - 1, int(fraction * len(values)))] * 1000, 3)
+
+    return {"count": len(values), "p50": at(0.5), "p90": at(0.9), "p99": at(0.99), "max": round(values[-1] * 1000, 3)}
+
+
+def make_packets(count, seed=0):
+    # Realistic notifications from the synthetic source
+    source = simulator.synthetic_source(seed=seed)
+    return [encode_heart_rate_measurement(heart_rate, rr, sensor_contact=True) for _, heart_rate, rr in (next(source) for _ in range(count))]
+
+
+def make_handler(session):
+    # Same work as DetailedHeartRateMonitor.heart_rate_handler and the session's sinks, in one go
+    metrics = session.metrics
+
+    def handler(sender, data):
+        start = metrics.arrival()
+        heart_rate, sensor_contact, energy_expended, rr_intervals = parse_heart_rate_measurement(data)
+        start = metrics.lap("decode", start)
+        session.add_sample(heart_rate, sensor_contact, rr_intervals, start)
+    return handler
+
+
+def new_session(**kwargs):
+    # Without a profile there is no metadata file and no warning sound
+    with contextlib.redirect_stdout(io.StringIO()):
+        return WorkoutSession(simulator.DEFAULT_ADDRESS, catalogue_path=None, **kwargs)
+
+
+def bench_handler(count):
+    results = {}
+    packets = make_packets(count)
+    # Recording formats, and the CSV recording with the pipeline metrics switched on
+    for variant, file_format, timed in [("csv", "csv", False), ("binary", "binary", False), ("csv_metrics", "csv", True)]:
+        session = new_session(file_format=file_format, metrics=Metrics(enabled=timed))
+        handler = make_handler(session)
+
+        start = time.perf_counter()
+        for packet in packets:
+            handler(HEART_RATE_MEASUREMENT_CHARACTERISTIC_UUID, packet)
+        elapsed = time.perf_counter() - start
+        session.close()
+        results[variant] = _throughput(count, elapsed)
+
+    # The same through the sample bus: decode and publish, then the sinks' tasks
+    session = new_session(metrics=Metrics(enabled=False))
+    results["bus"] = _throughput(count, asyncio.run(_bus_run(session, packets)))
+    session.close()
+    return results
+
+
+async def _bus_run(session, packets):
+    bus = SampleBus(session.metrics)
+    session.subscribe(bus)
+    bus.start()
+
+    start = time.perf_counter()
+    for packet in packets:
+        heart_rate, sensor_contact, energy_expended, rr_intervals = parse_heart_rate_measurement(packet)
+        bus.publish(make_sample(heart_rate, sensor_contact, energy_expended, rr_intervals))
+    await bus.close()
+    return time.perf_counter() - start
+
+
+def _throughput(count, elapsed):
+    return {
+        "notifications": count,
+        "seconds": round(elapsed, 4),
+        "per_second": round(count / elapsed),
+        "us_per_notification": round(elapsed / count * 1e6, 3),
+    }
+
+
+async def _latency_run(rate, seconds, burst, fps, flush_rows, flush_interval, graph):
+    session = new_session(flush_rows=flush_rows, flush_interval=flush_interval)
+    state = {"taken": 0, "written": 0, "drawn": 0}
+    disk_arrivals = []
+    screen_arrivals = []
+    disk_latency = []
+    screen_latency = []
+
+    # Notifications from a simulated strap at a fixed rate, through the monitor and its sample bus
+    simulator.add_device(simulator.SimulatedDevice(
+        simulator.DEFAULT_ADDRESS,
+        simulator.synthetic_source(rate=rate, seed=0),
+        burst=burst
+    ))
+    with contextlib.redirect_stdout(io.StringIO()):
+        hrm = DetailedHeartRateMonitor(session, remember_device=False, client_class=simulator.SimulatedClient)
+
+    # Follow each sample (by the monotonic time it arrived) into the recorder buffer and onto the disk
+    recorder = session.recorder
+    append, take, flush = recorder._append, recorder._take, recorder.flush
+
+    def timed_append(heart_rate, rr_intervals, sensor_contact, received_ns):
+        append(heart_rate, rr_intervals, sensor_contact, received_ns)
+        disk_arrivals.append(received_ns / 1e9)
+
+    def timed_take():
+        state["taken"] = len(disk_arrivals)
+        return take()
+
+    def timed_flush():
+        flush()
+        now = time.monotonic()
+        disk_latency.extend(now - arrival for arrival in disk_arrivals[state["written"]:state["taken"]])
+        state["written"] = state["taken"]
+
+    recorder._append, recorder._take, recorder.flush = timed_append, timed_take, timed_flush
+
+    # ... and onto the screen
+    render_task = None
+    if graph:
+        import matplotlib
+        matplotlib.use("Agg")
+        from live_plot import LivePlot, run_plots
+
+        plot = LivePlot(title_func=session.summary, max_rate=max(2, rate))
+        add_sample, render = plot.add_sample, plot.render
+
+        def timed_add_sample(heart_rate, timestamp):
+            add_sample(heart_rate, timestamp)
+            screen_arrivals.append(session.start_monotonic + timestamp)
+
+        def timed_render():
+            drawn = len(screen_arrivals)
+            render()
+            now = time.monotonic()
+            screen_latency.extend(now - arrival for arrival in screen_arrivals[state["drawn"]:drawn])
+            state["drawn"] = drawn
+
+        plot.add_sample, plot.render = timed_add_sample, timed_render
+        session.live_plot = plot
+        hrm.bus.subscribe("plot", session.plot_sample, maxsize=256, policy=DROP_OLDEST)
+        render_task = asyncio.create_task(run_plots([plot], fps))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        await hrm.connect()
+        await hrm.monitor_heart_rate()
+    await asyncio.sleep(seconds)
+
+    if render_task:
+        render_task.cancel()
+    with contextlib.redirect_stdout(io.StringIO()):
+        await hrm.stop_monitoring()
+
+    return {
+        "rate": rate,
+        "seconds": seconds,
+        "burst": burst,
+        "notifications": len(disk_arrivals),
+        "disk_ms": percentiles(disk_latency),
+        "screen_ms": percentiles(screen_latency) if graph else None,
+    }
+
+
+def bench_latency(rate, seconds, burst, fps, flush_rows, flush_interval):
+    try:
+        import matplotlib  # noqa: F401
+        graph = True
+    except ImportError:
+        graph = False
+    return asyncio.run(_latency_run(rate, seconds, burst, fps, flush_rows, flush_interval, graph))
+
+
+def bench_summary(lengths, repeats=1000):
+    results = []
+    zones = ZoneModel.from_profile({"max_hr": 190})
+    start_time = datetime.now()
+    for length in lengths:
+        stats = RunningStats(30, 70, "male", zones)
+        heart_rates = [120 + (i % 60) for i in range(length)]
+
+        start = time.perf_counter()
+        for i, heart_rate in enumerate(heart_rates):
+            stats.update(heart_rate, i)
+        update_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            current_summary(start_time, stats, "bench")
+        summary_seconds = time.perf_counter() - start
+
+        results.append({
+            "history": length,
+            "update_us": round(update_seconds / length * 1e6, 3),
+            "current_summary_us": round(summary_seconds / repeats * 1e6, 3),
+        })
+    return results
+
+
+def write_recording(path, rows):
+    # One sample per second, like a real strap
+    start = datetime(2024, 1, 1, 8, 0, 0)
+    with open(path, "w") as f:
+        f.write("Timestamp,Heart Rate,RR Intervals\n")
+        for i in range(rows):
+            f.write(f"{(start + timedelta(seconds=i)).strftime('%Y-%m-%d %H:%M:%S')},{120 + i % 60},{500 + i % 60} {510 + i % 60}\n")
+
+
+def bench_analyse(sizes):
+    import matplotlib
+    matplotlib.use("Agg")
+    from analyse_workout import analyse_workout
+
+    results = []
+    for rows in sizes:
+        path = f"data/heartrate_data_bench_20240101_{rows:06d}.csv"
+        write_recording(path, rows)
+        with open(os.path.splitext(path)[0] + "_meta.json", "w") as f:
+            json.dump({"name": "bench", "dob": "1990-01-01", "weight": "70", "sex": "male", "max_hr": "190"}, f)
+
+        timings = {}
+        with contextlib.redirect_stdout(io.StringIO()):
+            analyse_workout(path, show=False, timings=timings)
+        results.append({
+            "rows": rows,
+            "bytes": os.path.getsize(path),
+            **{stage: round(seconds, 4) for stage, seconds in timings.items()},
+        })
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def flatten(results, prefix=""):
+    # {"a": {"b": 1}} -> {"a.b": 1}, lists are indexed by position
+    if isinstance(results, dict):
+        items = results.items()
+    elif isinstance(results, list):
+        items = enumerate(results)
+    else:
+        return {prefix: results} if isinstance(results, (int, float)) else {}
+    flat = {}
+    for key, value in items:
+        flat.update(flatten(value, f"{prefix}.{key}" if prefix else str(key)))
+    return flat
+
+
+def compare(old_path, new_path):
+    """
+    Print the numbers of two result files side by side.
+    """
+    with open(old_path, "r") as f:
+        old = flatten(json.load(f)["results"])
+    with open(new_path, "r") as f:
+        new = flatten(json.load(f)["results"])
+
+    print(f"\n{'Benchmark':<45} {'Old':>12} {'New':>12} {'New/Old':>8}")
+    for key, value in new.items():
+        if key not in old:
+            continue
+        ratio = f"{value / old[key]:.2f}" if old[key] else ""
+        print(f"{key:<45} {old[key]:>12} {value:>12} {ratio:>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the heart rate monitor")
+    parser.add_argument("-b", "--bench", type=str, nargs="+", choices=BENCHMARKS, default=BENCHMARKS, help="Benchmarks to run")
+    parser.add_argument("-o", "--output", type=str, help="Output JSON file (default: benchmarks/<commit>_<timestamp>.json)")
+    parser.add_argument("--quick", action="store_true", help="Smaller sizes and shorter runs")
+    parser.add_argument("--rate", type=float, default=100, help="Notifications per second for the latency benchmark")
+    parser.add_argument("--burst", type=int, default=1, help="Notifications delivered at once in the latency benchmark")
+    parser.add_argument("--fps", type=float, default=5, help="Frame rate of the graph in the latency benchmark")
+    parser.add_argument("--flush-interval", type=float, default=5.0, help="Seconds between writes to disk in the latency benchmark")
+    parser.add_argument("--flush-rows", type=int, default=50, help="Buffered samples that trigger a write in the latency benchmark")
+    parser.add_argument("--compare", type=str, help="Earlier result file to compare with")
+    args = parser.parse_args()
+
+    notifications = 20000 if args.quick else 200000
+    latency_seconds = 5 if args.quick else 20
+    history_lengths = [100, 1000, 10000] if args.quick else [100, 1000, 10000, 100000, 1000000]
+    analyse_sizes = [1000, 10000] if args.quick else [1000, 10000, 100000, 1000000]
+
+    commit = git_commit()
+    output = args.output or os.path.join("benchmarks", f"{commit or 'unknown'}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    output = os.path.abspath(output)
+
+    results = {}
+    cwd = os.getcwd()
+    # Recordings and plots go to a scratch directory
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)
+        os.makedirs("data")
+        try:
+            if "handler" in args.bench:
+                print(f"Handler throughput ({notifications} notifications)...")
+                results["handler"] = bench_handler(notifications)
+            if "latency" in args.bench:
+                print(f"Latency ({args.rate:g} notifications/s for {latency_seconds} s)...")
+                results["latency"] = bench_latency(args.rate, latency_seconds, args.burst, args.fps, args.flush_rows, args.flush_interval)
+            if "summary" in args.bench:
+                print("current_summary vs. history length...")
+                results["summary"] = bench_summary(history_lengths)
+            if "analyse" in args.bench:
+                print("analyse_workout vs. file size...")
+                try:
+                    results["analyse"] = bench_analyse(analyse_sizes)
+                except ImportError as e:
+                    print(f"⚠️  Skipped: {e}")
+                    results["analyse"] = {"skipped": str(e)}
+        finally:
+            os.chdir(cwd)
+
+    report = {
+        "commit": commit,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "quick": args.quick,
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"\n💾 Results saved to {output}")
+
+    if args.compare:
+        compare(args.compare, output)
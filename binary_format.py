@@ -0,0 +1,142 @@
+"""
+Binary heart rate recording (.hrb)
+
+File layout (little endian):
+    header  16 bytes: magic b"HRB1", version (uint16), reserved (uint16),
+                      wall clock time of the start in ns since the epoch (int64)
+    records 20 bytes each: offset from the start in ns (uint64), heart rate (uint16),
+                      flags (uint8), number of RR intervals (uint8),
+                      MAX_RR RR intervals in 1/1024 s (uint16, unused ones are 0)
+
+A notification with more than MAX_RR RR intervals is split over several
+records; all but the first have FLAG_CONTINUATION set.
+"""
+import os
+import struct
+from datetime import datetime
+
+MAGIC = b"HRB1"
+VERSION = 1
+MAX_RR = 4
+
+HEADER = struct.Struct("<4sHHq")
+RECORD = struct.Struct(f"<QHBB{MAX_RR}H")
+
+# Record flags
+FLAG_CONTACT_SUPPORTED = 0x01
+FLAG_CONTACT_DETECTED = 0x02
+FLAG_GAP = 0x04
+FLAG_CONTINUATION = 0x08
+
+# Columns of the .csv recordings (RR intervals in ms, space separated)
+CSV_HEADER = ["Timestamp", "Heart Rate", "RR Intervals"]
+
+
+def contact_flags(sensor_contact):
+    # Flags for the sensor contact status (None if the strap doesn't report it)
+    if sensor_contact is None:
+        return 0
+    if sensor_contact:
+        return FLAG_CONTACT_SUPPORTED | FLAG_CONTACT_DETECTED
+    return FLAG_CONTACT_SUPPORTED
+
+
+def split_rr(flags, rr_intervals):
+    """
+    (flags, RR intervals) of the records of one notification: up to MAX_RR
+    intervals each, FLAG_CONTINUATION set on all but the first.
+    """
+    records = []
+    for start in range(0, max(len(rr_intervals), 1), MAX_RR):
+        records.append((flags if start == 0 else flags | FLAG_CONTINUATION, rr_intervals[start:start + MAX_RR]))
+    return records
+
+
+def pack_record(offset_ns, heart_rate, flags, rr_intervals):
+    # One record, with the unused RR interval slots set to 0
+    return RECORD.pack(offset_ns, heart_rate, flags, len(rr_intervals), *rr_intervals, *[0] * (MAX_RR - len(rr_intervals)))
+
+
+def pack_header(start_ns):
+    return HEADER.pack(MAGIC, VERSION, 0, start_ns)
+
+
+def read_header(path):
+    """
+    Start time (ns since the epoch) of a binary recording.
+    """
+    with open(path, "rb") as f:
+        magic, version, _, start_ns = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"'{path}' is not a binary heart rate recording")
+    return start_ns
+
+
+def record_dtype():
+    # NumPy is only needed for offline analysis
+    import numpy as np
+
+    return np.dtype([
+        ("offset_ns", "<u8"),
+        ("heart_rate", "<u2"),
+        ("flags", "u1"),
+        ("rr_count", "u1"),
+        ("rr", "<u2", (MAX_RR,)),
+    ])
+
+
+def load_records(path):
+    """
+    Memory-map the records of a binary recording as a NumPy structured array.
+    Returns (start_ns, records).
+    """
+    import numpy as np
+
+    start_ns = read_header(path)
+    dtype = record_dtype()
+
+    # Ignore a partly written last record
+    count = (os.path.getsize(path) - HEADER.size) // dtype.itemsize
+    if count == 0:
+        return start_ns, np.zeros(0, dtype=dtype)
+    records = np.memmap(path, dtype=dtype, mode="r", offset=HEADER.size, shape=(count,))
+    return start_ns, records
+
+
+def samples(records):
+    """
+    Heart rate samples (no gaps, no continuation records) as (offset_ns, heart_rate).
+    """
+    keep = (records["flags"] & (FLAG_GAP | FLAG_CONTINUATION)) == 0
+    return records["offset_ns"][keep], records["heart_rate"][keep]
+
+
+def rr_intervals_ms(records):
+    """
+    All RR intervals in the recording in ms, in order.
+    """
+    import numpy as np
+
+    mask = np.arange(MAX_RR) < records["rr_count"][:, None]
+    return records["rr"][mask] * (1000 / 1024)
+
+
+def load_dataframe(path):
+    """
+    Load a binary recording into the same columns as the CSV recording
+    (Timestamp, Heart Rate) with nanosecond timestamps. Gaps become NaN rows.
+    """
+    import numpy as np
+    import pandas as pd
+
+    start_ns, records = load_records(path)
+    records = records[(records["flags"] & FLAG_CONTINUATION) == 0]
+    heart_rate = records["heart_rate"].astype(float)
+    heart_rate[(records["flags"] & FLAG_GAP) != 0] = np.nan
+    # Local wall clock time like the CSV recordings
+    local_tz = datetime.now().astimezone().tzinfo
+    timestamps = pd.to_datetime(start_ns + records["offset_ns"].astype(np.int64), unit="ns", utc=True)
+    return pd.DataFrame({
+        "Timestamp": timestamps.tz_convert(local_tz).tz_localize(None),
+        "Heart Rate": heart_rate,
+    })
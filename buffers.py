@@ -0,0 +1,84 @@
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Fixed-size buffer that keeps the most recent values in a NumPy array.
+    """
+    def __init__(self, capacity, dtype=np.float64):
+        self.capacity = capacity
+        self.size = 0
+        self._start = 0
+
+        # Every value is written twice so the contents are always one contiguous slice
+        self._data = np.zeros(2 * capacity, dtype=dtype)
+
+    def append(self, value):
+        if self.size < self.capacity:
+            index = self.size
+            self.size += 1
+        else:
+            index = self._start
+            self._start = (self._start + 1) % self.capacity
+        self._data[index] = value
+        self._data[index + self.capacity] = value
+
+    def values(self):
+        """
+        Oldest-to-newest view of the buffered values (no copy).
+        """
+        return self._data[self._start:self._start + self.size]
+
+    def resize(self, capacity):
+        """
+        Change the capacity, keeping the most recent values.
+        """
+        values = self.values()[-capacity:].copy()
+        self.capacity = capacity
+        self.size = len(values)
+        self._start = 0
+        self._data = np.zeros(2 * capacity, dtype=self._data.dtype)
+        self._data[:self.size] = values
+        self._data[capacity:capacity + self.size] = values
+
+    def __len__(self):
+        return self.size
+
+
+class DownsampledHistory:
+    """
+    Whole-session history kept within a fixed number of points by halving the
+    resolution whenever the buffer is full.
+    """
+    def __init__(self, capacity=2000):
+        self.capacity = capacity
+        self.step = 1
+        self.size = 0
+        self._count = 0
+        self._times = np.zeros(capacity)
+        self._values = np.zeros(capacity)
+
+    def append(self, timestamp, value):
+        # Keep every step-th sample only
+        self._count += 1
+        if (self._count - 1) % self.step:
+            return
+
+        # Drop every other point when full and keep half as many from now on
+        if self.size == self.capacity:
+            half = self.capacity // 2
+            self._times[:half] = self._times[0:self.capacity:2]
+            self._values[:half] = self._values[0:self.capacity:2]
+            self.size = half
+            self.step *= 2
+            self._count = 1
+
+        self._times[self.size] = timestamp
+        self._values[self.size] = value
+        self.size += 1
+
+    def values(self):
+        return self._times[:self.size], self._values[:self.size]
+
+    def __len__(self):
+        return self.size
@@ -0,0 +1,188 @@
+"""
+Publish/subscribe sample bus
+
+The BLE callback only decodes a notification and publishes it. Every consumer
+(recording, statistics, alerts, graph, console, ...) is a sink with its own
+asyncio task and bounded queue, so a slow sink can't hold up the others and a
+new output is one more subscribe() call.
+
+What happens when a sink's queue is full depends on its policy:
+    block            keep every sample: further samples wait in the bus until
+                     the sink has room (the BLE callback itself can't wait),
+                     up to max_waiting of them; past that the newest are
+                     thrown away, so a stalled sink can't use up the memory
+    drop_oldest      throw away the oldest queued sample
+    coalesce_latest  replace the newest queued sample (a sink that only
+                     needs the current value, e.g. the console)
+"""
+import asyncio
+import time
+from collections import deque, namedtuple
+
+BLOCK = "block"
+DROP_OLDEST = "drop_oldest"
+COALESCE_LATEST = "coalesce_latest"
+POLICIES = (BLOCK, DROP_OLDEST, COALESCE_LATEST)
+
+# One decoded notification. time is the monotonic time (s) it was received,
+# arrival the metrics clock (ns) the sink latency is measured from.
+Sample = namedtuple("Sample", ["time", "heart_rate", "sensor_contact", "energy_expended", "rr_intervals", "arrival"])
+
+
+def make_sample(heart_rate, sensor_contact=None, energy_expended=None, rr_intervals=(), arrival=0):
+    return Sample(time.monotonic(), heart_rate, sensor_contact, energy_expended, rr_intervals, arrival)
+
+
+class Subscription:
+    """
+    Bounded queue of one sink and the task that feeds it.
+    """
+    def __init__(self, name, handler, maxsize=64, policy=BLOCK, metrics=None, max_waiting=4096):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown overflow policy '{policy}', use one of {', '.join(POLICIES)}")
+        self.name = name
+        self.handler = handler
+        self.is_async = asyncio.iscoroutinefunction(handler)
+        self.maxsize = max(1, maxsize)
+        self.policy = policy
+        self.metrics = metrics
+
+        self.items = deque()
+        # Samples held back for a full block sink, in order
+        self.waiting = deque()
+        self.max_waiting = max_waiting
+        self.ready = asyncio.Event()
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.task = None
+
+        # Samples held back, thrown away or replaced because the queue was full,
+        # and samples a block sink lost because it stalled for too long
+        self.blocked = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.overflowed = 0
+
+    def offer(self, sample):
+        """
+        Queue a sample without waiting.
+        """
+        if self.waiting or len(self.items) >= self.maxsize:
+            if self.policy == BLOCK:
+                if len(self.waiting) >= self.max_waiting:
+                    if not self.overflowed:
+                        print(f"\n⚠️  The {self.name} sink has stalled, throwing away new samples")
+                    self.overflowed += 1
+                    self._count("sink_overflowed")
+                    return
+                self.waiting.append(sample)
+                self.blocked += 1
+                self._count("sink_blocked")
+                return
+            if self.policy == DROP_OLDEST:
+                self.items.popleft()
+                self.dropped += 1
+                self._count("sink_dropped")
+            else:
+                self.items.pop()
+                self.coalesced += 1
+                self._count("sink_coalesced")
+        self.items.append(sample)
+        self.idle.clear()
+        self.ready.set()
+
+    async def run(self):
+        while True:
+            if not self.items:
+                self.idle.set()
+                self.ready.clear()
+                await self.ready.wait()
+
+            # Handle everything that is queued in one go
+            while self.items:
+                sample = self.items.popleft()
+                if self.waiting:
+                    self.items.append(self.waiting.popleft())
+                try:
+                    if self.is_async:
+                        await self.handler(sample)
+                    else:
+                        self.handler(sample)
+                except Exception as e:
+                    self._count("errors")
+                    print(f"Error in {self.name}: {e}")
+                if self.metrics:
+                    # Time from the notification to the end of this sink
+                    self.metrics.lap(self.name, sample.arrival)
+
+    def _count(self, counter):
+        if self.metrics:
+            self.metrics.count(counter)
+
+
+class SampleBus:
+    """
+    Delivers published samples to every subscribed sink.
+    """
+    def __init__(self, metrics=None):
+        self.metrics = metrics
+        self.subscriptions = []
+        self.closed = False
+        self.running = False
+
+    def subscribe(self, name, handler, maxsize=64, policy=BLOCK, max_waiting=4096):
+        """
+        Add a sink: handler(sample) is called (or awaited) from the sink's own task.
+        """
+        subscription = Subscription(name, handler, maxsize, policy, self.metrics, max_waiting)
+        self.subscriptions.append(subscription)
+        if self.running:
+            subscription.task = asyncio.create_task(subscription.run())
+        return subscription
+
+    def start(self):
+        """
+        Start the sink tasks (needs a running event loop).
+        """
+        if self.running:
+            return
+        self.running = True
+        for subscription in self.subscriptions:
+            subscription.task = asyncio.create_task(subscription.run())
+
+    def publish(self, sample):
+        """
+        Hand a sample to all sinks. Never waits, so it can be called from the BLE
+        callback. Returns False if the bus is closed.
+        """
+        if self.closed:
+            return False
+        for subscription in self.subscriptions:
+            subscription.offer(sample)
+        return True
+
+    async def drain(self):
+        """
+        Wait until every published sample has been handled by every sink.
+        """
+        for subscription in self.subscriptions:
+            await subscription.idle.wait()
+
+    async def close(self, timeout=5.0):
+        """
+        Stop accepting samples, let the sinks finish what is queued (for at most
+        timeout seconds) and stop their tasks. Safe to call more than once.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        if self.running:
+            try:
+                await asyncio.wait_for(self.drain(), timeout)
+            except asyncio.TimeoutError:
+                print(f"⚠️  Sinks did not finish within {timeout:.0f} s, discarding queued samples")
+        tasks = [subscription.task for subscription in self.subscriptions if subscription.task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.running = False
@@ -0,0 +1,316 @@
+"""
+Workout catalogue (data/catalogue.sqlite)
+
+One row per recording with its profile, start and end, summary values and
+time in each zone, so questions across sessions are indexed lookups instead
+of parsing every recording. Sessions add themselves when they stop;
+update() indexes recordings that are new or changed since the last update
+(by size and modification time) and forgets deleted ones. Every change
+marks the day of the workout as stale, so summaries built on the catalogue
+(see trends.py) only recompute what changed.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sqlite3
+from datetime import datetime
+from zones import ZONE_NAMES
+
+CATALOGUE_PATH = "data/catalogue.sqlite"
+
+ZONE_COLUMNS = [f"{zone}_s" for zone in ZONE_NAMES]
+COLUMNS = [
+    "path", "workout", "name", "start", "end", "duration_s", "samples", "avg_hr", "min_hr", "max_hr",
+    "kcal", "target_hr", "gaps", *ZONE_COLUMNS, "size", "mtime_ns", "meta_mtime_ns",
+]
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS workouts (
+    path TEXT PRIMARY KEY,
+    workout TEXT NOT NULL,
+    name TEXT NOT NULL,
+    start TEXT NOT NULL,
+    end TEXT,
+    duration_s REAL,
+    samples INTEGER,
+    avg_hr REAL,
+    min_hr INTEGER,
+    max_hr INTEGER,
+    kcal REAL,
+    target_hr INTEGER,
+    gaps INTEGER,
+    {", ".join(f"{column} REAL" for column in ZONE_COLUMNS)},
+    size INTEGER,
+    mtime_ns INTEGER,
+    meta_mtime_ns INTEGER
+);
+CREATE INDEX IF NOT EXISTS workouts_name_start ON workouts (name, start);
+CREATE INDEX IF NOT EXISTS workouts_start ON workouts (start);
+CREATE INDEX IF NOT EXISTS workouts_name_avg_hr ON workouts (name, avg_hr);
+CREATE TABLE IF NOT EXISTS stale_days (
+    name TEXT NOT NULL,
+    day TEXT NOT NULL,
+    PRIMARY KEY (name, day)
+);
+"""
+
+
+def normalise_path(path):
+    # One spelling per recording, however the directory was given ("data", "./data" or absolute)
+    return os.path.abspath(path)
+
+
+def _meta_path(data_path):
+    return os.path.splitext(data_path)[0] + "_meta.json"
+
+
+def _file_state(data_path):
+    # What tells us a recording changed since it was indexed
+    stat = os.stat(data_path)
+    meta_path = _meta_path(data_path)
+    meta_mtime_ns = os.stat(meta_path).st_mtime_ns if os.path.exists(meta_path) else None
+    return stat.st_size, stat.st_mtime_ns, meta_mtime_ns
+
+
+class WorkoutCatalogue:
+    """
+    SQLite index of the recorded workouts.
+    """
+    def __init__(self, path=CATALOGUE_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=10)
+        self.connection.row_factory = sqlite3.Row
+        # Readers don't block the writer and a crash can't corrupt the index
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def add(self, row):
+        """
+        Insert or replace the row of one recording (a dict with the COLUMNS).
+        """
+        row = dict(row, path=normalise_path(row["path"]))
+        values = [row.get(column) for column in COLUMNS]
+        with self.connection:
+            # The day it was on before (if it is replaced) and the day it is on now
+            self._mark_stale("SELECT name, start FROM workouts WHERE path = ?", (row["path"],))
+            self.connection.execute("INSERT OR IGNORE INTO stale_days VALUES (?, ?)", (row["name"], row["start"][:10]))
+            self.connection.execute(
+                f"INSERT OR REPLACE INTO workouts ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                values,
+            )
+
+    def remove(self, paths):
+        """
+        Forget the recordings at paths.
+        """
+        with self.connection:
+            for path in map(normalise_path, paths):
+                self._mark_stale("SELECT name, start FROM workouts WHERE path = ?", (path,))
+                self.connection.execute("DELETE FROM workouts WHERE path = ?", (path,))
+
+    def clear(self):
+        """
+        Forget all recordings (to index them again).
+        """
+        with self.connection:
+            self._mark_stale("SELECT name, start FROM workouts")
+            self.connection.execute("DELETE FROM workouts")
+
+    def _mark_stale(self, select, parameters=()):
+        # Days (per profile) of the workouts returned by select
+        self.connection.execute(
+            f"INSERT OR IGNORE INTO stale_days SELECT DISTINCT name, substr(start, 1, 10) FROM ({select})",
+            parameters,
+        )
+
+    def add_session(self, session):
+        """
+        Index a finished WorkoutSession from its running statistics, without reading the recording.
+        """
+        stats = session.stats
+        end = datetime.now()
+        row = {
+            "path": session.data_filename,
+            "workout": os.path.splitext(os.path.basename(session.data_filename))[0],
+            "name": session.name,
+            "start": session.start_time.strftime("%Y-%m-%d %H:%M:%S"),
+            "end": end.strftime("%Y-%m-%d %H:%M:%S"),
+            "duration_s": round((end - session.start_time).total_seconds(), 1),
+            "samples": stats.count,
+            "avg_hr": round(stats.mean, 1) if stats.count else None,
+            "min_hr": stats.min,
+            "max_hr": stats.max,
+            "kcal": round(stats.kcal, 1) if session.profile else None,
+            "target_hr": session.target_hr,
+            "gaps": len(session.gaps),
+        }
+        if session.zones:
+            row.update(zip(ZONE_COLUMNS, (round(seconds, 1) for seconds in stats.zone_seconds.values())))
+        row["size"], row["mtime_ns"], row["meta_mtime_ns"] = _file_state(session.data_filename)
+        self.add(row)
+
+    def index_recording(self, data_path):
+        """
+        Index a recording by analysing it in chunks (needs pandas).
+        """
+        from analyse_workout import summarise
+        from streaming_analysis import analyse_stream
+        from zones import ZoneModel
+
+        workout_name = os.path.splitext(os.path.basename(data_path))[0]
+        meta_path = _meta_path(data_path)
+        meta_data = None
+        if os.path.exists(meta_path):
+            with open(meta_path, "r") as f:
+                meta_data = json.load(f)
+        zone_model = ZoneModel.from_profile(meta_data) if meta_data and "max_hr" in meta_data else None
+
+        # The summary helpers print what they find, which is noise here
+        with contextlib.redirect_stdout(io.StringIO()):
+            metrics = summarise(analyse_stream(data_path, zone_model), meta_data, workout_name)
+
+        row = {
+            "path": data_path,
+            "workout": workout_name,
+            "name": metrics["name"],
+            "start": metrics["start"],
+            "end": metrics["end"],
+            "duration_s": round(metrics["duration_min"] * 60, 1),
+            "samples": metrics["samples"],
+            "avg_hr": metrics["avg_hr"],
+            "min_hr": metrics["min_hr"],
+            "max_hr": metrics["max_hr"],
+            "kcal": metrics["kcal"],
+            "target_hr": metrics["target_hr"],
+            "gaps": len(meta_data["gaps"]) if meta_data and "gaps" in meta_data else None,
+        }
+        if metrics["zones"]:
+            row.update(zip(ZONE_COLUMNS, metrics["zones"].values()))
+        row["size"], row["mtime_ns"], row["meta_mtime_ns"] = _file_state(data_path)
+        self.add(row)
+
+    def update(self, directory="data"):
+        """
+        Index new or changed recordings in directory and drop deleted ones.
+        Returns the number of recordings (re)indexed.
+        """
+        from analyse_workout import find_recordings
+
+        # Rows from before the paths were normalised
+        with self.connection:
+            for (path,) in self.connection.execute("SELECT path FROM workouts").fetchall():
+                if normalise_path(path) != path:
+                    self.connection.execute("UPDATE OR REPLACE workouts SET path = ? WHERE path = ?", (normalise_path(path), path))
+
+        known = {
+            row["path"]: (row["size"], row["mtime_ns"], row["meta_mtime_ns"])
+            for row in self.connection.execute("SELECT path, size, mtime_ns, meta_mtime_ns FROM workouts")
+        }
+        paths = [normalise_path(path) for path in find_recordings(directory)]
+        indexed = 0
+        for path in paths:
+            # Recordings that are still running (or need recovering) have a journal
+            if os.path.exists(path + ".journal"):
+                continue
+            if known.get(path) == _file_state(path):
+                continue
+            try:
+                self.index_recording(path)
+                indexed += 1
+            except Exception as e:
+                print(f"❌ Could not index '{path}': {e}")
+
+        # Forget recordings that were deleted
+        present = set(paths)
+        prefix = os.path.join(normalise_path(directory), "")
+        removed = [path for path in known if path.startswith(prefix) and path not in present]
+        if removed:
+            self.remove(removed)
+        return indexed
+
+    def query(self, name=None, since=None, until=None, min_avg_hr=None, max_avg_hr=None, limit=None):
+        """
+        Workouts (as dicts, oldest first) matching all given conditions. since
+        and until are dates or times ("2024-11-01" or "2024-11-01 18:00:00");
+        until is inclusive.
+        """
+        conditions = []
+        parameters = []
+        if name:
+            conditions.append("name = ?")
+            parameters.append(name)
+        if since:
+            conditions.append("start >= ?")
+            parameters.append(since)
+        if until:
+            # A date includes the whole day
+            conditions.append("start <= ?")
+            parameters.append(until if len(until) > 10 else until + " 23:59:59")
+        if min_avg_hr is not None:
+            conditions.append("avg_hr >= ?")
+            parameters.append(min_avg_hr)
+        if max_avg_hr is not None:
+            conditions.append("avg_hr <= ?")
+            parameters.append(max_avg_hr)
+
+        sql = "SELECT * FROM workouts"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY start"
+        if limit:
+            sql += " LIMIT ?"
+            parameters.append(limit)
+        return [dict(row) for row in self.connection.execute(sql, parameters)]
+
+
+def print_workouts(workouts):
+    print(f"{'Start':<20} {'Name':<10} {'Duration':>9} {'Avg HR':>7} {'Max HR':>7} {'kcal':>8}  Workout")
+    for workout in workouts:
+        minutes, seconds = divmod(int(workout["duration_s"] or 0), 60)
+        duration = f"{minutes // 60}:{minutes % 60:02d}:{seconds:02d}"
+        kcal = "" if workout["kcal"] is None else workout["kcal"]
+        avg_hr = "" if workout["avg_hr"] is None else workout["avg_hr"]
+        max_hr = "" if workout["max_hr"] is None else workout["max_hr"]
+        print(f"{workout['start']:<20} {workout['name']:<10} {duration:>9} {avg_hr:>7} {max_hr:>7} {kcal:>8}  {workout['workout']}")
+    print(f"\n{len(workouts)} workout(s)")
+
+
+def main(argv=None):
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description="Search the workout catalogue")
+    parser.add_argument("-n", "--name", type=str, help="Profile name")
+    parser.add_argument("--since", type=str, help="First day (YYYY-MM-DD)")
+    parser.add_argument("--until", type=str, help="Last day (YYYY-MM-DD)")
+    parser.add_argument("--min-avg", type=float, help="Lowest average heart rate")
+    parser.add_argument("--max-avg", type=float, help="Highest average heart rate")
+    parser.add_argument("-d", "--data", type=str, default="data", help="Directory of the recordings (default: data)")
+    parser.add_argument("--no-update", action="store_true", help="Don't look for new recordings first")
+    parser.add_argument("--rebuild", action="store_true", help="Index all recordings again")
+    args = parser.parse_args(argv)
+
+    with WorkoutCatalogue(os.path.join(args.data, os.path.basename(CATALOGUE_PATH))) as catalogue:
+        if args.rebuild:
+            catalogue.clear()
+        if args.rebuild or not args.no_update:
+            indexed = catalogue.update(args.data)
+            if indexed:
+                print(f"Indexed {indexed} new or changed recording(s).\n")
+        print_workouts(catalogue.query(args.name, args.since, args.until, args.min_avg, args.max_avg))
+
+
+if __name__ == "__main__":
+    main()
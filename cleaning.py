@@ -0,0 +1,157 @@
+"""
+Cleaning, resampling and downsampling of heart rate series
+
+    remove_artifacts  implausible values and single-sample spikes become NaN
+    clean_chunks      the same for a recording read in chunks (same result as in one go)
+    resample          uniform time grid, interpolated, NaN inside gaps
+    downsample        Largest-Triangle-Three-Buckets, keeps the shape with few points
+
+The summary values are computed on the cleaned samples; plots use the
+resampled and downsampled series, so a 10 hour recording is drawn as a few
+thousand points on a real time axis. Everything is vectorised with numpy
+(apart from the sequential bucket loop of LTTB, which runs once per output
+point).
+"""
+import numpy as np
+from measurement import MIN_HR, MAX_HR
+
+# A sample that differs this much (bpm) from both neighbours, in the same direction, is a spike
+MAX_JUMP = 30
+
+# Resampling step and the longest interval (s) that is interpolated instead of shown as a gap
+STEP = 1.0
+MAX_GAP = 5.0
+
+# Points drawn per plot
+PLOT_POINTS = 3000
+
+
+def remove_artifacts(heart_rates, previous=np.nan, following=np.nan, min_hr=MIN_HR, max_hr=MAX_HR, max_jump=MAX_JUMP):
+    """
+    Copy of heart_rates (floats, gaps as NaN) with artifacts replaced by NaN.
+    previous and following are the raw samples around the series, if there are any.
+    """
+    heart_rates = np.asarray(heart_rates, dtype=float)
+    cleaned = heart_rates.copy()
+    cleaned[(heart_rates < min_hr) | (heart_rates > max_hr)] = np.nan
+
+    # Differences to both raw neighbours; NaN neighbours never make a spike
+    padded = np.concatenate(([previous], heart_rates, [following]))
+    rise = heart_rates - padded[:-2]
+    fall = heart_rates - padded[2:]
+    spikes = (np.abs(rise) > max_jump) & (np.abs(fall) > max_jump) & (np.sign(rise) == np.sign(fall))
+    cleaned[spikes] = np.nan
+    return cleaned
+
+
+def clean_chunks(chunks, **limits):
+    """
+    Clean (timestamps, heart_rates) chunks of pandas Series. The last sample
+    of each chunk is held back until the next chunk shows what follows it.
+    """
+    import pandas as pd
+
+    held_times = held_rates = None
+    previous = np.nan
+    for timestamps, heart_rates in chunks:
+        if held_times is not None:
+            timestamps = pd.concat([held_times, timestamps], ignore_index=True)
+            heart_rates = pd.concat([held_rates, heart_rates], ignore_index=True)
+        if len(timestamps) < 2:
+            held_times, held_rates = timestamps, heart_rates
+            continue
+        raw = heart_rates.to_numpy(dtype=float)
+        cleaned = remove_artifacts(raw[:-1], previous, raw[-1], **limits)
+        yield timestamps.iloc[:-1].reset_index(drop=True), pd.Series(cleaned)
+        previous = raw[-2]
+        held_times = timestamps.iloc[-1:].reset_index(drop=True)
+        held_rates = heart_rates.iloc[-1:].reset_index(drop=True)
+
+    if held_times is not None and len(held_times):
+        yield held_times, pd.Series(remove_artifacts(held_rates.to_numpy(dtype=float), previous, **limits))
+
+
+def resample(times_ns, heart_rates, step=STEP, max_gap=MAX_GAP):
+    """
+    Heart rate on a uniform grid every step seconds, linearly interpolated
+    between samples. Short dropouts (removed artifacts) are bridged; grid
+    points in an interval without samples longer than max_gap seconds are
+    NaN. Returns (grid_ns, values).
+    """
+    times_ns = np.asarray(times_ns, dtype=np.int64)
+    heart_rates = np.asarray(heart_rates, dtype=float)
+    valid = ~np.isnan(heart_rates)
+    times_ns = times_ns[valid]
+    heart_rates = heart_rates[valid]
+    if len(times_ns) < 2:
+        return times_ns, heart_rates
+
+    step_ns = int(step * 1e9)
+    grid_ns = np.arange(times_ns[0], times_ns[-1] + 1, step_ns, dtype=np.int64)
+    # Times relative to the start keep full precision in float64
+    values = np.interp(grid_ns - times_ns[0], times_ns - times_ns[0], heart_rates)
+
+    # Interval of the samples around each grid point (samples themselves are kept)
+    after = np.clip(np.searchsorted(times_ns, grid_ns, side="right"), 1, len(times_ns) - 1)
+    in_gap = times_ns[after] - times_ns[after - 1] > max_gap * 1e9
+    in_gap &= (grid_ns != times_ns[after - 1]) & (grid_ns != times_ns[after])
+    values[in_gap] = np.nan
+    return grid_ns, values
+
+
+def lttb(x, y, threshold):
+    """
+    Indices of threshold points of (x, y) chosen with Largest-Triangle-Three-Buckets
+    (Steinarsson 2013). x must be increasing and y free of NaN.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    # Bucket edges for the points between the first and the last
+    edges = np.floor(np.arange(threshold - 1) * (n - 2) / (threshold - 2)).astype(np.int64) + 1
+    edges[-1] = n - 1
+    # Mean of every bucket, used as the third corner for the bucket before it
+    counts = np.diff(edges)
+    mean_x = np.add.reduceat(x[:-1], edges[:-1]) / counts
+    mean_y = np.add.reduceat(y[:-1], edges[:-1]) / counts
+    mean_x = np.append(mean_x, x[-1])
+    mean_y = np.append(mean_y, y[-1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # Twice the area of the triangle (previous point, candidate, mean of the next bucket)
+        area = np.abs(
+            (x[previous] - mean_x[bucket + 1]) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (mean_y[bucket + 1] - y[previous])
+        )
+        previous = start + int(np.argmax(area))
+        selected[bucket + 1] = previous
+    return selected
+
+
+def downsample(x, y, threshold=PLOT_POINTS):
+    """
+    About threshold points of (x, y) for plotting, chosen with LTTB. NaN
+    values (gaps) are kept as one NaN between the points around them, so the
+    line breaks there.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=float)
+    valid = np.flatnonzero(~np.isnan(y))
+    if len(valid) == 0:
+        return x[:0], y[:0]
+
+    indices = valid[lttb(x[valid].astype(float), y[valid], threshold)]
+    # Put the first NaN of every gap between the selected points around it
+    gaps = np.flatnonzero(np.isnan(y))
+    breaks = np.flatnonzero(np.searchsorted(gaps, indices[1:]) != np.searchsorted(gaps, indices[:-1]))
+    positions = np.insert(indices, breaks + 1, gaps[np.searchsorted(gaps, indices[breaks])])
+    values = np.insert(y[indices], breaks + 1, np.nan)
+    return x[positions], values
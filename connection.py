@@ -0,0 +1,88 @@
+import asyncio
+import json
+import os
+
+# Heart Rate Service UUID (advertised by heart rate straps)
+HEART_RATE_SERVICE_UUID = "0000180d-0000-1000-8000-00805f9b34fb"
+
+KNOWN_DEVICES_PATH = "configs/known_devices.json"
+
+
+def _scanner(scanner_class=None):
+    # bleak is only imported once Bluetooth is actually used
+    if scanner_class is None:
+        from bleak import BleakScanner as scanner_class
+    return scanner_class
+
+
+async def find_devices(addresses, timeout=10.0, scanner_class=None):
+    """
+    Scan until all addresses have been seen (or the timeout runs out) and
+    return {address: BLEDevice} for the ones that were found.
+    """
+    wanted = {address.upper() for address in addresses}
+    found = {}
+    all_found = asyncio.Event()
+
+    def detection_callback(device, advertisement_data):
+        address = device.address.upper()
+        if address in wanted and address not in found:
+            found[address] = device
+            print(f"✅ Found {device.name} ({device.address})")
+            if len(found) == len(wanted):
+                all_found.set()
+
+    # Stop as soon as every target has been seen instead of waiting for a full discovery
+    async with _scanner(scanner_class)(detection_callback):
+        try:
+            await asyncio.wait_for(all_found.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    return found
+
+
+async def list_heart_rate_devices(timeout=10.0, scanner_class=None):
+    """
+    Print all devices advertising the Heart Rate service.
+    """
+    print(f"Scanning {timeout:.0f} s for heart rate monitors...")
+    devices = await _scanner(scanner_class).discover(timeout=timeout, service_uuids=[HEART_RATE_SERVICE_UUID])
+
+    print("\n=== Heart Rate Monitors ===")
+    for device in devices:
+        print(f"Device Name: {device.name}")
+        print(f"Device Address: {device.address}")
+        print("---")
+    if not devices:
+        print("No heart rate monitors found.")
+
+
+def load_known_devices():
+    """
+    Addresses of devices we connected to before.
+    """
+    if not os.path.exists(KNOWN_DEVICES_PATH):
+        return {}
+    try:
+        with open(KNOWN_DEVICES_PATH, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_known_device(address, name):
+    """
+    Remember a device so the next start can connect without scanning.
+    """
+    known_devices = load_known_devices()
+    if known_devices.get(address.upper()) == name:
+        return
+    known_devices[address.upper()] = name
+
+    # Create configs folder if it doesn't exist
+    if not os.path.exists("configs"):
+        os.makedirs("configs")
+
+    with open(KNOWN_DEVICES_PATH, "w") as f:
+        json.dump(known_devices, f)
@@ -0,0 +1,93 @@
+import argparse
+import csv
+import os
+from datetime import datetime
+from binary_format import pack_header, pack_record, read_header, split_rr, RECORD, HEADER, FLAG_GAP, FLAG_CONTINUATION, CSV_HEADER
+
+
+def csv_to_binary(csv_path, hrb_path):
+    with open(csv_path, "r", newline="") as f:
+        rows = list(csv.DictReader(f))
+
+    # Second-resolution timestamps become offsets from the first row
+    times = [datetime.strptime(row["Timestamp"], "%Y-%m-%d %H:%M:%S") for row in rows]
+    start = times[0] if times else datetime.now()
+
+    with open(hrb_path, "wb") as f:
+        f.write(pack_header(int(start.timestamp() * 1e9)))
+        for row, timestamp in zip(rows, times):
+            offset_ns = int((timestamp - start).total_seconds() * 1e9)
+
+            # Rows without a heart rate mark a gap
+            if not row["Heart Rate"]:
+                f.write(pack_record(offset_ns, 0, FLAG_GAP, ()))
+                continue
+
+            # RR intervals are stored in ms in the CSV and in 1/1024 s in the binary file
+            rr = [round(float(value) * 1024 / 1000) for value in (row.get("RR Intervals") or "").split()]
+            for flags, chunk in split_rr(0, rr):
+                f.write(pack_record(offset_ns, int(float(row["Heart Rate"])), flags, chunk))
+
+
+def _complete_records(f):
+    # Ignore a partly written last record
+    data = f.read()
+    return data[:len(data) // RECORD.size * RECORD.size]
+
+
+def binary_to_csv(hrb_path, csv_path):
+    start_ns = read_header(hrb_path)
+    rows = []
+    with open(hrb_path, "rb") as f:
+        f.seek(HEADER.size)
+        for offset_ns, heart_rate, flags, rr_count, *rr in RECORD.iter_unpack(_complete_records(f)):
+            rr_ms = " ".join(str(round(value * 1000 / 1024)) for value in rr[:rr_count])
+
+            # Continuation records only carry more RR intervals (of a sample
+            # that is missing if the recording starts with them)
+            if flags & FLAG_CONTINUATION:
+                if not rows:
+                    continue
+                rows[-1][2] = f"{rows[-1][2]} {rr_ms}".strip()
+                continue
+
+            timestamp = datetime.fromtimestamp((start_ns + offset_ns) / 1e9).strftime("%Y-%m-%d %H:%M:%S")
+            if flags & FLAG_GAP:
+                rows.append([timestamp, "", ""])
+            else:
+                rows.append([timestamp, heart_rate, rr_ms])
+
+    with open(csv_path, "w", newline="") as f:
+        csv_writer = csv.writer(f)
+        csv_writer.writerow(CSV_HEADER)
+        csv_writer.writerows(rows)
+
+
+def main(argv=None):
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description="Convert heart rate recordings between .csv and .hrb")
+    parser.add_argument("-p", "--path", type=str, required=True, help="Path to the recording to convert")
+    parser.add_argument("-o", "--output", type=str, help="Output path (default: same name with the other extension)")
+    args = parser.parse_args(argv)
+
+    # Check if provided path exists
+    if not os.path.exists(args.path):
+        print(f"Error: Path '{args.path}' does not exist.")
+        return
+
+    base, extension = os.path.splitext(args.path)
+    if extension == ".csv":
+        output = args.output or base + ".hrb"
+        csv_to_binary(args.path, output)
+    elif extension == ".hrb":
+        output = args.output or base + ".csv"
+        binary_to_csv(args.path, output)
+    else:
+        print("Error: only .csv and .hrb recordings can be converted.")
+        return
+
+    print(f"Converted '{args.path}' to '{output}'")
+
+
+if __name__ == "__main__":
+    main()
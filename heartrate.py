@@ -3,321 +3,344 @@ import logging
 import sys
 import platform
 import argparse
-import csv
 import os
-import time
+import glob
+import signal
 import threading
-from datetime import datetime
-import matplotlib.pyplot as plt
-from utilities import current_summary, load_profile, calculate_age, play_warning_sound
-import json 
-
-from bleak import BleakScanner, BleakClient
-
-# Parse command line arguments
-parser = argparse.ArgumentParser(description="Bluetooth Heart Rate Monitor")
-parser.add_argument("-d", "--device", type=str, help="Target device address")
-parser.add_argument("-g", "--graph", action="store_true", help="Display live heart rate graph")
-parser.add_argument("-n", "--name", type=str, help="Target device address")
-parser.add_argument("-t", "--target", type=int, help="Target heart rate (bpm)")
-args = parser.parse_args()
-
-# If there is not data folder, create it
-try:
-    os.mkdir("data")
-except FileExistsError:
-    pass
-
-# Load the profile
-if args.name:
-    print("=== Loading profile ===")
-    name = args.name
-    path2profile = f"configs/{name}.json"
-    profile = load_profile(path2profile)
-
-    # Calculate exact age based on the DOB
-    age = calculate_age(profile["dob"])
-    weight = float(profile["weight"])
-    sex = profile["sex"]
-
-    # Print the profile
-    print(profile)
-    print("\nCalculating age...\n")
-    print(f"Age: {age} years")
-else:
-    name = "default"
-    age = 0
-    weight = 0
-    sex = "unknown"
-    print("No profile selected...")
-
-# Set target heart rate
-target_hr = args.target if args.target else None
-if target_hr:
-    print(f"Target heart rate set to: {target_hr} bpm")
-
-# Create a CSV file to store the data with the current timestamp
-timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-csv_filename = f"data/heartrate_data_{name}_{timestamp}.csv"
-
-# Print the header
-print("\n=== Starting heart rate monitor ===")
-
-# Print the CSV filename
-print(f"The data will be written to: {csv_filename}")
-
-# Open the CSV file and write the header
-with open(csv_filename, mode='w', newline='') as file:
-    csv_writer = csv.writer(file)
-    csv_writer.writerow(["Timestamp", "Heart Rate"])
-
-if name != "default":
-    # Strip .csv from the filename
-    meta_data_filename = csv_filename.replace(".csv", "_meta.json")
-
-    # Copy profile to the data folder and add target_hr if specified
-    workout_metadata = profile.copy()  # Copy the profile data
-    if target_hr:
-        workout_metadata["target_hr"] = target_hr  # Add target HR to workout metadata
-    
-    with open(meta_data_filename, "w") as file:
-        json.dump(workout_metadata, file)
-    print(f"Profile saved to {meta_data_filename}")
-    if target_hr:
-        print(f"Target HR {target_hr} bpm saved to workout metadata")
-
-# Set the target device address if provided
-if args.device:
-    TARGET_DEVICE_ADDRESS = args.device
-    # Print the target device address
-    print(f"Target Device Address: {TARGET_DEVICE_ADDRESS}")
-
-# Heart Rate Service and Characteristic UUIDs
-HEART_RATE_MEASUREMENT_CHARACTERISTIC_UUID = "00002a37-0000-1000-8000-00805f9b34fb"
-
-# Global flag for graceful shutdown
-shutdown_flag = False
-
-def monitor_input():
-    """Monitor for user input to gracefully shutdown"""
-    global shutdown_flag
-    try:
-        input("Press Enter to stop monitoring and save data...\n")
-        shutdown_flag = True
-    except EOFError:
-        # Handle case where input is not available (like in some environments)
-        pass
+import json
+from session import WorkoutSession
+from catalogue import CATALOGUE_PATH
+from metrics import Metrics, start_metrics_server
+from monitor import DetailedHeartRateMonitor, connect_monitors
+from connection import list_heart_rate_devices
+from bus import BLOCK, DROP_OLDEST
+import alerts
 
-class DetailedHeartRateMonitor:
-    def __init__(self, target_address=TARGET_DEVICE_ADDRESS):
-        self.target_address = target_address
-        self.client = None
-        self.is_connected = False
-        self.last_warning_time = 0  # Track last warning sound time
-
-    async def scan_and_connect(self):
-        """
-        Comprehensive scanning and connection process with detailed logging.
-        """
-        print("Starting comprehensive Bluetooth device scanning...")
-        
-        try:
-            # Detailed device scanning
-            print("Scanning for Bluetooth LE devices...")
-            devices = await BleakScanner.discover()
-            
-            print("\n=== Discovered Devices ===")
-            for device in devices:
-                print(f"Device Name: {device.name}")
-                print(f"Device Address: {device.address}")
-                print("---")
-            
-            # Find target device
-            target_device = next(
-                (device for device in devices if device.address == self.target_address), 
-                None
-            )
-            
-            if not target_device:
-                print(f"\n❌ Target device {self.target_address} not found.")
-                return False
-            
-            print(f"\n✅ Target device found: {target_device.name}")
-            
-            # Attempt connection
-            print("\nAttempting to connect...")
-            self.client = BleakClient(self.target_address)
-            await self.client.connect(timeout=30.0)  # Time out after 30 seconds
-            
-            self.is_connected = True
-            print("✅ Successfully connected to the heart rate monitor!")
-            
-            return True
-        
-        except Exception as e:
-            print(f"\n❌ Connection Error: {e}")
-            return False
-
-    async def monitor_heart_rate(self):
-        """
-        Monitor heart rate with detailed error handling and logging.
-        """
-        if not self.is_connected:
-            print("Not connected to the device.")
+def build_parser():
+    # Command line arguments
+    parser = argparse.ArgumentParser(description="Bluetooth Heart Rate Monitor")
+    parser.add_argument("-d", "--device", type=str, nargs="+", help="Target device address(es)")
+    parser.add_argument("-D", "--devices", type=str, help="JSON file mapping device addresses to profiles (and optional targets)")
+    parser.add_argument("-g", "--graph", action="store_true", help="Display live heart rate graph")
+    parser.add_argument("-n", "--name", type=str, help="Profile name (single device only)")
+    parser.add_argument("-t", "--target", type=int, help="Target heart rate (bpm)")
+    parser.add_argument("--scan-timeout", type=float, default=10.0, help="Seconds to scan for the target devices")
+    parser.add_argument("--connect-timeout", type=float, default=30.0, help="Seconds to wait for a connection")
+    parser.add_argument("--max-backoff", type=float, default=30.0, help="Longest wait (s) between reconnection attempts")
+    parser.add_argument("-w", "--window", type=float, default=5, help="Minutes of data shown in the live graph")
+    parser.add_argument("--overview", action="store_true", help="Show the whole session at reduced resolution below the live graph")
+    parser.add_argument("--hrv-window", type=int, default=120, help="Number of RR intervals used for the live HRV")
+    parser.add_argument("--dashboard", action="store_true", help="Show a live dashboard in the terminal (no graphics needed, works over SSH)")
+    parser.add_argument("--fps", type=float, default=5, help="Frame rate of the live heart rate graph or dashboard")
+    parser.add_argument("-f", "--format", type=str, choices=["csv", "binary"], default="csv", help="Format of the data file")
+    parser.add_argument("--flush-interval", type=float, default=5.0, help="Seconds between writes of buffered data to disk")
+    parser.add_argument("--flush-rows", type=int, default=50, help="Number of buffered samples that triggers an early write to disk")
+    parser.add_argument("--fsync-interval", type=float, default=5.0, help="Seconds between syncs of the recording journal to disk (at most this much is lost on a power cut)")
+    parser.add_argument("--no-journal", action="store_true", help="Don't keep a recovery journal of the recording")
+    parser.add_argument("--no-catalogue", action="store_true", help="Don't add the workout to the catalogue (data/catalogue.sqlite) when it ends")
+    parser.add_argument("--simulate", type=str, help="Replay a .csv recording (or 'synthetic' data) from simulated devices instead of using Bluetooth")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed of simulated devices (e.g. 10 for 10x real time)")
+    parser.add_argument("--rate", type=float, default=1.0, help="Notifications per second of synthetic simulated data")
+    parser.add_argument("--burst", type=int, default=1, help="Number of notifications simulated devices deliver at once")
+    parser.add_argument("--disconnect-every", type=float, help="Seconds between simulated disconnects")
+    parser.add_argument("--disconnect-for", type=float, default=5.0, help="Seconds a simulated device stays out of range")
+    parser.add_argument("--metrics", action="store_true", help="Time each stage of the notification pipeline and print a summary at the end")
+    parser.add_argument("--metrics-port", type=int, help="Serve the pipeline metrics for Prometheus on http://127.0.0.1:<port>/metrics (implies --metrics)")
+    parser.add_argument("--stream-port", type=int, help="Stream the live heart rate to browsers and other screens on http://<stream-host>:<port>/")
+    parser.add_argument("--stream-host", type=str, default="127.0.0.1", help="Address the stream server listens on (0.0.0.0 for the local network)")
+    return parser
+
+def load_device_profiles(args):
+    """
+    Collect (address, profile name, target HR) for every device to monitor.
+    """
+    devices = []
+
+    # Mapping file: {"00:11:22:33:FF:EE": "alex"} or {"00:11:22:33:FF:EE": {"name": "alex", "target": 150}}
+    if args.devices:
+        with open(args.devices, "r") as file:
+            mapping = json.load(file)
+        for address, entry in mapping.items():
+            if isinstance(entry, str):
+                entry = {"name": entry}
+            devices.append((address, entry.get("name"), entry.get("target", args.target)))
+
+    # Addresses from the command line
+    for address in args.device or []:
+        name = args.name if len(args.device) == 1 and not args.devices else None
+        devices.append((address, name, args.target))
+
+    if args.name and len(devices) > 1:
+        print("⚠️  --name is ignored when monitoring several devices, use --devices instead")
+
+    return devices
+
+def add_simulated_devices(args, device_profiles):
+    """
+    Register one simulated strap per address (or a default one) for --simulate.
+    """
+    import simulator
+
+    if not device_profiles:
+        device_profiles = [(simulator.DEFAULT_ADDRESS, args.name, args.target)]
+    for index, (address, name, target_hr) in enumerate(device_profiles):
+        simulator.add_device(simulator.SimulatedDevice(
+            address,
+            simulator.make_source(args.simulate, rate=args.rate, seed=index),
+            speed=args.speed,
+            burst=args.burst,
+            disconnect_every=args.disconnect_every,
+            disconnect_for=args.disconnect_for
+        ))
+    return device_profiles, simulator.SimulatedClient, simulator.SimulatedScanner
+
+def create_sessions(args, device_profiles):
+    # One session (data file, statistics, alerts) per device
+    sessions = []
+    for address, name, target_hr in device_profiles:
+        # Add the address to the file name when several straps share a profile name
+        tag = None
+        if len(device_profiles) > 1:
+            tag = f"{name or 'default'}-{address.replace(':', '')}"
+        sessions.append(WorkoutSession(
+            address,
+            name=name,
+            target_hr=target_hr,
+            tag=tag,
+            hrv_window=args.hrv_window,
+            flush_rows=args.flush_rows,
+            flush_interval=args.flush_interval,
+            journal=not args.no_journal,
+            fsync_interval=args.fsync_interval,
+            catalogue_path=None if args.no_catalogue else CATALOGUE_PATH,
+            file_format=args.format,
+            metrics=Metrics(address, enabled=args.metrics or args.metrics_port is not None)
+        ))
+
+        # Print the target device address
+        print(f"Target Device Address: {address}\n")
+    return sessions
+
+def print_status(sessions):
+    """Print the latest heart rate of every device, replacing the old output"""
+    if len(sessions) == 1:
+        line = sessions[0].status()
+    else:
+        line = " | ".join(f"{session.name}: {session.heart_rate} bpm" for session in sessions)
+    sys.stdout.write(f"\r{line}")
+    sys.stdout.flush()
+
+def install_stop_handlers(loop, stop):
+    """
+    Set stop when Enter is pressed or on SIGINT/SIGTERM, without polling.
+    Returns a function that removes the handlers again.
+    """
+    def request_stop(message=None):
+        if not stop.is_set():
+            if message:
+                print(message)
+            stop.set()
+
+    def on_stdin():
+        # End of input (e.g. no terminal) only stops watching stdin
+        if not sys.stdin.readline():
+            loop.remove_reader(sys.stdin)
             return
-        
-        def heart_rate_handler(sender, data):
-            """
-            Process and log heart rate data with detailed breakdown.
-            """
+        request_stop()
+
+    removers = []
+    try:
+        loop.add_reader(sys.stdin, on_stdin)
+        removers.append(lambda: loop.remove_reader(sys.stdin))
+    except (NotImplementedError, ValueError, OSError):
+        # Event loops without add_reader (e.g. Windows) or stdin that can't be watched: wait in a thread
+        def wait_for_enter():
             try:
-                # Flags interpretation
-                flags = data[0]
-                
-                # Heart rate calculation
-                if flags & 0x01:
-                    # 16-bit heart rate value
-                    heart_rate = int.from_bytes(data[1:3], byteorder='little')
-                else:
-                    # 8-bit heart rate value
-                    heart_rate = data[1]
-                
-                # Write the data to the CSV file
-                with open(csv_filename, mode='a', newline='') as file:
-                    csv_writer = csv.writer(file)
-                    csv_writer.writerow([datetime.now().strftime("%Y-%m-%d %H:%M:%S"), heart_rate])
-
-                # Print the heart rate, replacing the old output
-                sys.stdout.write(f"\r💓 Heart Rate: {heart_rate} bpm")
-                if target_hr:
-                    sys.stdout.write(f" (Target: {target_hr} bpm)")
-                sys.stdout.flush()
-
-                # Check if we need to play warning sound (if below target)
-                if target_hr and heart_rate < target_hr:
-                    current_time = time.time()
-                    if current_time - self.last_warning_time >= 5:  # 5 seconds interval
-                        play_warning_sound()
-                        self.last_warning_time = current_time
-
-                # If --graph is provided, update the plot
-                if args.graph:
-                    # Update the data
-                    x.append(len(x))
-                    y.append(heart_rate)
-
-                    # Calculate the summary
-                    summary = current_summary(start_time, y, name, age, weight, sex)
-
-                    # Add title to the plot
-                    ax.set_title(summary)
-                    
-                    # Update background color based on target HR
-                    if target_hr:
-                        if heart_rate < target_hr:
-                            ax.set_facecolor('#ffcccc')  # Pastel red
-                        else:
-                            ax.set_facecolor('#ccffcc')  # Pastel green
-                    
-                    # Update the plot
-                    line.set_xdata(x)
-                    line.set_ydata(y)
-                    ax.relim()
-                    ax.autoscale_view()  # Autoscale the view
-                    plt.draw()
-                    plt.pause(0.01)  # Pause to allow the plot to update
-                
-            
-            except Exception as e:
-                print(f"Error processing heart rate data: {e}")
-        
+                input()
+            except EOFError:
+                return
+            loop.call_soon_threadsafe(request_stop)
+        threading.Thread(target=wait_for_enter, daemon=True).start()
+
+    for signal_number in (signal.SIGINT, signal.SIGTERM):
         try:
-            print("\nStarting Heart Rate Monitoring...")
-            # Start monitoring heart rate time stamp
-            start_time = datetime.now()
+            loop.add_signal_handler(signal_number, request_stop, "\n⚠️  Stop signal received, stopping gracefully...")
+            removers.append(lambda signal_number=signal_number: loop.remove_signal_handler(signal_number))
+        except (NotImplementedError, RuntimeError):
+            # Windows: Ctrl+C still raises KeyboardInterrupt
+            pass
 
-            # If --graph is provided, display the live heart rate graph
-            if args.graph:
-                # Print using graph
-                print("Initializing live heart rate graph...")
+    def remove():
+        for remover in removers:
+            remover()
+    return remove
 
-                # Initialize the plot
-                plt.ion()  # Turn on interactive mode
-                fig, ax = plt.subplots()
-                x, y = [], []
-                line, = ax.plot(x, y, color='black')  # Changed to black for better visibility
-                ax.set_xlabel('Sample')
-                ax.set_ylabel('Heart Rate (bpm)')
-                
-                # Add target HR line if specified
-                if target_hr:
-                    ax.axhline(y=target_hr, color='red', linestyle='--', alpha=0.7)
-
-            await self.client.start_notify(
-                HEART_RATE_MEASUREMENT_CHARACTERISTIC_UUID, 
-                heart_rate_handler
-            )
-            
-            # Start input monitoring thread
-            input_thread = threading.Thread(target=monitor_input, daemon=True)
-            input_thread.start()
-            
-            # Keep monitoring until user stops or shutdown flag is set
-            while not shutdown_flag:
-                await asyncio.sleep(0.1)  # Reduced sleep time for more responsive shutdown
-                
-            print("\n✅ Stopping monitoring gracefully...")
-        
-        except Exception as e:
-            print(f"Monitoring Error: {e}")
-        finally:
-            await self.stop_monitoring()
-
-    async def stop_monitoring(self):
-        """
-        Stop heart rate monitoring and disconnect gracefully.
-        """
-        if self.client and self.is_connected:
-            try:
-                await self.client.stop_notify(HEART_RATE_MEASUREMENT_CHARACTERISTIC_UUID)
-                await self.client.disconnect()
-                self.is_connected = False
-                print("✅ Disconnected from heart rate monitor")
-            except Exception as e:
-                print(f"⚠️  Disconnection warning: {e}")
-        else:
-            print("✅ No active connection to disconnect")
-
-async def main():
+async def run(args, sessions, client_class=None, scanner_class=None):
     # Configure logging
     logging.basicConfig(level=logging.INFO)
-    
-    # Initialize Heart Rate Monitor
-    hrm = DetailedHeartRateMonitor()
-    
+
+    # Stop on Enter, Ctrl+C or SIGTERM without any polling
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    remove_stop_handlers = install_stop_handlers(loop, stop)
+
+    # Initialize one Heart Rate Monitor per device
+    monitors = [
+        DetailedHeartRateMonitor(
+            session,
+            stop,
+            connect_timeout=args.connect_timeout,
+            scan_timeout=args.scan_timeout,
+            max_backoff=args.max_backoff,
+            remember_device=not args.simulate,
+            on_sample=None if args.dashboard else lambda: print_status(sessions),
+            client_class=client_class,
+            scanner_class=scanner_class
+        )
+        for session in sessions
+    ]
+    render_task = None
+    dashboard = None
+    supervisors = []
+    metrics_server = None
+    stream_server = None
+
     try:
-        # Connect to device
-        connection_success = await hrm.scan_and_connect()
-        
-        if connection_success:
+        # Connect to all devices concurrently
+        connected = await connect_monitors(monitors, stop, args.scan_timeout, scanner_class)
+
+        if connected:
+            # If --graph is provided, display one live heart rate graph per device
+            if args.graph:
+                # matplotlib is only imported when there is a graph
+                from live_plot import LivePlot, run_plots
+
+                # Print using graph
+                print("Initializing live heart rate graph...")
+                for hrm in connected:
+                    session = hrm.session
+                    session.live_plot = LivePlot(
+                        session.target_hr,
+                        title_func=session.summary,
+                        window=args.window,
+                        overview=args.overview,
+                        window_title=f"{session.name} ({session.address})",
+                        metrics=session.metrics
+                    )
+                    # The graph only needs recent samples, so a slow graph skips the oldest
+                    hrm.bus.subscribe("plot", session.plot_sample, maxsize=256, policy=DROP_OLDEST)
+
+            # Or a dashboard in the terminal, which only needs a sparkline buffer per device
+            if args.dashboard:
+                from terminal_dashboard import TerminalDashboard, run_dashboard
+                dashboard = TerminalDashboard([hrm.session for hrm in connected], window=args.window)
+                for hrm in connected:
+                    hrm.bus.subscribe("dashboard", dashboard.sink(hrm.session), maxsize=256, policy=DROP_OLDEST)
+
+            # Serve the pipeline metrics on localhost
+            if args.metrics_port is not None:
+                metrics_server = start_metrics_server([hrm.session.metrics for hrm in connected], args.metrics_port)
+                print(f"📈 Metrics at http://127.0.0.1:{args.metrics_port}/metrics")
+
+            # Stream the samples to other screens; slow clients are dropped by the server
+            if args.stream_port is not None:
+                from stream_server import StreamServer
+                stream_server = await StreamServer(args.stream_host, args.stream_port).start()
+                for hrm in connected:
+                    hrm.bus.subscribe("stream", stream_server.sink(hrm.session), maxsize=256, policy=BLOCK)
+                print(f"📡 Live heart rate at http://{args.stream_host}:{args.stream_port}/ (with the samples so far: /replay)")
+
             # Start monitoring
-            await hrm.monitor_heart_rate()
-    
-    except KeyboardInterrupt:
-        print("\n⚠️  Keyboard interrupt received, stopping gracefully...")
-        global shutdown_flag
-        shutdown_flag = True
-    
+            await asyncio.gather(*(hrm.monitor_heart_rate() for hrm in connected))
+
+            # Reconnect automatically if a device drops out
+            supervisors = [asyncio.create_task(hrm.supervise()) for hrm in connected]
+
+            # Redraw all graphs from one task at a fixed frame rate, separately from the notifications
+            if args.graph:
+                plots = [hrm.session.live_plot for hrm in connected]
+                render_task = asyncio.create_task(run_plots(plots, args.fps))
+            elif dashboard:
+                render_task = asyncio.create_task(run_dashboard(dashboard, args.fps))
+
+            # Sleep until the user or a signal stops the monitor
+            print("Press Enter to stop monitoring and save data...")
+            await stop.wait()
+
+            # Back to the normal terminal for the summaries
+            if dashboard:
+                dashboard.close()
+            print("\n✅ Stopping monitoring gracefully...")
+
+            # Print the final summaries
+            for hrm in connected:
+                if len(connected) > 1:
+                    print(f"\n=== {hrm.session.name} ({hrm.target_address}) ===")
+                hrm.session.print_summary()
+                if hrm.session.metrics.enabled:
+                    print(f"\n=== Pipeline metrics ({hrm.target_address}) ===")
+                    print(hrm.session.metrics.summary())
+
     except Exception as e:
         print(f"\n❌ Unexpected error: {e}")
-    
+
     finally:
-        await hrm.stop_monitoring()
+        # Ordered shutdown: no more reconnecting or redrawing, then stop every
+        # device (notifications, recording, metadata, connection) exactly once
+        stop.set()
+        remove_stop_handlers()
+        if render_task:
+            render_task.cancel()
+        if dashboard:
+            dashboard.close()
+        if metrics_server:
+            metrics_server.shutdown()
+        for task in supervisors:
+            task.cancel()
+        await asyncio.gather(*(hrm.stop_monitoring() for hrm in monitors))
+        if stream_server:
+            await stream_server.close()
         print("💾 Data saved successfully. Program terminated.")
 
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    # If there is not data folder, create it
+    os.makedirs("data", exist_ok=True)
+
+    # Point out sessions that were interrupted (power cut, kill -9)
+    interrupted = glob.glob("data/*.journal")
+    if interrupted:
+        print(f"⚠️  {len(interrupted)} interrupted recording(s) found, repair them with: python3 recover_recording.py")
+
+    device_profiles = load_device_profiles(args)
+    client_class = scanner_class = None
+    if args.simulate:
+        # Stand-ins for the bleak client and scanner
+        device_profiles, client_class, scanner_class = add_simulated_devices(args, device_profiles)
+    if not device_profiles:
+        # Without a target, list the heart rate monitors in range
+        print("No target device given. Use -d <address> or --devices <file>.")
+        asyncio.run(list_heart_rate_devices(args.scan_timeout, scanner_class))
+        return
+
+    # Print the header
+    print("\n=== Starting heart rate monitor ===")
+    sessions = create_sessions(args, device_profiles)
+
+    try:
+        asyncio.run(run(args, sessions, client_class, scanner_class))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Make sure buffered samples reach the disk even if run() was interrupted (closing twice does nothing)
+        for session in sessions:
+            session.close()
+        alerts.shutdown()
+
 if __name__ == "__main__":
     if platform.system() == "Linux" and sys.platform != "darwin":
         import warnings
         warnings.filterwarnings("ignore", category=RuntimeWarning)
-    
-    asyncio.run(main())
\ No newline at end of file
+
+    main()
@@ -0,0 +1,87 @@
+from collections import deque
+import math
+
+
+class RollingHrv:
+    """
+    Heart rate variability over the last `window` RR intervals, updated in
+    constant time per interval.
+    """
+    def __init__(self, window=120):
+        self.window = window
+        self.rr = deque()
+        self.diffs = deque()
+
+        # Running sums over the intervals and successive differences in the window
+        self._sum = 0.0
+        self._sum_sq = 0.0
+        self._sum_diff_sq = 0.0
+        self._nn50 = 0
+
+    def update(self, rr_ms):
+        """
+        Add one RR interval in milliseconds.
+        """
+        if self.rr:
+            diff = rr_ms - self.rr[-1]
+            self.diffs.append(diff)
+            self._sum_diff_sq += diff * diff
+            if abs(diff) > 50:
+                self._nn50 += 1
+
+        self.rr.append(rr_ms)
+        self._sum += rr_ms
+        self._sum_sq += rr_ms * rr_ms
+
+        # Drop the oldest interval (and the difference that starts with it)
+        if len(self.rr) > self.window:
+            old = self.rr.popleft()
+            self._sum -= old
+            self._sum_sq -= old * old
+            old_diff = self.diffs.popleft()
+            self._sum_diff_sq -= old_diff * old_diff
+            if abs(old_diff) > 50:
+                self._nn50 -= 1
+
+    def reset(self):
+        """
+        Forget the window, e.g. after a gap where beats were missed.
+        """
+        self.__init__(self.window)
+
+    @property
+    def rmssd(self):
+        if not self.diffs:
+            return None
+        return math.sqrt(max(self._sum_diff_sq, 0) / len(self.diffs))
+
+    @property
+    def sdnn(self):
+        n = len(self.rr)
+        if n < 2:
+            return None
+        variance = (self._sum_sq - self._sum * self._sum / n) / (n - 1)
+        return math.sqrt(max(variance, 0))
+
+    @property
+    def pnn50(self):
+        if not self.diffs:
+            return None
+        return 100 * self._nn50 / len(self.diffs)
+
+
+def hrv_metrics(rr_ms):
+    """
+    RMSSD, SDNN (ms) and pNN50 (%) of a whole recording of RR intervals.
+    """
+    # NumPy is only needed for offline analysis
+    import numpy as np
+
+    rr_ms = np.asarray(rr_ms, dtype=float)
+    if rr_ms.size < 2:
+        return None, None, None
+    diffs = np.diff(rr_ms)
+    rmssd = np.sqrt(np.mean(diffs ** 2))
+    sdnn = np.std(rr_ms, ddof=1)
+    pnn50 = 100 * np.count_nonzero(np.abs(diffs) > 50) / diffs.size
+    return round(float(rmssd), 1), round(float(sdnn), 1), round(float(pnn50), 1)
@@ -0,0 +1,334 @@
+"""
+Write-ahead journal of a recording (<data file>.journal)
+
+Every sample is also appended to the journal as a checksummed record, before
+the data file is written. The journal is fsynced at most every fsync_interval
+seconds, so at most that much is lost on a power cut without paying an fsync
+per heartbeat. A clean stop syncs the data file and removes the journal; a
+journal that is still there means the session was interrupted (unless the
+process that writes it is still running) and recover() can rebuild the data
+file from it.
+
+File layout (little endian):
+    header  24 bytes: magic b"HRJ1", version (uint16), data format (uint16,
+                      0 = .csv, 1 = .hrb), wall clock time of the start in ns
+                      since the epoch (int64), process id of the recorder
+                      (int64, 0 in older journals)
+    records payload length (uint16), CRC-32 of the payload (uint32), payload:
+                      offset from the start in ns (uint64), heart rate (uint16),
+                      flags (uint8, see binary_format.py), number of RR
+                      intervals (uint8), RR intervals in 1/1024 s (uint16 each)
+"""
+import csv
+import json
+import os
+import struct
+import time
+import zlib
+from datetime import datetime
+from binary_format import pack_header, pack_record, read_header, split_rr, RECORD, HEADER, FLAG_GAP, FLAG_CONTINUATION, CSV_HEADER
+from measurement import rr_to_ms
+
+MAGIC = b"HRJ1"
+VERSION = 1
+FORMATS = {"csv": 0, "binary": 1}
+
+JOURNAL_HEADER = struct.Struct("<4sHHqq")
+RECORD_PREFIX = struct.Struct("<HI")
+SAMPLE = struct.Struct("<QHBB")
+
+
+def journal_path(data_path):
+    return data_path + ".journal"
+
+
+class Journal:
+    """
+    Journal of one recording. append() only packs into memory; the recorder's
+    writer thread calls write() with the packed records.
+    """
+    def __init__(self, data_path, file_format, start_wall_ns, fsync_interval=5.0):
+        self.path = journal_path(data_path)
+        self.fsync_interval = fsync_interval
+        self._buffer = bytearray()
+        self._unsynced = False
+        self._last_sync = time.monotonic()
+        self._file = open(self.path, "wb")
+        # The process id tells recovery that the recording is still running
+        self._file.write(JOURNAL_HEADER.pack(MAGIC, VERSION, FORMATS[file_format], start_wall_ns, os.getpid()))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def append(self, offset_ns, heart_rate, flags, rr_intervals):
+        payload = SAMPLE.pack(offset_ns, heart_rate, flags, len(rr_intervals))
+        if rr_intervals:
+            payload += struct.pack(f"<{len(rr_intervals)}H", *rr_intervals)
+        self._buffer += RECORD_PREFIX.pack(len(payload), zlib.crc32(payload))
+        self._buffer += payload
+
+    def take(self):
+        data, self._buffer = self._buffer, bytearray()
+        return data
+
+    def write(self, data):
+        """
+        Write records and fsync if the last fsync was fsync_interval seconds ago.
+        """
+        if data:
+            self._file.write(data)
+            self._file.flush()
+            self._unsynced = True
+        if self._unsynced and time.monotonic() - self._last_sync >= self.fsync_interval:
+            self.sync()
+
+    def sync(self):
+        if not self._unsynced:
+            return
+        os.fsync(self._file.fileno())
+        self._unsynced = False
+        self._last_sync = time.monotonic()
+
+    def close(self, remove=True):
+        """
+        Close the journal; remove it once the data file is safely on disk.
+        """
+        if self._file.closed:
+            return
+        self._file.close()
+        if remove:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                # Recovered (or deleted) while the recording was running
+                pass
+
+
+def read_journal(path):
+    """
+    Data format, start time (ns since the epoch) and the intact records of a
+    journal as (offset_ns, heart_rate, flags, rr_intervals). Reading stops at
+    the first torn or corrupt record.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < JOURNAL_HEADER.size:
+        raise ValueError(f"'{path}' is not a heart rate journal")
+    magic, version, data_format, start_ns, _ = JOURNAL_HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"'{path}' is not a heart rate journal")
+    file_format = {value: name for name, value in FORMATS.items()}[data_format]
+
+    records = []
+    position = JOURNAL_HEADER.size
+    while position + RECORD_PREFIX.size <= len(data):
+        length, checksum = RECORD_PREFIX.unpack_from(data, position)
+        payload = data[position + RECORD_PREFIX.size:position + RECORD_PREFIX.size + length]
+        if len(payload) < length or length < SAMPLE.size or zlib.crc32(payload) != checksum:
+            break
+        offset_ns, heart_rate, flags, rr_count = SAMPLE.unpack_from(payload)
+        rr_intervals = struct.unpack_from(f"<{rr_count}H", payload, SAMPLE.size)
+        records.append((offset_ns, heart_rate, flags, rr_intervals))
+        position += RECORD_PREFIX.size + length
+    return file_format, start_ns, records
+
+
+def write_atomic(path, write):
+    """
+    Replace path with what write(file) writes, so readers (and a crash) only
+    ever see the old or the new file.
+    """
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", newline="") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+
+
+def write_json_atomic(path, data):
+    write_atomic(path, lambda f: json.dump(data, f))
+
+
+def _rebuild_csv(data_path, start_ns, records):
+    def write(f):
+        writer = csv.writer(f)
+        writer.writerow(CSV_HEADER)
+        for offset_ns, heart_rate, flags, rr_intervals in records:
+            timestamp = datetime.fromtimestamp((start_ns + offset_ns) / 1e9).strftime("%Y-%m-%d %H:%M:%S")
+            if flags & FLAG_GAP:
+                writer.writerow([timestamp, "", ""])
+            else:
+                writer.writerow([timestamp, heart_rate, " ".join(str(round(rr_to_ms(rr))) for rr in rr_intervals)])
+    write_atomic(data_path, write)
+
+
+def _rebuild_binary(data_path, start_ns, records):
+    temp_path = data_path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(pack_header(start_ns))
+        for offset_ns, heart_rate, flags, rr_intervals in records:
+            # Same splitting into continuation records as the recorder
+            for record_flags, chunk in split_rr(flags, rr_intervals):
+                f.write(pack_record(offset_ns, heart_rate, record_flags, chunk))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, data_path)
+
+
+def _repair_csv(data_path):
+    # Cut off a row that was only partly written; returns the samples and the time of the last row
+    with open(data_path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            f.truncate(end)
+    rows = data[:end].decode().splitlines()[1:]
+    samples = sum(1 for row in rows if row.split(",")[1:2] not in ([""], []))
+    last = datetime.strptime(rows[-1].split(",")[0], "%Y-%m-%d %H:%M:%S") if rows else None
+    return samples, last
+
+
+def _repair_binary(data_path):
+    # Cut off a record that was only partly written
+    start_ns = read_header(data_path)
+    size = os.path.getsize(data_path)
+    records = (size - HEADER.size) // RECORD.size
+    end = HEADER.size + records * RECORD.size
+    samples = 0
+    last_offset = 0
+    with open(data_path, "rb+") as f:
+        if end < size:
+            f.truncate(end)
+        f.seek(HEADER.size)
+        for _ in range(records):
+            offset_ns, heart_rate, flags = RECORD.unpack(f.read(RECORD.size))[:3]
+            last_offset = offset_ns
+            if not flags & (FLAG_GAP | FLAG_CONTINUATION):
+                samples += 1
+    last = datetime.fromtimestamp((start_ns + last_offset) / 1e9) if records else None
+    return samples, last
+
+
+def metadata_path(data_path):
+    return os.path.splitext(data_path)[0] + "_meta.json"
+
+
+def process_alive(pid):
+    """
+    True if a process with this id is running.
+    """
+    if pid <= 0:
+        return False
+    if os.name == "nt":
+        import ctypes
+
+        # PROCESS_QUERY_LIMITED_INFORMATION; STILL_ACTIVE is the exit code of a running process
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)
+        if not handle:
+            return False
+        exit_code = ctypes.c_ulong()
+        kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code))
+        kernel32.CloseHandle(handle)
+        return exit_code.value == 259
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Running, but as another user
+        return True
+    return True
+
+
+def recorder_pid(data_path):
+    """
+    Process id of the recorder of data_path, from the journal header or the
+    metadata (0 if unknown).
+    """
+    try:
+        with open(journal_path(data_path), "rb") as f:
+            header = f.read(JOURNAL_HEADER.size)
+        if len(header) == JOURNAL_HEADER.size:
+            return JOURNAL_HEADER.unpack(header)[4]
+    except OSError:
+        pass
+    try:
+        with open(metadata_path(data_path), "r") as f:
+            return int(json.load(f).get("pid", 0))
+    except (OSError, ValueError, TypeError):
+        return 0
+
+
+def in_progress(data_path):
+    """
+    True if data_path is still being recorded.
+    """
+    return process_alive(recorder_pid(data_path))
+
+
+def needs_recovery(data_path):
+    """
+    True if the session was interrupted: its journal is still there, or its
+    metadata says it was never finalised, and the process that recorded it
+    is gone. Recordings from before there were journals have no "finalised"
+    key and are left alone.
+    """
+    if in_progress(data_path):
+        return False
+    if os.path.exists(journal_path(data_path)):
+        return True
+    meta_path = metadata_path(data_path)
+    if not os.path.exists(meta_path):
+        return False
+    try:
+        with open(meta_path, "r") as f:
+            return json.load(f).get("finalised") is False
+    except ValueError:
+        return False
+
+
+def recover(data_path):
+    """
+    Repair an interrupted recording: rebuild the data file from its journal
+    (or cut off a partly written row if there is none) and finalise the
+    metadata. Returns the number of samples in the repaired recording.
+    """
+    # Rebuilding a file that is still written to would lose everything after
+    if in_progress(data_path):
+        raise ValueError("it is still being recorded")
+    path = journal_path(data_path)
+    if os.path.exists(path):
+        file_format, start_ns, records = read_journal(path)
+        if file_format == "binary":
+            _rebuild_binary(data_path, start_ns, records)
+        else:
+            _rebuild_csv(data_path, start_ns, records)
+        samples = sum(1 for record in records if not record[2] & FLAG_GAP)
+        gaps = [record[0] for record in records if record[2] & FLAG_GAP]
+        last = datetime.fromtimestamp((start_ns + records[-1][0]) / 1e9) if records else None
+    else:
+        samples, last = _repair_binary(data_path) if data_path.endswith(".hrb") else _repair_csv(data_path)
+        gaps = None
+
+    # Finalise the metadata like a clean stop does
+    meta_path = metadata_path(data_path)
+    if os.path.exists(meta_path):
+        try:
+            with open(meta_path, "r") as f:
+                meta_data = json.load(f)
+        except ValueError:
+            meta_data = None
+        if meta_data is not None:
+            if last:
+                meta_data["end_time"] = last.strftime("%Y-%m-%d %H:%M:%S")
+            meta_data["samples"] = samples
+            meta_data["finalised"] = True
+            if gaps is not None:
+                meta_data["gaps"] = [datetime.fromtimestamp((start_ns + offset_ns) / 1e9).strftime("%Y-%m-%d %H:%M:%S") for offset_ns in gaps]
+            meta_data["recovered"] = True
+            write_json_atomic(meta_path, meta_data)
+
+    if os.path.exists(path):
+        os.remove(path)
+    return samples
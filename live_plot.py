@@ -0,0 +1,172 @@
+import asyncio
+import numpy as np
+import matplotlib.pyplot as plt
+from buffers import RingBuffer, DownsampledHistory
+
+
+class LivePlot:
+    """
+    Live heart rate graph redrawn at a fixed frame rate, independent of the BLE callback.
+
+    Only the last `window` minutes are kept for display, so memory and redraw cost
+    stay flat however long the session runs. The buffers start sized for
+    max_rate notifications per second and grow if the strap notifies faster.
+    """
+    def __init__(self, target_hr=None, title_func=None, window=5, overview=False, max_rate=2, window_title=None, metrics=None):
+        self.target_hr = target_hr
+        self.metrics = metrics
+        self.title_func = title_func
+        self.window = window
+
+        # Recent samples (seconds since start, bpm), at first sized for max_rate notifications per second
+        capacity = max(1, int(window * 60 * max_rate))
+        self.times = RingBuffer(capacity)
+        self.heart_rates = RingBuffer(capacity)
+        self.history = DownsampledHistory() if overview else None
+        self.dirty = False
+        self.new_min = None
+        self.new_max = None
+        self.background = None
+        self.facecolor = None
+
+        # Initialize the plot
+        plt.ion()  # Turn on interactive mode
+        if overview:
+            self.fig, (self.ax, self.overview_ax) = plt.subplots(2, 1, height_ratios=[3, 1])
+        else:
+            self.fig, self.ax = plt.subplots()
+            self.overview_ax = None
+        if window_title:
+            self.fig.canvas.manager.set_window_title(window_title)
+        self.line, = self.ax.plot([], [], color='black', animated=True)  # Changed to black for better visibility
+        self.ax.set_xlabel('Time (min)')
+        self.ax.set_ylabel('Heart Rate (bpm)')
+        self.ax.set_xlim(-window, 0)
+        self.ax.set_ylim(40, 200)
+        self.ax.title.set_animated(True)
+
+        # Add target HR line if specified
+        if target_hr:
+            self.ax.axhline(y=target_hr, color='red', linestyle='--', alpha=0.7)
+
+        # Whole session at reduced resolution
+        if overview:
+            self.overview_line, = self.overview_ax.plot([], [], color='grey', animated=True)
+            self.overview_ax.set_xlabel('Elapsed (min)')
+            self.overview_ax.set_xlim(0, window)
+            self.overview_ax.set_ylim(40, 200)
+
+        # Re-capture the static background whenever the full figure is drawn
+        self.fig.canvas.mpl_connect('draw_event', self._on_draw)
+        plt.show(block=False)
+        plt.pause(0.01)
+
+    def add_sample(self, heart_rate, timestamp):
+        """
+        Buffer a sample; this is all the BLE callback has to do. timestamp is in
+        seconds since the start of the session.
+        """
+        # Full before covering the window: the strap notifies faster than expected
+        if len(self.times) == self.times.capacity and timestamp - self.times.values()[0] < self.window * 60:
+            self.times.resize(2 * self.times.capacity)
+            self.heart_rates.resize(2 * self.heart_rates.capacity)
+        self.times.append(timestamp)
+        self.heart_rates.append(heart_rate)
+        if self.history is not None:
+            self.history.append(timestamp, heart_rate)
+
+        # Remember the range of samples since the last frame
+        if self.new_min is None or heart_rate < self.new_min:
+            self.new_min = heart_rate
+        if self.new_max is None or heart_rate > self.new_max:
+            self.new_max = heart_rate
+        self.dirty = True
+
+    def render(self):
+        """
+        Redraw the line and title from the buffered data.
+        """
+        canvas = self.fig.canvas
+        start = self.metrics.clock() if self.metrics else 0
+
+        if self.dirty:
+            self.dirty = False
+
+            # Plot the window relative to the newest sample so the x axis never moves
+            times = self.times.values()
+            first = np.searchsorted(times, times[-1] - self.window * 60)
+            self.line.set_data((times[first:] - times[-1]) / 60, self.heart_rates.values()[first:])
+            if self.history is not None:
+                history_times, history_values = self.history.values()
+                self.overview_line.set_data(history_times / 60, history_values)
+            if self.title_func:
+                self.ax.set_title(self.title_func())
+
+            # Static parts only change when the limits or the background colour change
+            full_redraw = self._update_limits(times[-1] / 60) | self._update_facecolor()
+            if full_redraw or self.background is None or not canvas.supports_blit:
+                canvas.draw()
+            else:
+                canvas.restore_region(self.background)
+                self._draw_animated()
+                canvas.blit(self.fig.bbox)
+
+        # Keep the window responsive
+        canvas.flush_events()
+        if self.metrics:
+            self.metrics.lap("render", start)
+
+    def _on_draw(self, event):
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_animated()
+
+    def _draw_animated(self):
+        self.ax.draw_artist(self.line)
+        self.ax.draw_artist(self.ax.title)
+        if self.overview_ax is not None:
+            self.overview_ax.draw_artist(self.overview_line)
+
+    def _update_limits(self, elapsed):
+        # Only widen the y range, with some headroom, so a full redraw is rare
+        changed = False
+        axes = [self.ax] if self.overview_ax is None else [self.ax, self.overview_ax]
+        for ax in axes:
+            y_min, y_max = ax.get_ylim()
+            if self.new_max >= y_max or self.new_min <= y_min:
+                ax.set_ylim(min(y_min, self.new_min - 10), max(y_max, self.new_max + 10))
+                changed = True
+        self.new_min = None
+        self.new_max = None
+
+        # Grow the overview x axis by doubling
+        if self.overview_ax is not None:
+            x_min, x_max = self.overview_ax.get_xlim()
+            if elapsed >= x_max:
+                self.overview_ax.set_xlim(x_min, max(x_max * 2, elapsed))
+                changed = True
+        return changed
+
+    def _update_facecolor(self):
+        # Update background color based on target HR
+        if not self.target_hr:
+            return False
+        if self.heart_rates.values()[-1] < self.target_hr:
+            facecolor = '#ffcccc'  # Pastel red
+        else:
+            facecolor = '#ccffcc'  # Pastel green
+        if facecolor == self.facecolor:
+            return False
+        self.facecolor = facecolor
+        self.ax.set_facecolor(facecolor)
+        return True
+
+
+async def run_plots(plots, fps=5):
+    """
+    Redraw all live graphs at most fps times per second until cancelled.
+    """
+    interval = 1 / fps
+    while True:
+        for plot in plots:
+            plot.render()
+        await asyncio.sleep(interval)
@@ -0,0 +1,106 @@
+import struct
+import sys
+from array import array
+
+# Flag bits of the Heart Rate Measurement characteristic (0x2A37)
+HR_VALUE_UINT16 = 0x01
+SENSOR_CONTACT_DETECTED = 0x02
+SENSOR_CONTACT_SUPPORTED = 0x04
+ENERGY_EXPENDED_PRESENT = 0x08
+RR_INTERVALS_PRESENT = 0x10
+
+# Precompiled decoders for the fixed-width fields
+_UINT8 = struct.Struct("<B")
+_UINT16 = struct.Struct("<H")
+
+_LITTLE_ENDIAN_HOST = sys.byteorder == "little"
+
+# Heart rates outside this range are dropouts or sensor errors (many straps send 0 without skin contact)
+MIN_HR = 30
+MAX_HR = 240
+
+
+def parse_heart_rate_measurement(data):
+    """
+    Decode a Heart Rate Measurement notification.
+
+    Returns (heart_rate, sensor_contact, energy_expended, rr_intervals) where
+    sensor_contact is None if the sensor doesn't report it, energy_expended is
+    in kJ (or None) and rr_intervals holds the raw values in 1/1024 s.
+    """
+    flags = data[0]
+    offset = 1
+
+    # Heart rate is either 8 or 16 bit
+    if flags & HR_VALUE_UINT16:
+        heart_rate, = _UINT16.unpack_from(data, offset)
+        offset += 2
+    else:
+        heart_rate, = _UINT8.unpack_from(data, offset)
+        offset += 1
+
+    # Sensor contact status
+    if flags & SENSOR_CONTACT_SUPPORTED:
+        sensor_contact = bool(flags & SENSOR_CONTACT_DETECTED)
+    else:
+        sensor_contact = None
+
+    # Energy expended since the last reset
+    if flags & ENERGY_EXPENDED_PRESENT:
+        energy_expended, = _UINT16.unpack_from(data, offset)
+        offset += 2
+    else:
+        energy_expended = None
+
+    # The rest of the packet is a variable number of uint16 RR intervals
+    if flags & RR_INTERVALS_PRESENT:
+        end = offset + (len(data) - offset) // 2 * 2
+        if _LITTLE_ENDIAN_HOST:
+            # View straight into the packet without copying
+            rr_intervals = memoryview(data)[offset:end].cast("H")
+        else:
+            rr_intervals = array("H", bytes(data[offset:end]))
+            rr_intervals.byteswap()
+    else:
+        rr_intervals = ()
+
+    return heart_rate, sensor_contact, energy_expended, rr_intervals
+
+
+def rr_to_ms(rr):
+    """
+    Convert a raw RR interval (1/1024 s) to milliseconds.
+    """
+    return rr * 1000 / 1024
+
+
+def encode_heart_rate_measurement(heart_rate, rr_intervals=(), sensor_contact=None, energy_expended=None):
+    """
+    Build a Heart Rate Measurement notification (the inverse of
+    parse_heart_rate_measurement); rr_intervals are raw values in 1/1024 s.
+    """
+    flags = 0
+    packet = bytearray(1)
+
+    if heart_rate > 0xFF:
+        flags |= HR_VALUE_UINT16
+        packet += _UINT16.pack(heart_rate)
+    else:
+        packet += _UINT8.pack(heart_rate)
+
+    if sensor_contact is not None:
+        flags |= SENSOR_CONTACT_SUPPORTED
+        if sensor_contact:
+            flags |= SENSOR_CONTACT_DETECTED
+
+    if energy_expended is not None:
+        flags |= ENERGY_EXPENDED_PRESENT
+        packet += _UINT16.pack(energy_expended)
+
+    if rr_intervals:
+        flags |= RR_INTERVALS_PRESENT
+        for rr in rr_intervals:
+            packet += _UINT16.pack(rr)
+
+    packet[0] = flags
+    return packet
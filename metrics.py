@@ -0,0 +1,217 @@
+"""
+Hot path timers and counters
+
+Each device has a Metrics object. The notification handler times its stages
+with arrival()/lap() on a monotonic clock into fixed-bucket histograms; when
+disabled these calls return straight away. The numbers can be served to
+Prometheus from localhost and are summarised at shutdown.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+# Upper bounds (s) of the histogram buckets
+LATENCY_BUCKETS = [
+    0.000001, 0.0000025, 0.000005, 0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+]
+INTER_ARRIVAL_BUCKETS = [0.01, 0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0, 30.0, 60.0]
+
+COUNTERS = {
+    "notifications": "Notifications received",
+    "errors": "Notifications that could not be processed",
+    "dropped": "Notifications received after the recording was closed",
+    "gaps": "Connection gaps",
+    "sink_blocked": "Samples held back until a sink had room in its queue",
+    "sink_dropped": "Samples a sink skipped because its queue was full",
+    "sink_coalesced": "Samples replaced by a newer one before a sink got to them",
+    "sink_overflowed": "Samples a blocking sink lost because too many were held back for it",
+}
+
+
+class Histogram:
+    """
+    Counts of observations per bucket, plus their sum and maximum.
+    """
+    def __init__(self, bounds):
+        self.bounds = bounds
+        # The last bucket is +Inf
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, fraction):
+        """
+        Upper bound of the bucket that contains the given quantile (never more
+        than the largest observation).
+        """
+        if self.count == 0:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+
+class Metrics:
+    """
+    Timers and counters of one device's notification pipeline.
+    """
+    def __init__(self, device="", enabled=True):
+        self.device = device
+        self.enabled = enabled
+        self.counters = {name: 0 for name in COUNTERS}
+        self.stages = {}
+        self.inter_arrival = Histogram(INTER_ARRIVAL_BUCKETS)
+        self._last_arrival = None
+
+    def arrival(self):
+        """
+        Count a notification and return its arrival time (ns) to time the first stage from.
+        """
+        if not self.enabled:
+            return 0
+        now = time.perf_counter_ns()
+        self.counters["notifications"] += 1
+        if self._last_arrival is not None:
+            self.inter_arrival.observe((now - self._last_arrival) / 1e9)
+        self._last_arrival = now
+        return now
+
+    def lap(self, stage, start):
+        """
+        Record the time since start (ns) for stage and return the current time for the next stage.
+        """
+        if not self.enabled:
+            return 0
+        now = time.perf_counter_ns()
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            histogram = self.stages[stage] = Histogram(LATENCY_BUCKETS)
+        histogram.observe((now - start) / 1e9)
+        return now
+
+    def clock(self):
+        # Start time for lap() outside the notification handler
+        return time.perf_counter_ns() if self.enabled else 0
+
+    def count(self, counter, amount=1):
+        if self.enabled:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def mark_gap(self):
+        """
+        Count a connection gap and don't count it as a notification interval.
+        """
+        self.count("gaps")
+        self._last_arrival = None
+
+    def summary(self):
+        """
+        Counters and stage timings as printable lines.
+        """
+        lines = [", ".join(f"{name}: {value}" for name, value in self.counters.items())]
+        if self.inter_arrival.count:
+            lines.append(
+                f"{'inter-arrival':<14} mean {_format(self.inter_arrival.mean)}  "
+                f"p50 ≤ {_format(self.inter_arrival.quantile(0.5))}  "
+                f"p99 ≤ {_format(self.inter_arrival.quantile(0.99))}  max {_format(self.inter_arrival.max)}"
+            )
+        for stage, histogram in self.stages.items():
+            lines.append(
+                f"{stage:<14} mean {_format(histogram.mean)}  p50 ≤ {_format(histogram.quantile(0.5))}  "
+                f"p99 ≤ {_format(histogram.quantile(0.99))}  max {_format(histogram.max)}  ({histogram.count}x)"
+            )
+        return "\n".join(lines)
+
+
+def _format(seconds):
+    # Human readable duration
+    if seconds is None:
+        return "-"
+    if seconds < 0.001:
+        return f"{seconds * 1e6:.1f} µs"
+    if seconds < 1:
+        return f"{seconds * 1e3:.1f} ms"
+    return f"{seconds:.2f} s"
+
+
+def _histogram_lines(name, labels, histogram):
+    cumulative = 0
+    for bound, count in zip(histogram.bounds + [float("inf")], histogram.counts):
+        cumulative += count
+        le = "+Inf" if bound == float("inf") else repr(bound)
+        yield f'{name}_bucket{{{labels},le="{le}"}} {cumulative}'
+    yield f"{name}_sum{{{labels}}} {histogram.sum}"
+    yield f"{name}_count{{{labels}}} {histogram.count}"
+
+
+def render_prometheus(all_metrics):
+    """
+    Metrics of all devices in the Prometheus text format.
+    """
+    lines = []
+    for name, help_text in COUNTERS.items():
+        lines.append(f"# HELP heartrate_{name}_total {help_text}")
+        lines.append(f"# TYPE heartrate_{name}_total counter")
+        for metrics in all_metrics:
+            lines.append(f'heartrate_{name}_total{{device="{metrics.device}"}} {metrics.counters.get(name, 0)}')
+
+    lines.append("# HELP heartrate_inter_arrival_seconds Time between notifications")
+    lines.append("# TYPE heartrate_inter_arrival_seconds histogram")
+    for metrics in all_metrics:
+        lines.extend(_histogram_lines("heartrate_inter_arrival_seconds", f'device="{metrics.device}"', metrics.inter_arrival))
+
+    lines.append("# HELP heartrate_stage_seconds Time spent in each stage of the notification pipeline")
+    lines.append("# TYPE heartrate_stage_seconds histogram")
+    for metrics in all_metrics:
+        # Copy, the handler may add a stage meanwhile
+        for stage, histogram in list(metrics.stages.items()):
+            lines.extend(_histogram_lines("heartrate_stage_seconds", f'device="{metrics.device}",stage="{stage}"', histogram))
+
+    return "\n".join(lines) + "\n"
+
+
+def start_metrics_server(all_metrics, port=9100, host="127.0.0.1"):
+    """
+    Serve the metrics at http://host:port/metrics from a background thread.
+    Returns the server; call shutdown() to stop it.
+    """
+    # Only needed with --metrics-port
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = render_prometheus(all_metrics).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Keep the console for the heart rate
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,254 @@
+import asyncio
+from measurement import parse_heart_rate_measurement
+from bus import SampleBus, make_sample, COALESCE_LATEST
+from connection import find_devices, load_known_devices, save_known_device
+
+# Heart Rate Measurement characteristic
+HEART_RATE_MEASUREMENT_CHARACTERISTIC_UUID = "00002a37-0000-1000-8000-00805f9b34fb"
+
+
+async def until_stopped(awaitable, stop):
+    """
+    Await awaitable, but give up (and return None) as soon as stop is set.
+    """
+    task = asyncio.ensure_future(awaitable)
+    stopped = asyncio.create_task(stop.wait())
+    await asyncio.wait({task, stopped}, return_when=asyncio.FIRST_COMPLETED)
+    stopped.cancel()
+    if task.done():
+        return task.result()
+    task.cancel()
+    return None
+
+
+class DetailedHeartRateMonitor:
+    """
+    Connection to one heart rate strap feeding a WorkoutSession: connect,
+    notifications, reconnection with backoff and an ordered stop.
+
+    Notifications are decoded and published on self.bus, which the session's
+    recording, statistics and alerts are subscribed to; more sinks can be
+    added with self.bus.subscribe(). stopping is an asyncio.Event that is set
+    when the monitor is shutting down; on_sample is subscribed as a sink that
+    only sees the latest sample (e.g. to print the status). client_class and
+    scanner_class default to bleak's. drain_timeout limits how long a lost
+    connection waits for the sinks before the gap is recorded.
+    """
+    def __init__(self, session, stopping=None, connect_timeout=30.0, scan_timeout=10.0, max_backoff=30.0,
+                 remember_device=True, on_sample=None, client_class=None, scanner_class=None, drain_timeout=5.0):
+        self.session = session
+        self.stopping = stopping or asyncio.Event()
+        self.connect_timeout = connect_timeout
+        self.scan_timeout = scan_timeout
+        self.max_backoff = max_backoff
+        self.remember_device = remember_device
+        self.on_sample = on_sample
+        self.client_class = client_class
+        self.scanner_class = scanner_class
+        self.drain_timeout = drain_timeout
+        self.stopped = False
+        self.target_address = session.address
+        self.client = None
+        self.is_connected = False
+        self.disconnected = asyncio.Event()
+
+        # Sample bus between the BLE callback and everything that uses the samples
+        self.bus = SampleBus(session.metrics)
+        session.subscribe(self.bus)
+        if on_sample:
+            self.bus.subscribe("console", lambda sample: on_sample(), maxsize=1, policy=COALESCE_LATEST)
+
+    async def connect(self, device=None):
+        """
+        Connect to the device, found by a scan (device) or directly by address.
+        """
+        try:
+            # Attempt connection
+            print(f"\nAttempting to connect to {self.target_address}...")
+            client_class = self.client_class
+            if client_class is None:
+                from bleak import BleakClient as client_class
+            self.client = client_class(
+                device or self.target_address,
+                disconnected_callback=self._on_disconnect
+            )
+            await self.client.connect(timeout=self.connect_timeout)
+
+            self.is_connected = True
+            self.disconnected.clear()
+            if self.remember_device:
+                save_known_device(self.target_address, self.session.name)
+            print(f"✅ Successfully connected to the heart rate monitor {self.target_address}!")
+
+            return True
+
+        except Exception as e:
+            print(f"\n❌ Connection Error ({self.target_address}): {e}")
+            return False
+
+    async def scan_and_connect(self):
+        """
+        Targeted scan for this device only, then connect.
+        """
+        devices = await find_devices([self.target_address], timeout=self.scan_timeout, scanner_class=self.scanner_class)
+        device = devices.get(self.target_address.upper())
+        if not device:
+            print(f"\n❌ Target device {self.target_address} not found.")
+            return False
+        return await self.connect(device)
+
+    async def monitor_heart_rate(self):
+        """
+        Start heart rate notifications with detailed error handling and logging.
+        """
+        if not self.is_connected:
+            print("Not connected to the device.")
+            return
+
+        try:
+            print(f"\nStarting Heart Rate Monitoring ({self.target_address})...")
+            # Start monitoring heart rate time stamp
+            self.session.start()
+            self.bus.start()
+
+            await self.client.start_notify(
+                HEART_RATE_MEASUREMENT_CHARACTERISTIC_UUID,
+                self.heart_rate_handler
+            )
+
+        except Exception as e:
+            print(f"Monitoring Error: {e}")
+            # Connected but without notifications: start over like after a lost connection
+            await self.drop_connection()
+            if not self.stopping.is_set():
+                self.disconnected.set()
+
+    async def drop_connection(self):
+        """
+        Disconnect a client that can't be used, so the next connect starts afresh.
+        """
+        try:
+            await self.client.disconnect()
+        except Exception as e:
+            print(f"⚠️  Disconnection warning: {e}")
+        self.is_connected = False
+
+    def heart_rate_handler(self, sender, data):
+        """
+        Decode a notification and publish it to the sinks; nothing else happens
+        in the BLE callback.
+        """
+        metrics = self.session.metrics
+        start = metrics.arrival()
+        try:
+            # Decode the full Heart Rate Measurement packet
+            heart_rate, sensor_contact, energy_expended, rr_intervals = parse_heart_rate_measurement(data)
+            metrics.lap("decode", start)
+
+            # The sinks time themselves from the arrival of the notification
+            if not self.bus.publish(make_sample(heart_rate, sensor_contact, energy_expended, rr_intervals, start)):
+                metrics.count("dropped")
+
+        except Exception as e:
+            metrics.count("errors")
+            print(f"Error processing heart rate data: {e}")
+
+    def _on_disconnect(self, client):
+        self.is_connected = False
+        if not self.stopping.is_set():
+            self.disconnected.set()
+
+    async def supervise(self):
+        """
+        Reconnect with exponential backoff whenever the device drops out,
+        continuing the same recording.
+        """
+        while not self.stopping.is_set():
+            await self.disconnected.wait()
+            if self.stopping.is_set():
+                break
+
+            print(f"\n⚠️  Lost connection to {self.target_address}, reconnecting...")
+            # The gap goes into the recording after the samples before it, unless a sink is stuck
+            try:
+                await asyncio.wait_for(self.bus.drain(), self.drain_timeout)
+            except asyncio.TimeoutError:
+                print(f"⚠️  Sinks did not finish within {self.drain_timeout:.0f} s, recording the gap anyway")
+            self.session.mark_gap()
+
+            delay = 1
+            while not self.stopping.is_set():
+                # Try the cached address first, then a targeted scan
+                if await self.connect() or await self.scan_and_connect():
+                    try:
+                        await self.client.start_notify(
+                            HEART_RATE_MEASUREMENT_CHARACTERISTIC_UUID,
+                            self.heart_rate_handler
+                        )
+                        print(f"✅ Reconnected to {self.target_address}")
+                        break
+                    except Exception as e:
+                        print(f"Monitoring Error: {e}")
+                        # Don't leave the connection open when the next attempt replaces the client
+                        await self.drop_connection()
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_backoff)
+
+    async def stop_monitoring(self):
+        """
+        Stop notifications, drain the recording and finalise its metadata, then
+        disconnect. Only the first call does anything.
+        """
+        if self.stopped:
+            return
+        self.stopped = True
+
+        # No new samples from here on
+        if self.client and self.is_connected:
+            try:
+                await self.client.stop_notify(HEART_RATE_MEASUREMENT_CHARACTERISTIC_UUID)
+            except Exception as e:
+                print(f"⚠️  Disconnection warning: {e}")
+
+        # Let the sinks handle the queued samples, then write them to disk and finalise the metadata
+        await self.bus.close()
+        self.session.close()
+
+        if self.client and self.is_connected:
+            try:
+                await self.client.disconnect()
+                self.is_connected = False
+                print(f"✅ Disconnected from heart rate monitor {self.target_address}")
+            except Exception as e:
+                print(f"⚠️  Disconnection warning: {e}")
+        else:
+            print(f"✅ No active connection to disconnect ({self.target_address})")
+
+
+async def connect_monitors(monitors, stop, scan_timeout=10.0, scanner_class=None):
+    """
+    Connect all monitors concurrently and return the connected ones. Devices
+    we connected to before are connected directly, the rest need one shared
+    targeted scan.
+    """
+    known_devices = load_known_devices()
+    unknown = [hrm.target_address for hrm in monitors if hrm.target_address.upper() not in known_devices]
+    devices = {}
+    if unknown:
+        print("Scanning for Bluetooth LE devices...")
+        devices = await until_stopped(find_devices(unknown, timeout=scan_timeout, scanner_class=scanner_class), stop) or {}
+        for address in unknown:
+            if address.upper() not in devices and not stop.is_set():
+                print(f"\n❌ Target device {address} not found.")
+
+    async def connect(hrm):
+        address = hrm.target_address.upper()
+        if address in devices:
+            return await hrm.connect(devices[address])
+        if address in known_devices:
+            # Fall back to a targeted scan if the cached address doesn't connect
+            return await hrm.connect() or await hrm.scan_and_connect()
+        return False
+
+    results = await until_stopped(asyncio.gather(*(connect(hrm) for hrm in monitors)), stop) or []
+    return [hrm for hrm, success in zip(monitors, results) if success]
@@ -0,0 +1,229 @@
+import csv
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from measurement import rr_to_ms
+from binary_format import pack_header, contact_flags, split_rr, RECORD, MAX_RR, FLAG_GAP, CSV_HEADER
+from journal import Journal
+
+
+class BufferedRecorder:
+    """
+    Keep the recording file open and write samples in batches from a background thread.
+    With journal=True every sample also goes into a write-ahead journal that is
+    fsynced at most every fsync_interval seconds (see journal.py).
+    """
+    file_format = None
+
+    def __init__(self, filename, flush_rows=50, flush_interval=5.0, metrics=None, journal=True, fsync_interval=5.0):
+        self.filename = filename
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.metrics = metrics
+
+        # Start of the session, offsets in the journal (and .hrb) are relative to it
+        self._start_ns = time.monotonic_ns()
+        self._start_wall_ns = time.time_ns()
+
+        # Samples waiting to be written to disk
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+
+        # Open the file once for the whole session
+        self._file = self._open()
+        self.journal = Journal(filename, self.file_format, self._start_wall_ns, fsync_interval) if journal else None
+
+        # Start the background flush thread
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def write_sample(self, heart_rate, rr_intervals=(), sensor_contact=None, received=None):
+        """
+        Queue one notification (cheap enough to call from the BLE callback).
+        rr_intervals are raw values in 1/1024 s. received is the monotonic time
+        the notification arrived (default: now). Returns False if the recording
+        is already closed.
+        """
+        received_ns = time.monotonic_ns() if received is None else int(received * 1e9)
+        with self._lock:
+            if self._closed:
+                return False
+            self._append(heart_rate, rr_intervals, sensor_contact, received_ns)
+            if self.journal:
+                self.journal.append(received_ns - self._start_ns, heart_rate, contact_flags(sensor_contact), rr_intervals)
+            self._pending += 1
+            full = self._pending >= self.flush_rows
+
+        # Wake the writer early if the batch is full
+        if full:
+            self._wake.set()
+        return True
+
+    def write_gap(self):
+        """
+        Mark a gap in the recording (e.g. while disconnected).
+        """
+        with self._lock:
+            if self._closed:
+                return
+            # The same time in the recording and the journal
+            now_ns = time.monotonic_ns()
+            self._append_gap(now_ns)
+            if self.journal:
+                self.journal.append(now_ns - self._start_ns, 0, FLAG_GAP, ())
+
+    def flush(self):
+        """
+        Write all buffered samples to disk.
+        """
+        # Swap the buffer so the callback is never blocked by disk I/O
+        with self._lock:
+            data = self._take()
+            journal_data = self.journal.take() if self.journal else None
+            self._pending = 0
+
+        with self._file_lock:
+            if self._file.closed:
+                return
+            start = self.metrics.clock() if self.metrics else 0
+            # The journal first, so it always has at least what the data file has
+            if self.journal:
+                self.journal.write(journal_data)
+            if data:
+                self._write(data)
+            self._file.flush()
+            if self.metrics and data:
+                self.metrics.lap("disk_flush", start)
+
+    def _sync_journal(self):
+        # Get the journal onto the disk without writing the data file
+        with self._lock:
+            journal_data = self.journal.take()
+        with self._file_lock:
+            if self._file.closed:
+                return
+            self.journal.write(journal_data)
+            self.journal.sync()
+
+    def close(self):
+        """
+        Flush the remaining samples and close the file. Safe to call more than once.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._wake.set()
+        self._thread.join()
+        self.flush()
+        with self._file_lock:
+            # The data file is complete and on disk, so the journal isn't needed any more
+            if self.journal:
+                os.fsync(self._file.fileno())
+            self._file.close()
+            if self.journal:
+                self.journal.close()
+
+    def _run(self):
+        # Write the data file every flush_interval (or whenever write_sample()
+        # signals a full batch) and sync the journal every fsync_interval
+        now = time.monotonic()
+        next_flush = now + self.flush_interval
+        next_sync = now + self.journal.fsync_interval if self.journal else float("inf")
+        while not self._closed:
+            woken = self._wake.wait(max(0.0, min(next_flush, next_sync) - time.monotonic()))
+            self._wake.clear()
+            now = time.monotonic()
+            if woken or now >= next_flush:
+                self.flush()
+                next_flush = now + self.flush_interval
+            if now >= next_sync:
+                self._sync_journal()
+                next_sync = now + self.journal.fsync_interval
+
+
+class CsvRecorder(BufferedRecorder):
+    """
+    Text recording: one row per notification with the time, heart rate and RR intervals in ms.
+    """
+    file_format = "csv"
+
+    def _open(self):
+        self._rows = []
+        file = open(self.filename, mode='w', newline='')
+        self._writer = csv.writer(file)
+        self._writer.writerow(CSV_HEADER)
+        file.flush()
+        return file
+
+    def _append(self, heart_rate, rr_intervals, sensor_contact, received_ns):
+        # Time the notification arrived rather than when it got here
+        now = datetime.now() - timedelta(microseconds=(time.monotonic_ns() - received_ns) / 1000)
+
+        # RR intervals in ms, space separated
+        self._rows.append([
+            now.strftime("%Y-%m-%d %H:%M:%S"),
+            heart_rate,
+            " ".join(str(round(rr_to_ms(rr))) for rr in rr_intervals)
+        ])
+
+    def _append_gap(self, now_ns):
+        self._rows.append([datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "", ""])
+
+    def _take(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def _write(self, rows):
+        self._writer.writerows(rows)
+
+
+class BinaryRecorder(BufferedRecorder):
+    """
+    Binary recording (see binary_format.py): fixed-width records with a
+    nanosecond offset from the start of the session.
+    """
+    file_format = "binary"
+
+    def _open(self):
+        size = RECORD.size * max(self.flush_rows * 2, 64)
+        self._buffer = bytearray(size)
+        self._spare = bytearray(size)
+        self._used = 0
+        file = open(self.filename, mode='wb')
+        file.write(pack_header(self._start_wall_ns))
+        file.flush()
+        return file
+
+    def _append(self, heart_rate, rr_intervals, sensor_contact, received_ns):
+        offset_ns = received_ns - self._start_ns
+
+        # Up to MAX_RR intervals per record, the rest go into continuation records
+        for flags, chunk in split_rr(contact_flags(sensor_contact), rr_intervals):
+            self._pack(offset_ns, heart_rate, flags, chunk)
+
+    def _append_gap(self, now_ns):
+        self._pack(now_ns - self._start_ns, 0, FLAG_GAP, ())
+
+    def _pack(self, offset_ns, heart_rate, flags, rr_intervals):
+        # Grow the buffer if the writer has fallen behind
+        if self._used + RECORD.size > len(self._buffer):
+            self._buffer = self._buffer + bytes(len(self._buffer))
+
+        rr = list(rr_intervals) + [0] * (MAX_RR - len(rr_intervals))
+        RECORD.pack_into(self._buffer, self._used, offset_ns, heart_rate, flags, len(rr_intervals), *rr)
+        self._used += RECORD.size
+
+    def _take(self):
+        # Hand the filled buffer to the writer and continue in the spare one
+        data = memoryview(self._buffer)[:self._used]
+        self._buffer, self._spare = self._spare, self._buffer
+        self._used = 0
+        return data
+
+    def _write(self, data):
+        self._file.write(data)
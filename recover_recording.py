@@ -0,0 +1,45 @@
+import argparse
+import glob
+import os
+from journal import needs_recovery, recover, journal_path
+
+
+def find_interrupted(path):
+    """
+    Recordings in a directory (or the given recording) that were interrupted.
+    """
+    if os.path.isdir(path):
+        journals = glob.glob(os.path.join(path, "heartrate_data_*.journal"))
+        recordings = glob.glob(os.path.join(path, "heartrate_data_*.csv")) + glob.glob(os.path.join(path, "heartrate_data_*.hrb"))
+        # A journal without a data file still has all the samples
+        paths = set(recordings) | {journal[:-len(".journal")] for journal in journals}
+    else:
+        paths = {path}
+    return sorted(path for path in paths if needs_recovery(path))
+
+
+def main(argv=None):
+    # Parse command line arguments
+    parser = argparse.ArgumentParser(description="Repair heart rate recordings of interrupted sessions")
+    parser.add_argument("-p", "--path", type=str, default="data", help="Recording or directory of recordings (default: data)")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.path) and not os.path.exists(journal_path(args.path)):
+        print(f"Error: Path '{args.path}' does not exist.")
+        return
+
+    interrupted = find_interrupted(args.path)
+    if not interrupted:
+        print("No interrupted recordings found.")
+        return
+
+    for path in interrupted:
+        try:
+            samples = recover(path)
+            print(f"✅ Recovered '{path}' ({samples} samples)")
+        except (OSError, ValueError) as e:
+            print(f"❌ Could not recover '{path}': {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+import os
+import sqlite3
+import time
+from datetime import datetime
+from utilities import current_summary, load_profile, calculate_age, RunningStats
+from recorder import CsvRecorder, BinaryRecorder
+from measurement import rr_to_ms, MIN_HR, MAX_HR
+from hrv import RollingHrv
+from zones import ZoneModel
+from metrics import Metrics
+from alerts import AlertRules
+from bus import make_sample, BLOCK, COALESCE_LATEST
+from journal import write_json_atomic
+from catalogue import WorkoutCatalogue, CATALOGUE_PATH
+
+
+class WorkoutSession:
+    """
+    Everything recorded for one heart rate strap: profile, data file, statistics and alerts.
+    """
+    def __init__(self, address, name=None, target_hr=None, tag=None, hrv_window=120, flush_rows=50, flush_interval=5.0, file_format="csv", metrics=None, alert_worker=None, journal=True, fsync_interval=5.0, catalogue_path=CATALOGUE_PATH):
+        self.address = address
+
+        # Hot path timers and counters (disabled unless asked for)
+        self.metrics = metrics or Metrics(address, enabled=False)
+
+        # Load the profile
+        if name:
+            print(f"=== Loading profile ({address}) ===")
+            self.name = name
+            path2profile = f"configs/{name}.json"
+            self.profile = load_profile(path2profile)
+
+            # Calculate exact age based on the DOB
+            self.age = calculate_age(self.profile["dob"])
+            self.weight = float(self.profile["weight"])
+            self.sex = self.profile["sex"]
+            self.zones = ZoneModel.from_profile(self.profile) if "max_hr" in self.profile else None
+
+            # Print the profile
+            print(self.profile)
+            print("\nCalculating age...\n")
+            print(f"Age: {self.age} years")
+        else:
+            self.name = "default"
+            self.profile = None
+            self.age = 0
+            self.weight = 0
+            self.sex = "unknown"
+            self.zones = None
+            print(f"No profile selected for {address}...")
+
+        # Set target heart rate
+        self.target_hr = target_hr if target_hr else None
+        if self.target_hr:
+            print(f"Target heart rate set to: {self.target_hr} bpm")
+
+        # Audio alerts (below target, above ceiling, zone changes, signal lost) from the profile
+        self.alerts = AlertRules.from_profile(self.profile, self.target_hr, self.zones, alert_worker, device=address)
+
+        # Running statistics used by the live title and the final summary
+        self.stats = RunningStats(self.age, self.weight, self.sex, self.zones)
+
+        # HRV over a sliding window of RR intervals
+        self.hrv = RollingHrv(window=hrv_window)
+
+        # Create a data file (.csv or binary .hrb) to store the data with the current timestamp
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        extension = "hrb" if file_format == "binary" else "csv"
+        self.data_filename = f"data/heartrate_data_{tag or self.name}_{timestamp}.{extension}"
+        print(f"The data will be written to: {self.data_filename}")
+
+        # Open the data file once; samples are written in batches, with a
+        # write-ahead journal so an interrupted session can be recovered
+        recorder_class = BinaryRecorder if file_format == "binary" else CsvRecorder
+        self.recorder = recorder_class(
+            self.data_filename,
+            flush_rows=flush_rows,
+            flush_interval=flush_interval,
+            metrics=self.metrics,
+            journal=journal,
+            fsync_interval=fsync_interval
+        )
+        self.gaps = []
+
+        # Where the finished recording is indexed (None to skip)
+        self.catalogue_path = catalogue_path
+
+        if self.profile:
+            self.write_metadata()
+
+        self.heart_rate = None
+        self.closed = False
+        self.sensor_contact = None
+        self.live_plot = None
+        self.start_time = datetime.now()
+        self.start_monotonic = time.monotonic()
+
+    def write_metadata(self, final=False):
+        # Strip the extension from the filename
+        meta_data_filename = os.path.splitext(self.data_filename)[0] + "_meta.json"
+
+        # Copy profile to the data folder and add target_hr if specified
+        workout_metadata = self.profile.copy()  # Copy the profile data
+        if self.target_hr:
+            workout_metadata["target_hr"] = self.target_hr  # Add target HR to workout metadata
+
+        # "finalised" marks metadata of recordings that can be recovered; it is
+        # false until the recording is finished
+        workout_metadata["finalised"] = final
+        # Tells recovery that the recording is still running (also without a journal)
+        workout_metadata["pid"] = os.getpid()
+
+        # When the recording is finished, add when it ended, how many samples it has and when the connection was lost
+        if final:
+            workout_metadata["end_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            workout_metadata["samples"] = self.stats.count
+            workout_metadata["gaps"] = self.gaps
+
+        # Replace the file in one step, so a crash never leaves half a file
+        write_json_atomic(meta_data_filename, workout_metadata)
+        if final:
+            return
+        print(f"Profile saved to {meta_data_filename}")
+        if self.target_hr:
+            print(f"Target HR {self.target_hr} bpm saved to workout metadata")
+
+    def start(self):
+        """
+        Reset the session clock when notifications start.
+        """
+        self.start_time = datetime.now()
+        self.start_monotonic = time.monotonic()
+
+    def add_sample(self, heart_rate, sensor_contact, rr_intervals, start=0):
+        """
+        Record one decoded notification and update statistics, alerts and the graph
+        in one go, without a sample bus. rr_intervals are raw values in 1/1024 s.
+        start is the time (ns) the stages are timed from; returns the time at the
+        end of the last stage.
+        """
+        metrics = self.metrics
+        sample = make_sample(heart_rate, sensor_contact, None, rr_intervals, start)
+
+        self.record_sample(sample)
+        start = metrics.lap("record", start)
+        self.update_stats(sample)
+        start = metrics.lap("stats", start)
+        self.check_alerts(sample)
+        start = metrics.lap("alert", start)
+        if self.live_plot:
+            self.plot_sample(sample)
+            start = metrics.lap("plot", start)
+        return start
+
+    def subscribe(self, bus):
+        """
+        Subscribe the recording, statistics and alerts to a SampleBus. The
+        recording and statistics need every sample; alerts only the latest.
+        """
+        bus.subscribe("record", self.record_sample, maxsize=256, policy=BLOCK)
+        bus.subscribe("stats", self.update_stats, maxsize=256, policy=BLOCK)
+        bus.subscribe("alert", self.check_alerts, maxsize=1, policy=COALESCE_LATEST)
+
+    def record_sample(self, sample):
+        # Queue the data for the data file
+        if not self.recorder.write_sample(sample.heart_rate, sample.rr_intervals, sample.sensor_contact, sample.time):
+            self.metrics.count("dropped")
+
+    def update_stats(self, sample):
+        self.heart_rate = sample.heart_rate
+        self.sensor_contact = sample.sensor_contact
+
+        # Update the rolling HRV
+        for rr in sample.rr_intervals:
+            self.hrv.update(rr_to_ms(rr))
+
+        # Update the running statistics. Implausible heart rates (e.g. 0 without
+        # skin contact) count as a gap, the same as in the analysis
+        if MIN_HR <= sample.heart_rate <= MAX_HR:
+            self.stats.update(sample.heart_rate, sample.time)
+        else:
+            self.stats.mark_gap()
+
+    def check_alerts(self, sample):
+        # Queue audio alerts (played by the alert worker)
+        self.alerts.update(sample.heart_rate, sample.sensor_contact, sample.time)
+
+    def plot_sample(self, sample):
+        # Buffer the sample for the graph's renderer
+        self.live_plot.add_sample(sample.heart_rate, sample.time - self.start_monotonic)
+
+    def mark_gap(self):
+        """
+        Mark a connection gap: an empty row in the data file and no time counted
+        until the next sample.
+        """
+        self.recorder.write_gap()
+        self.gaps.append(datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        self.stats.mark_gap()
+        self.hrv.reset()
+        self.metrics.mark_gap()
+
+    def status(self):
+        """
+        One-line console status for the latest sample.
+        """
+        status = f"💓 Heart Rate: {self.heart_rate} bpm"
+        if self.target_hr:
+            status += f" (Target: {self.target_hr} bpm)"
+        if self.hrv.rmssd is not None:
+            status += f" | RMSSD: {self.hrv.rmssd:.0f} ms"
+        if self.sensor_contact is False:
+            status += " | ⚠️  No skin contact"
+        return status
+
+    def summary(self):
+        return current_summary(self.start_time, self.stats, self.name)
+
+    def print_summary(self):
+        # Print the final summary
+        if self.stats.count == 0:
+            return
+        print(self.summary())
+        if self.hrv.rmssd is not None:
+            print(f"RMSSD: {self.hrv.rmssd:.1f} ms, SDNN: {self.hrv.sdnn:.1f} ms, pNN50: {self.hrv.pnn50:.1f}% (last {len(self.hrv.rr)} beats)")
+        if self.zones:
+            for zone, seconds in self.stats.zone_seconds.items():
+                print(f"  {zone}: {round(seconds)} s")
+
+    def close(self):
+        """
+        Write any buffered samples to disk and finalise the metadata. Only the
+        first call does anything.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.alerts.close()
+        self.recorder.close()
+        if self.profile:
+            self.write_metadata(final=True)
+        if self.catalogue_path:
+            self.add_to_catalogue()
+
+    def add_to_catalogue(self):
+        # A session without samples is not a workout
+        if self.stats.count == 0:
+            return
+        # A broken catalogue must not cost the recording, it can be rebuilt with catalogue.py
+        try:
+            with WorkoutCatalogue(self.catalogue_path) as catalogue:
+                catalogue.add_session(self)
+        except (sqlite3.Error, OSError) as e:
+            print(f"⚠️  Could not add the workout to the catalogue: {e}")
@@ -0,0 +1,197 @@
+"""
+Simulated heart rate straps for testing without Bluetooth
+
+SimulatedClient and SimulatedScanner stand in for bleak's BleakClient and
+BleakScanner. Registered SimulatedDevices replay a recorded CSV file or
+synthetic data as Heart Rate Measurement (0x2A37) notifications, in real time
+or sped up, optionally delivered in bursts and with dropped connections.
+"""
+import asyncio
+import csv
+import random
+from datetime import datetime
+from measurement import encode_heart_rate_measurement
+
+DEFAULT_ADDRESS = "00:00:00:00:00:01"
+
+# Simulated devices by (upper case) address
+DEVICES = {}
+
+
+def csv_source(path):
+    """
+    Samples of a recording as (seconds since the previous sample, heart rate, raw RR intervals).
+    Rows without a heart rate (gaps) have heart rate None.
+    """
+    with open(path, "r", newline="") as f:
+        last_time = None
+        for row in csv.DictReader(f):
+            timestamp = datetime.strptime(row["Timestamp"], "%Y-%m-%d %H:%M:%S")
+            delay = (timestamp - last_time).total_seconds() if last_time else 0.0
+            last_time = timestamp
+
+            if not row["Heart Rate"]:
+                yield delay, None, []
+                continue
+            # RR intervals are stored in ms, the packets carry 1/1024 s
+            rr = [round(float(value) * 1024 / 1000) for value in (row.get("RR Intervals") or "").split()]
+            yield delay, int(float(row["Heart Rate"])), rr
+
+
+def synthetic_source(rate=1.0, heart_rate=120, seed=None):
+    """
+    Endless random walk around heart_rate with matching RR intervals, rate samples per second.
+    """
+    rng = random.Random(seed)
+    current = float(heart_rate)
+    while True:
+        # Pulled back towards heart_rate so it doesn't drift away
+        current += rng.gauss(0, 1.5) + 0.05 * (heart_rate - current)
+        current = min(max(current, 40.0), 220.0)
+
+        # One RR interval per beat since the previous sample
+        beat = 60 / current
+        beats = max(1, round(1 / rate / beat))
+        rr = [round(rng.gauss(beat, 0.02 * beat) * 1024) for _ in range(beats)]
+        yield 1 / rate, round(current), rr
+
+
+def make_source(spec, rate=1.0, seed=None):
+    # "synthetic" or the path to a CSV recording
+    if spec == "synthetic":
+        return synthetic_source(rate, seed=seed)
+    return csv_source(spec)
+
+
+class SimulatedDevice:
+    """
+    A heart rate strap replaying samples. speed > 1 replays faster than real
+    time, burst delivers that many notifications at once and disconnect_every
+    drops the connection every so many (wall clock) seconds for disconnect_for
+    seconds. Gaps in a recording also drop the connection.
+    """
+    def __init__(self, address, source, name="Simulated HR", speed=1.0, burst=1, disconnect_every=None, disconnect_for=5.0):
+        self.address = address
+        self.name = name
+        self.samples = iter(source)
+        self.speed = speed
+        self.burst = max(1, burst)
+        self.disconnect_every = disconnect_every
+        self.disconnect_for = disconnect_for
+
+        # Loop time at which the device can be connected again
+        self.available_at = 0.0
+
+
+def add_device(device):
+    DEVICES[device.address.upper()] = device
+    return device
+
+
+class SimulatedClient:
+    """
+    Stand-in for bleak.BleakClient connected to a SimulatedDevice.
+    """
+    def __init__(self, address_or_device, disconnected_callback=None, **kwargs):
+        self.address = getattr(address_or_device, "address", address_or_device)
+        self.device = DEVICES.get(self.address.upper())
+        self.disconnected_callback = disconnected_callback
+        self.is_connected = False
+        self._task = None
+
+    async def connect(self, timeout=10.0):
+        if self.device is None:
+            raise Exception(f"Device with address {self.address} was not found")
+
+        # Wait for a dropped device to come back, like a real connection attempt
+        loop = asyncio.get_running_loop()
+        wait = self.device.available_at - loop.time()
+        if wait > timeout:
+            await asyncio.sleep(timeout)
+            raise asyncio.TimeoutError(f"Device {self.address} is out of range")
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+        self.is_connected = True
+        return True
+
+    async def start_notify(self, char_specifier, callback):
+        if not self.is_connected:
+            raise Exception("Not connected")
+        self._task = asyncio.create_task(self._replay(char_specifier, callback))
+
+    async def stop_notify(self, char_specifier):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def disconnect(self):
+        await self.stop_notify(None)
+        if self.is_connected:
+            self._drop()
+        return True
+
+    def _drop(self):
+        self.is_connected = False
+        if self.disconnected_callback:
+            self.disconnected_callback(self)
+
+    async def _replay(self, char_specifier, callback):
+        device = self.device
+        loop = asyncio.get_running_loop()
+        # Absolute deadlines so the rate doesn't drift at high speeds
+        next_time = loop.time()
+        next_drop = next_time + device.disconnect_every if device.disconnect_every else None
+        pending = []
+
+        for delay, heart_rate, rr in device.samples:
+            next_time += delay / device.speed
+
+            # A gap in the recording: out of range until the next sample
+            if heart_rate is None:
+                device.available_at = next_time
+                self._task = None
+                self._drop()
+                return
+
+            pending.append(encode_heart_rate_measurement(heart_rate, rr, sensor_contact=True))
+            if len(pending) < device.burst:
+                continue
+
+            await asyncio.sleep(max(0.0, next_time - loop.time()))
+            for packet in pending:
+                callback(char_specifier, packet)
+            pending = []
+
+            if next_drop is not None and loop.time() >= next_drop:
+                device.available_at = loop.time() + device.disconnect_for
+                self._task = None
+                self._drop()
+                return
+
+        # End of the recording: stay connected but silent
+        for packet in pending:
+            callback(char_specifier, packet)
+        print(f"\nℹ️  Simulated device {device.address} has no more data")
+
+
+class SimulatedScanner:
+    """
+    Stand-in for bleak.BleakScanner that sees every available SimulatedDevice.
+    """
+    def __init__(self, detection_callback=None, **kwargs):
+        self.detection_callback = detection_callback
+
+    async def __aenter__(self):
+        now = asyncio.get_running_loop().time()
+        for device in DEVICES.values():
+            if self.detection_callback and device.available_at <= now:
+                self.detection_callback(device, None)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+    @staticmethod
+    async def discover(timeout=5.0, **kwargs):
+        return list(DEVICES.values())
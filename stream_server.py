@@ -0,0 +1,228 @@
+"""
+Live heart rate for other screens (gym displays, phones) over Server-Sent Events
+
+    /          a small page showing the heart rate of every device
+    /events    live samples as they arrive
+    /replay    the kept samples (the last max_history), then live (for late joiners)
+
+Each sample is serialised once and the same bytes are queued for every
+client. Every client has a bounded queue written by its own task; a client
+that can't keep up is dropped instead of holding up the others (browsers
+reconnect by themselves and continue from the last sample they got).
+Everything runs on the event loop, fed by a sink of each device's sample bus.
+"""
+import asyncio
+import json
+from collections import deque
+from itertools import islice
+from urllib.parse import urlsplit
+from measurement import rr_to_ms
+
+PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>Heart rate</title>
+<style>
+body { font-family: sans-serif; background: #111; color: #eee; display: flex; flex-wrap: wrap; gap: 2em; justify-content: center; }
+.device { text-align: center; padding: 1em 2em; border-radius: 1em; background: #222; }
+.hr { font-size: 20vmin; font-weight: bold; }
+.below { color: #f88; }
+.above { color: #8f8; }
+</style>
+</head>
+<body>
+<script>
+const devices = {};
+const events = new EventSource("/events");
+events.addEventListener("sample", (event) => {
+    const sample = JSON.parse(event.data);
+    let element = devices[sample.device];
+    if (!element) {
+        element = devices[sample.device] = document.createElement("div");
+        element.className = "device";
+        element.innerHTML = "<div class='name'></div><div class='hr'></div>";
+        element.firstChild.textContent = sample.name;
+        document.body.appendChild(element);
+    }
+    const hr = element.lastChild;
+    hr.textContent = sample.hr;
+    hr.className = "hr" + (sample.target ? (sample.hr < sample.target ? " below" : " above") : "");
+});
+</script>
+</body>
+</html>
+"""
+
+KEEPALIVE = b": keepalive\n\n"
+
+
+class StreamClient:
+    """
+    One connected client: a bounded queue of serialised samples and the task writing them.
+    """
+    def __init__(self, writer, max_queue):
+        self.writer = writer
+        self.max_queue = max_queue
+        self.queue = deque()
+        self.ready = asyncio.Event()
+        self.dropped = False
+
+    def send(self, message):
+        # Called for every sample, so never waits: a full queue means a slow client
+        if len(self.queue) >= self.max_queue:
+            self.drop()
+            return
+        self.queue.append(message)
+        self.ready.set()
+
+    def drop(self):
+        if not self.dropped:
+            self.dropped = True
+            self.ready.set()
+            self.writer.transport.abort()
+
+    async def run(self, keepalive):
+        while not self.dropped:
+            if not self.queue:
+                self.ready.clear()
+                try:
+                    await asyncio.wait_for(self.ready.wait(), keepalive)
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing the connection and finds clients that went away
+                    self.queue.append(KEEPALIVE)
+                continue
+            # Write everything that is queued at once
+            messages = list(self.queue)
+            self.queue.clear()
+            self.writer.write(b"".join(messages))
+            await self.writer.drain()
+
+
+class StreamServer:
+    """
+    Server-Sent Events server fanning the samples of all devices out to many clients.
+    """
+    def __init__(self, host="127.0.0.1", port=8080, max_queue=256, keepalive=15.0, max_history=36000):
+        self.host = host
+        self.port = port
+        self.max_queue = max_queue
+        self.keepalive = keepalive
+        # The last max_history serialised samples and the id of the next one
+        self.history = deque(maxlen=max_history)
+        self.next_id = 0
+        self.clients = set()
+        self.dropped_clients = 0
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        return self
+
+    def sink(self, session):
+        """
+        Sample bus handler that streams the samples of session's device.
+        """
+        def stream_sample(sample):
+            elapsed = sample.time - session.start_monotonic
+            data = json.dumps({
+                "device": session.address,
+                "name": session.name,
+                "time": round(session.start_time.timestamp() + elapsed, 3),
+                "elapsed": round(elapsed, 3),
+                "hr": sample.heart_rate,
+                "contact": sample.sensor_contact,
+                "rr": [round(rr_to_ms(rr)) for rr in sample.rr_intervals],
+                "target": session.target_hr,
+            }, separators=(",", ":"))
+            self.publish(data)
+        return stream_sample
+
+    def publish(self, data):
+        # Serialise once, queue the same bytes for every client
+        message = f"id: {self.next_id}\nevent: sample\ndata: {data}\n\n".encode()
+        self.history.append(message)
+        self.next_id += 1
+        for client in list(self.clients):
+            client.send(message)
+            if client.dropped:
+                self._remove(client)
+
+    async def close(self):
+        """
+        Disconnect all clients and stop listening. Safe to call more than once.
+        """
+        if self.server is None:
+            return
+        self.server.close()
+        for client in list(self.clients):
+            client.drop()
+        self.clients.clear()
+        await self.server.wait_closed()
+        self.server = None
+
+    def _remove(self, client):
+        if client in self.clients:
+            self.clients.discard(client)
+            self.dropped_clients += 1
+            print(f"\n⚠️  Dropped a slow stream client ({self.dropped_clients} so far)")
+
+    async def _handle(self, reader, writer):
+        try:
+            # Only the request line and headers matter
+            request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 10)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        lines = request.decode("latin-1").split("\r\n")
+        method, target = (lines[0].split(" ") + ["", ""])[:2]
+        headers = dict(line.split(":", 1) for line in lines[1:] if ":" in line)
+        headers = {name.strip().lower(): value.strip() for name, value in headers.items()}
+        path = urlsplit(target).path
+
+        if method != "GET":
+            await self._respond(writer, "405 Method Not Allowed", "text/plain", b"Only GET is supported\n")
+        elif path == "/":
+            await self._respond(writer, "200 OK", "text/html; charset=utf-8", PAGE.encode())
+        elif path in ("/events", "/replay"):
+            await self._stream(writer, path == "/replay", headers.get("last-event-id"))
+        else:
+            await self._respond(writer, "404 Not Found", "text/plain", b"Not found\n")
+
+    async def _respond(self, writer, status, content_type, body):
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode() + body
+        )
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    async def _stream(self, writer, replay, last_event_id):
+        # Start after the last sample a reconnecting client got, from the oldest kept sample or live
+        first_id = self.next_id - len(self.history)
+        start = self.next_id
+        if last_event_id and last_event_id.isdigit():
+            start = max(first_id, min(int(last_event_id) + 1, self.next_id))
+        elif replay:
+            start = first_id
+
+        client = StreamClient(writer, self.max_queue)
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+            b"Access-Control-Allow-Origin: *\r\nConnection: keep-alive\r\n\r\nretry: 2000\n\n"
+        )
+        # The catch-up is one write of already serialised samples; new ones queue behind it
+        if start < self.next_id:
+            writer.write(b"".join(islice(self.history, start - first_id, None)))
+        self.clients.add(client)
+        try:
+            await client.run(self.keepalive)
+        except ConnectionError:
+            pass
+        finally:
+            self.clients.discard(client)
+            writer.close()
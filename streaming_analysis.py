@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+from binary_format import load_records, FLAG_GAP, FLAG_CONTINUATION
+from datetime import datetime
+from zones import ZONE_LABELS
+from cleaning import clean_chunks
+
+
+class WorkoutAccumulator:
+    """
+    Workout summary folded chunk by chunk, so a recording of any length can be
+    analysed in bounded memory. Feeding the whole recording as one chunk gives
+    the in-memory result.
+    """
+    zone_labels = ZONE_LABELS
+
+    def __init__(self, zone_model=None):
+        self.zone_model = zone_model
+        self.first_time = None
+        self.last_time = None
+        self.hr_sum = 0.0
+        self.hr_count = 0
+        self.hr_max = None
+        self.hr_min = None
+        self.zone_ns = np.zeros(len(ZONE_LABELS)) if zone_model else None
+
+        # Last sample of the previous chunk, whose interval ends in this chunk
+        self._last_ns = None
+        self._last_hr = None
+
+    def add_chunk(self, timestamps, heart_rates):
+        """
+        Fold in a chunk of samples (pandas Series, gaps as NaN).
+        """
+        if len(timestamps) == 0:
+            return
+        if self.first_time is None:
+            self.first_time = timestamps.iloc[0]
+        self.last_time = timestamps.iloc[-1]
+
+        # Heart rates are whole numbers, so the sums are exact whatever the chunking
+        self.hr_sum += heart_rates.sum()
+        self.hr_count += int(heart_rates.count())
+        chunk_max = heart_rates.max()
+        if not pd.isna(chunk_max) and (self.hr_max is None or chunk_max > self.hr_max):
+            self.hr_max = chunk_max
+        chunk_min = heart_rates.min()
+        if not pd.isna(chunk_min) and (self.hr_min is None or chunk_min < self.hr_min):
+            self.hr_min = chunk_min
+
+        # Time in each heart rate zone in one vectorised pass
+        if self.zone_model:
+            times_ns = timestamps.to_numpy(dtype="datetime64[ns]").astype(np.int64)
+            values = heart_rates.to_numpy(dtype=float)
+            if self._last_ns is not None:
+                times_ns = np.concatenate(([self._last_ns], times_ns))
+                values = np.concatenate(([self._last_hr], values))
+            self.zone_ns += self.zone_model.durations(times_ns, values)
+            self._last_ns = times_ns[-1]
+            self._last_hr = values[-1]
+
+    @property
+    def duration(self):
+        return self.last_time - self.first_time
+
+    @property
+    def avg_hr(self):
+        if self.hr_count == 0:
+            return None
+        return round(self.hr_sum / self.hr_count, 1)
+
+    # Cleaning turns the heart rates into floats, but they are whole numbers
+    @property
+    def max_hr(self):
+        return None if self.hr_max is None else int(self.hr_max)
+
+    @property
+    def min_hr(self):
+        return None if self.hr_min is None else int(self.hr_min)
+
+    @property
+    def zone_seconds(self):
+        if self.zone_ns is None:
+            return None
+        return [round(ns / 1e9, 1) for ns in self.zone_ns]
+
+
+def read_chunks(path, chunksize=100000):
+    """
+    Yield (timestamps, heart_rates) chunks of a .csv or .hrb recording.
+    """
+    if path.endswith(".hrb"):
+        # The records are memory-mapped, so slicing only touches one chunk at a time
+        start_ns, records = load_records(path)
+        local_tz = datetime.now().astimezone().tzinfo
+        for start in range(0, len(records), chunksize):
+            chunk = records[start:start + chunksize]
+            chunk = chunk[(chunk["flags"] & FLAG_CONTINUATION) == 0]
+            heart_rates = pd.Series(chunk["heart_rate"].astype(float))
+            heart_rates[(chunk["flags"] & FLAG_GAP) != 0] = float("nan")
+            timestamps = pd.Series(
+                pd.to_datetime(start_ns + chunk["offset_ns"].astype("int64"), unit="ns", utc=True)
+                .tz_convert(local_tz).tz_localize(None)
+            )
+            yield timestamps, heart_rates
+    else:
+        for chunk in pd.read_csv(path, chunksize=chunksize, usecols=["Timestamp", "Heart Rate"]):
+            yield pd.to_datetime(chunk["Timestamp"]), chunk["Heart Rate"]
+
+
+def analyse_stream(path, zone_model=None, chunksize=100000):
+    """
+    Fold a whole recording into a WorkoutAccumulator without loading it at once.
+    Artifacts are removed the same way as in the in-memory analysis.
+    """
+    accumulator = WorkoutAccumulator(zone_model)
+    for timestamps, heart_rates in clean_chunks(read_chunks(path, chunksize)):
+        accumulator.add_chunk(timestamps, heart_rates)
+    return accumulator
@@ -0,0 +1,272 @@
+"""
+Terminal dashboard
+
+A live view for hosts without a display (or matplotlib), e.g. over SSH:
+current heart rate, a sparkline of the last minutes, the running summary,
+time in zone and the target status for every device. It is plain ANSI
+output, redrawn at a capped frame rate, and only the characters that changed
+since the last frame are written.
+"""
+import asyncio
+import shutil
+import sys
+import time
+from collections import deque
+from datetime import datetime
+from zones import ZONE_LABELS
+
+SPARK = "▁▂▃▄▅▆▇█"
+
+# SGR colours of rest and zones 1 to 5
+ZONE_STYLES = ["2", "37", "36", "32", "33", "31"]
+
+CLEAR = "\x1b[2J"
+RESET = "\x1b[0m"
+HIDE_CURSOR = "\x1b[?25l"
+SHOW_CURSOR = "\x1b[?25h"
+ALTERNATE_SCREEN = "\x1b[?1049h"
+MAIN_SCREEN = "\x1b[?1049l"
+
+
+class HeartRateHistory:
+    """
+    Mean heart rate per second over the last `seconds` seconds.
+    """
+    def __init__(self, seconds=300):
+        self.seconds = seconds
+        # [second, sum, count]
+        self.buckets = deque(maxlen=seconds)
+
+    def add(self, heart_rate, timestamp):
+        second = int(timestamp)
+        if self.buckets and self.buckets[-1][0] == second:
+            bucket = self.buckets[-1]
+            bucket[1] += heart_rate
+            bucket[2] += 1
+        else:
+            self.buckets.append([second, heart_rate, 1])
+
+    def columns(self, width, now):
+        """
+        Mean heart rate in each of width columns covering the window up to now (None where there is no data).
+        """
+        sums = [0.0] * width
+        counts = [0] * width
+        start = now - self.seconds
+        for second, total, count in self.buckets:
+            column = int((second - start) * width / self.seconds)
+            if 0 <= column < width:
+                sums[column] += total
+                counts[column] += count
+        return [total / count if count else None for total, count in zip(sums, counts)]
+
+
+class OutputCapture:
+    """
+    Stands in for sys.stdout while the dashboard is shown and keeps the last
+    printed line, so messages don't scribble over the dashboard.
+    """
+    def __init__(self):
+        self.last_line = ""
+
+    def write(self, text):
+        lines = [line.strip() for line in text.replace("\r", "\n").split("\n") if line.strip()]
+        if lines:
+            self.last_line = lines[-1]
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+class TerminalDashboard:
+    """
+    One panel per session, drawn into a cell buffer that is diffed against the screen.
+    """
+    def __init__(self, sessions, window=5, footer="Press Enter to stop monitoring and save data...", stream=None):
+        self.sessions = sessions
+        self.footer = footer
+        self.stream = stream or sys.stdout
+        self.histories = {session.address: HeartRateHistory(int(window * 60)) for session in sessions}
+        self.window = window
+        self.screen = []
+        self.size = None
+        self.capture = None
+        self.active = False
+
+    def sink(self, session):
+        """
+        Sample bus handler that adds session's samples to its sparkline.
+        """
+        history = self.histories[session.address]
+
+        def add_sample(sample):
+            history.add(sample.heart_rate, sample.time)
+        return add_sample
+
+    def open(self):
+        """
+        Switch to the alternate screen and catch prints until close().
+        """
+        if self.active:
+            return
+        self.active = True
+        self.capture = OutputCapture()
+        sys.stdout = self.capture
+        self.stream.write(ALTERNATE_SCREEN + HIDE_CURSOR)
+        self.stream.flush()
+
+    def close(self):
+        """
+        Restore the terminal. Safe to call more than once.
+        """
+        if not self.active:
+            return
+        self.active = False
+        if sys.stdout is self.capture:
+            sys.stdout = self.stream
+        self.stream.write(RESET + SHOW_CURSOR + MAIN_SCREEN)
+        self.stream.flush()
+
+    def render(self):
+        """
+        Draw one frame, writing only the cells that changed.
+        """
+        size = shutil.get_terminal_size()
+        if size != self.size:
+            # Start over after a resize
+            self.size = size
+            self.screen = []
+            self.stream.write(RESET + CLEAR)
+        width = max(20, size.columns)
+
+        rows = []
+        for session in self.sessions:
+            rows.extend(self._panel(session, width))
+            rows.append([])
+        message = self.capture.last_line if self.capture else ""
+        rows.append(_cells(message, "2"))
+        rows.append(_cells(self.footer, "2"))
+        rows = [_fit(row, width) for row in rows[:size.lines]]
+
+        output = []
+        for index, row in enumerate(rows):
+            old = self.screen[index] if index < len(self.screen) else None
+            if old == row:
+                continue
+            if old is None:
+                first, last = 0, len(row)
+            else:
+                first = next(i for i, (new_cell, old_cell) in enumerate(zip(row, old)) if new_cell != old_cell)
+                last = len(row) - next(i for i, (new_cell, old_cell) in enumerate(zip(reversed(row), reversed(old))) if new_cell != old_cell)
+            output.append(f"\x1b[{index + 1};{first + 1}H")
+            output.append(_styled(row[first:last]))
+        # Clear rows that are no longer used
+        for index in range(len(rows), len(self.screen)):
+            output.append(f"\x1b[{index + 1};1H\x1b[K")
+        self.screen = rows
+
+        if output:
+            self.stream.write("".join(output))
+            self.stream.flush()
+
+    def _panel(self, session, width):
+        zones = session.zones
+        heart_rate = session.heart_rate
+
+        # Name, current heart rate, zone and target status
+        header = _cells(f" {session.name} ({session.address})  ", "1")
+        if heart_rate is None:
+            header += _cells("waiting for data", "2")
+        else:
+            zone = zones.zone(heart_rate) if zones else None
+            header += _cells(f"{heart_rate:>3} bpm", "1;" + ZONE_STYLES[zone] if zone is not None else "1")
+            if zone is not None:
+                header += _cells(f"  {ZONE_LABELS[zone]}", ZONE_STYLES[zone])
+            if session.target_hr:
+                if heart_rate < session.target_hr:
+                    header += _cells(f"  ▼ {session.target_hr - heart_rate} below target {session.target_hr}", "31")
+                else:
+                    header += _cells(f"  ▲ on target {session.target_hr}", "32")
+            if session.sensor_contact is False:
+                header += _cells("  no skin contact", "33")
+
+        # Sparkline of the last minutes, coloured by zone
+        label = f" {self.window:g} min "
+        values = self.histories[session.address].columns(width - len(label) - 10, time.monotonic())
+        present = [value for value in values if value is not None]
+        sparkline = _cells(label, "2")
+        if present:
+            low, high = min(present), max(present)
+            span = max(high - low, 1)
+            for value in values:
+                if value is None:
+                    sparkline.append((" ", ""))
+                    continue
+                style = ZONE_STYLES[zones.zone(value)] if zones else ""
+                sparkline.append((SPARK[min(len(SPARK) - 1, int((value - low) / span * len(SPARK)))], style))
+            sparkline += _cells(f" {low:.0f}-{high:.0f}", "2")
+
+        # Running summary
+        stats = session.stats
+        elapsed = str(datetime.now() - session.start_time).split(".")[0]
+        summary = f" Time {elapsed}"
+        if stats.count:
+            summary += f"  Avg {stats.mean:.1f}  Max {stats.max}"
+            if session.name != "default":
+                summary += f"  kcal {stats.kcal:.1f}"
+        if session.hrv.rmssd is not None:
+            summary += f"  RMSSD {session.hrv.rmssd:.0f} ms"
+        rows = [header, sparkline, _cells(summary)]
+
+        # Time in zone as one bar
+        if zones:
+            seconds = list(stats.zone_seconds.values())
+            total = sum(seconds)
+            bar = _cells(" Zones ", "2")
+            bar_width = width - len(bar) - 1
+            if total > 0:
+                used = 0
+                for zone, zone_seconds in enumerate(seconds):
+                    # Round the boundaries, not the parts, so the bar is always full width
+                    end = round(sum(seconds[:zone + 1]) / total * bar_width)
+                    bar += [("█", ZONE_STYLES[zone])] * (end - used)
+                    used = end
+            rows.append(bar)
+        return rows
+
+
+def _cells(text, style=""):
+    return [(char, style) for char in text]
+
+
+def _fit(row, width):
+    # Every row is exactly as wide as the terminal
+    return row[:width] + [(" ", "")] * (width - len(row))
+
+
+def _styled(cells):
+    # Characters with an SGR sequence whenever the style changes
+    parts = []
+    current = None
+    for char, style in cells:
+        if style != current:
+            parts.append(RESET + (f"\x1b[{style}m" if style else ""))
+            current = style
+        parts.append(char)
+    parts.append(RESET)
+    return "".join(parts)
+
+
+async def run_dashboard(dashboard, fps=2):
+    """
+    Redraw the dashboard at most fps times per second until cancelled.
+    """
+    interval = 1 / fps
+    dashboard.open()
+    try:
+        while True:
+            dashboard.render()
+            await asyncio.sleep(interval)
+    finally:
+        dashboard.close()
@@ -4,15 +4,20 @@ Test script for the warning sound functionality
 """
 
 import time
-from utilities import play_warning_sound
+from alerts import AlertWorker, TONES
 
 def test_sound():
     print("Testing warning sound functionality...")
-    print("You should hear a sound in 2 seconds...")
+    print("You should hear each alert sound in 2 seconds...")
     time.sleep(2)
-    
-    print("Playing sound now...")
-    play_warning_sound()
+
+    # Play every alert through the same worker the monitor uses
+    worker = AlertWorker()
+    for kind in TONES:
+        print(f"Playing '{kind}' now...")
+        worker.alert(kind)
+        time.sleep(1)
+    worker.close()
     
     print("Sound test completed!")
     print("\nIf you didn't hear anything, try:")
@@ -0,0 +1,96 @@
+import threading
+import time
+from alerts import AlertWorker, AlertRules
+from zones import ZoneModel
+
+
+class FakePlayer:
+    def __init__(self, hold=None):
+        self.played = []
+        self.hold = hold
+
+    def play(self, kind):
+        if self.hold:
+            self.hold.wait(5)
+        self.played.append(kind)
+
+    def close(self):
+        pass
+
+
+class FakeWorker:
+    def __init__(self):
+        self.alerts = []
+        self.watchers = []
+
+    def alert(self, kind, min_interval=5.0, device=None):
+        self.alerts.append((device, kind))
+        return True
+
+    def watch(self, check):
+        self.watchers.append(check)
+
+    def unwatch(self, check):
+        self.watchers.remove(check)
+
+
+def test_rate_limited_per_device_and_kind():
+    player = FakePlayer()
+    worker = AlertWorker(player)
+    try:
+        assert worker.alert("below_target", 0.2, device="AA")
+        assert not worker.alert("below_target", 0.2, device="AA")
+        # Other kinds and other devices are independent
+        assert worker.alert("zone_up", 0.2, device="AA")
+        assert worker.alert("below_target", 0.2, device="BB")
+        time.sleep(0.3)
+        assert worker.alert("below_target", 0.2, device="AA")
+    finally:
+        worker.close()
+    assert sorted(player.played) == ["below_target"] * 3 + ["zone_up"]
+
+
+def test_queued_alerts_are_coalesced():
+    hold = threading.Event()
+    player = FakePlayer(hold)
+    worker = AlertWorker(player)
+    try:
+        assert worker.alert("zone_up", 0)
+        # The first one is playing (held), the second waits in the queue
+        time.sleep(0.05)
+        assert worker.alert("zone_up", 0)
+        assert not worker.alert("zone_up", 0)
+        hold.set()
+    finally:
+        worker.close()
+    assert player.played == ["zone_up", "zone_up"]
+    # A closed worker takes no alerts
+    assert not worker.alert("zone_up", 0)
+
+
+def test_rules():
+    worker = FakeWorker()
+    rules = AlertRules(target_hr=120, ceiling=170, zones=ZoneModel([100, 120, 140, 160, 180]), worker=worker, device="AA")
+    for heart_rate in (110, 125, 175, 150):
+        rules.update(heart_rate, True, 0)
+    assert worker.alerts == [
+        ("AA", "below_target"),
+        ("AA", "zone_up"),
+        ("AA", "above_ceiling"), ("AA", "zone_up"),
+        ("AA", "zone_down"),
+    ]
+
+
+def test_signal_lost():
+    worker = FakeWorker()
+    rules = AlertRules(signal_lost=10, worker=worker)
+    rules.update(100, True, 0)
+    rules.update(100, False, 5)
+    worker.watchers[0](9)
+    assert worker.alerts == []
+    worker.watchers[0](10)
+    worker.watchers[0](20)
+    # Once until the signal is back
+    assert worker.alerts == [(None, "signal_lost")]
+    rules.close()
+    assert worker.watchers == []
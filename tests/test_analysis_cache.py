@@ -0,0 +1,61 @@
+import os
+from analysis_cache import AnalysisCache
+
+
+def make_cache(tmp_path, **options):
+    return AnalysisCache(str(tmp_path / "cache"), **options)
+
+
+def write(path, text):
+    path.write_text(text)
+    return str(path)
+
+
+def test_hit_and_invalidate(tmp_path):
+    cache = make_cache(tmp_path)
+    data = write(tmp_path / "workout.csv", "Timestamp,Heart Rate\n")
+    meta = write(tmp_path / "workout_meta.json", "{}")
+    plot = write(tmp_path / "plot.png", "png")
+
+    key = cache.key(data, meta, "1")
+    assert cache.get(key) is None
+    cache.put(key, {"avg_hr": 120.0}, plot)
+    metrics = cache.get(cache.key(data, meta, "1"))
+    assert metrics["avg_hr"] == 120.0
+    assert open(metrics["cached_plot"]).read() == "png"
+
+    # Another analysis version, changed data or changed metadata are misses
+    assert cache.key(data, meta, "2") != key
+    write(tmp_path / "workout.csv", "Timestamp,Heart Rate\n2024-11-01 18:00:00,120\n")
+    assert cache.get(cache.key(data, meta, "1")) is None
+    write(tmp_path / "workout.csv", "Timestamp,Heart Rate\n")
+    write(tmp_path / "workout_meta.json", '{"max_hr": 190}')
+    assert cache.get(cache.key(data, meta, "1")) is None
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = make_cache(tmp_path)
+    for number in range(3):
+        cache.put(f"key{number}", {"padding": "x" * 100})
+        os.utime(os.path.join(cache.directory, f"key{number}.json"), (number, number))
+    # Room for two entries; key0 was used last
+    cache.get("key0")
+    cache.max_bytes = 250
+    cache.evict()
+    assert cache.get("key0") is not None
+    assert cache.get("key1") is None
+    assert cache.get("key2") is not None
+
+
+def test_forgets_digests_of_deleted_files(tmp_path):
+    cache = make_cache(tmp_path)
+    kept = write(tmp_path / "kept.csv", "a")
+    deleted = write(tmp_path / "deleted.csv", "b")
+    cache.key(kept)
+    cache.key(deleted)
+    assert len(os.listdir(os.path.join(cache.directory, "files"))) == 2
+
+    os.remove(deleted)
+    cache.evict()
+    assert len(os.listdir(os.path.join(cache.directory, "files"))) == 1
+    assert cache.key(kept) == cache.key(kept)
@@ -0,0 +1,87 @@
+import csv
+import pytest
+from binary_format import (
+    pack_header, pack_record, split_rr, load_records, samples, rr_intervals_ms, read_header,
+    MAX_RR, FLAG_CONTACT_SUPPORTED, FLAG_CONTACT_DETECTED, FLAG_GAP, FLAG_CONTINUATION,
+)
+from convert_recording import binary_to_csv, csv_to_binary
+from measurement import rr_to_ms
+from recorder import BinaryRecorder
+
+# Heart rate, raw RR intervals (1/1024 s) and sensor contact per notification
+NOTIFICATIONS = [(70, (850,), True), (72, (), None), (75, tuple(range(800, 809)), True), (74, (820, 815), False)]
+
+
+@pytest.mark.parametrize("count", [0, 1, MAX_RR, MAX_RR + 1, 3 * MAX_RR])
+def test_split_rr(count):
+    rr_intervals = tuple(range(count))
+    records = split_rr(FLAG_CONTACT_SUPPORTED, rr_intervals)
+    assert len(records) == max(1, -(-count // MAX_RR))
+    assert records[0][0] == FLAG_CONTACT_SUPPORTED
+    assert all(flags == FLAG_CONTACT_SUPPORTED | FLAG_CONTINUATION for flags, _ in records[1:])
+    assert sum((tuple(chunk) for _, chunk in records), ()) == rr_intervals
+    assert all(len(chunk) <= MAX_RR for _, chunk in records)
+
+
+def test_binary_recorder_round_trip(tmp_path):
+    path = str(tmp_path / "workout.hrb")
+    recorder = BinaryRecorder(path, journal=False)
+    for heart_rate, rr_intervals, sensor_contact in NOTIFICATIONS[:2]:
+        recorder.write_sample(heart_rate, rr_intervals, sensor_contact)
+    recorder.write_gap()
+    for heart_rate, rr_intervals, sensor_contact in NOTIFICATIONS[2:]:
+        recorder.write_sample(heart_rate, rr_intervals, sensor_contact)
+    recorder.close()
+
+    start_ns, records = load_records(path)
+    assert start_ns == read_header(path)
+    # Four notifications (nine RR intervals need three records) and the gap
+    assert len(records) == 7
+    assert (records["flags"] & FLAG_GAP != 0).sum() == 1
+    assert (records["flags"] & FLAG_CONTINUATION != 0).sum() == 2
+    assert (records["offset_ns"][1:] >= records["offset_ns"][:-1]).all()
+
+    _, heart_rates = samples(records)
+    assert heart_rates.tolist() == [heart_rate for heart_rate, _, _ in NOTIFICATIONS]
+    contact = records["flags"][(records["flags"] & (FLAG_GAP | FLAG_CONTINUATION)) == 0] & (FLAG_CONTACT_SUPPORTED | FLAG_CONTACT_DETECTED)
+    assert contact.tolist() == [3, 0, 3, FLAG_CONTACT_SUPPORTED]
+    expected_rr = [rr_to_ms(rr) for _, rr_intervals, _ in NOTIFICATIONS for rr in rr_intervals]
+    assert rr_intervals_ms(records).tolist() == pytest.approx(expected_rr)
+
+
+def test_csv_round_trip(tmp_path):
+    hrb_path = str(tmp_path / "workout.hrb")
+    recorder = BinaryRecorder(hrb_path, journal=False)
+    for heart_rate, rr_intervals, sensor_contact in NOTIFICATIONS:
+        recorder.write_sample(heart_rate, rr_intervals, sensor_contact)
+    recorder.write_gap()
+    recorder.close()
+
+    csv_path = str(tmp_path / "workout.csv")
+    binary_to_csv(hrb_path, csv_path)
+    with open(csv_path, newline="") as f:
+        rows = list(csv.reader(f))[1:]
+    assert [row[1] for row in rows] == ["70", "72", "75", "74", ""]
+    assert rows[2][2].split() == [str(round(rr_to_ms(rr))) for rr in range(800, 809)]
+
+    # And back: the same samples and RR intervals (rounded to whole ms in the CSV)
+    again = str(tmp_path / "again.hrb")
+    csv_to_binary(csv_path, again)
+    _, records = load_records(again)
+    assert samples(records)[1].tolist() == [70, 72, 75, 74]
+    assert len(records) == 7
+
+
+def test_binary_to_csv_starting_with_a_continuation(tmp_path):
+    # A recording cut off at the start, in the middle of a notification
+    hrb_path = tmp_path / "cut.hrb"
+    hrb_path.write_bytes(
+        pack_header(1730480400 * 10**9)
+        + pack_record(0, 80, FLAG_CONTINUATION, (700, 710))
+        + pack_record(10**9, 81, 0, (1024,))
+    )
+    csv_path = tmp_path / "cut.csv"
+    binary_to_csv(str(hrb_path), str(csv_path))
+    with open(csv_path, newline="") as f:
+        rows = list(csv.reader(f))
+    assert [row[1:] for row in rows[1:]] == [["81", "1000"]]
@@ -0,0 +1,78 @@
+import asyncio
+import pytest
+from bus import SampleBus, Subscription, make_sample, BLOCK, DROP_OLDEST, COALESCE_LATEST
+
+
+def deliver(heart_rates, **options):
+    """
+    Publish heart_rates while the sink isn't running (as if it were stuck),
+    then let it handle what it was given. Returns the heart rates it handled
+    and the subscription.
+    """
+    handled = []
+
+    async def run():
+        bus = SampleBus()
+        subscription = bus.subscribe("test", lambda sample: handled.append(sample.heart_rate), **options)
+        for heart_rate in heart_rates:
+            bus.publish(make_sample(heart_rate))
+        bus.start()
+        await bus.close()
+        return subscription
+
+    return handled, asyncio.run(run())
+
+
+def test_block_keeps_every_sample_in_order():
+    handled, subscription = deliver(range(10), maxsize=2, policy=BLOCK)
+    assert handled == list(range(10))
+    assert subscription.blocked == 8
+    assert subscription.overflowed == 0
+
+
+def test_block_throws_away_new_samples_past_max_waiting():
+    handled, subscription = deliver(range(10), maxsize=2, policy=BLOCK, max_waiting=3)
+    assert handled == list(range(5))
+    assert subscription.blocked == 3
+    assert subscription.overflowed == 5
+
+
+def test_drop_oldest_keeps_the_newest():
+    handled, subscription = deliver(range(10), maxsize=3, policy=DROP_OLDEST)
+    assert handled == [7, 8, 9]
+    assert subscription.dropped == 7
+
+
+def test_coalesce_latest_replaces_the_newest():
+    handled, subscription = deliver(range(10), maxsize=3, policy=COALESCE_LATEST)
+    assert handled == [0, 1, 9]
+    assert subscription.coalesced == 7
+
+
+def test_async_sink_and_errors():
+    handled = []
+
+    async def sink(sample):
+        await asyncio.sleep(0)
+        if sample.heart_rate == 1:
+            raise ValueError("bad sample")
+        handled.append(sample.heart_rate)
+
+    async def run():
+        bus = SampleBus()
+        bus.subscribe("test", sink, maxsize=1, policy=BLOCK)
+        bus.start()
+        for heart_rate in range(3):
+            bus.publish(make_sample(heart_rate))
+        await bus.drain()
+        await bus.close()
+        # A closed bus takes no more samples
+        assert not bus.publish(make_sample(3))
+
+    asyncio.run(run())
+    assert handled == [0, 2]
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        Subscription("test", print, policy="newest")
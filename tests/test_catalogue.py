@@ -0,0 +1,80 @@
+import os
+import pytest
+from catalogue import WorkoutCatalogue
+
+
+def write_recording(directory, stamp, heart_rates, name="alex"):
+    path = os.path.join(directory, f"heartrate_data_{name}_{stamp}.csv")
+    day, clock = stamp.split("_")
+    with open(path, "w") as f:
+        f.write("Timestamp,Heart Rate,RR Intervals\n")
+        for second, heart_rate in enumerate(heart_rates):
+            f.write(f"{day[:4]}-{day[4:6]}-{day[6:]} {clock[:2]}:{clock[2:4]}:{second:02d},{heart_rate},\n")
+    return path
+
+
+@pytest.fixture
+def data(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.mkdir("data")
+    write_recording("data", "20241104_180000", [100, 110, 120, 0, 130])
+    write_recording("data", "20241106_180000", [90, 95, 100])
+    return tmp_path
+
+
+def test_update_indexes_new_and_forgets_deleted(data):
+    with WorkoutCatalogue("data/catalogue.sqlite") as catalogue:
+        assert catalogue.update("data") == 2
+        assert catalogue.update("data") == 0
+        workouts = catalogue.query("alex")
+        assert [workout["avg_hr"] for workout in workouts] == [115.0, 95.0]
+        # The dropout (0) is cleaned away
+        assert workouts[0]["min_hr"] == 100
+
+        os.remove("data/heartrate_data_alex_20241106_180000.csv")
+        catalogue.update("data")
+        assert len(catalogue.query()) == 1
+
+
+def test_paths_are_normalised(data):
+    with WorkoutCatalogue("data/catalogue.sqlite") as catalogue:
+        catalogue.update("data")
+        for directory in ("./data", str(data / "data"), "data/"):
+            assert catalogue.update(directory) == 0
+        assert len(catalogue.query()) == 2
+
+        os.remove("data/heartrate_data_alex_20241104_180000.csv")
+        catalogue.update("./data")
+        assert len(catalogue.query()) == 1
+
+
+def test_rows_from_before_normalising(data):
+    with WorkoutCatalogue("data/catalogue.sqlite") as catalogue:
+        catalogue.update("data")
+        # As sessions stored them before
+        with catalogue.connection:
+            catalogue.connection.execute("UPDATE workouts SET path = substr(path, ?)", (len(str(data)) + 2,))
+        assert catalogue.update("data") == 0
+        assert sorted(workout["path"] for workout in catalogue.query()) == sorted(
+            str(data / "data" / name) for name in os.listdir("data") if name.endswith(".csv")
+        )
+
+
+def test_session_rows(data):
+    from types import SimpleNamespace
+    from datetime import datetime
+    from utilities import RunningStats
+
+    stats = RunningStats()
+    for second, heart_rate in enumerate([100, 120, 140]):
+        stats.update(heart_rate, second)
+    session = SimpleNamespace(
+        stats=stats, data_filename="data/heartrate_data_alex_20241104_180000.csv", name="alex",
+        start_time=datetime(2024, 11, 4, 18, 0), profile=None, target_hr=None, gaps=[], zones=None,
+    )
+    with WorkoutCatalogue("data/catalogue.sqlite") as catalogue:
+        catalogue.add_session(session)
+        # update() recognises the session's recording and only indexes the other one
+        assert catalogue.update("data") == 1
+        workouts = catalogue.query("alex", since="2024-11-04", until="2024-11-04")
+        assert len(workouts) == 1
@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+import pytest
+from cleaning import remove_artifacts, clean_chunks, resample, lttb, downsample
+
+# Dropouts (0), a spike up and a spike down, a gap (NaN) and a plausible steep rise
+HEART_RATES = [80, 82, 0, 85, 140, 86, 88, 30, 90, np.nan, 91, 92, 130, 131, 132, 131, 250, 96]
+
+
+def split(heart_rates, size):
+    timestamps = pd.Series(pd.date_range("2024-11-01 18:00:00", periods=len(heart_rates), freq="s"))
+    heart_rates = pd.Series(heart_rates, dtype=float)
+    for start in range(0, len(heart_rates), size):
+        yield (
+            timestamps.iloc[start:start + size].reset_index(drop=True),
+            heart_rates.iloc[start:start + size].reset_index(drop=True),
+        )
+
+
+def test_remove_artifacts():
+    cleaned = remove_artifacts(HEART_RATES)
+    removed = np.flatnonzero(np.isnan(cleaned)).tolist()
+    # 0, the spikes 140 and 30, the gap and 250 (above MAX_HR and a spike)
+    assert removed == [2, 4, 7, 9, 16]
+
+
+@pytest.mark.parametrize("size", range(1, len(HEART_RATES) + 1))
+def test_clean_chunks_matches_one_pass(size):
+    chunks = list(clean_chunks(split(HEART_RATES, size)))
+    timestamps = pd.concat([chunk[0] for chunk in chunks], ignore_index=True)
+    cleaned = pd.concat([chunk[1] for chunk in chunks], ignore_index=True)
+
+    assert timestamps.equals(next(split(HEART_RATES, len(HEART_RATES)))[0])
+    np.testing.assert_array_equal(cleaned.to_numpy(), remove_artifacts(HEART_RATES))
+
+
+def test_clean_chunks_empty():
+    assert list(clean_chunks([])) == []
+
+
+def test_resample_bridges_short_dropouts_only():
+    # Samples at 0, 1, 2, 4 (dropout of 2 s) and 20 s (gap of 16 s)
+    times_ns = np.array([0, 1, 2, 4, 20]) * 10**9
+    grid_ns, values = resample(times_ns, [60, 62, 64, 68, 70])
+    assert grid_ns.tolist() == [second * 10**9 for second in range(21)]
+    assert values[:5].tolist() == [60, 62, 64, 66, 68]
+    assert np.isnan(values[5:20]).all()
+    assert values[20] == 70
+
+
+def test_lttb_keeps_the_ends_and_the_peak():
+    x = np.arange(1000)
+    y = np.zeros(1000)
+    y[637] = 180
+    indices = lttb(x, y, 50)
+    assert len(indices) == 50
+    assert indices[0] == 0 and indices[-1] == 999
+    assert 637 in indices
+    assert (np.diff(indices) > 0).all()
+
+
+def test_lttb_returns_short_series_unchanged():
+    assert lttb(np.arange(10), np.arange(10), 20).tolist() == list(range(10))
+
+
+def test_downsample_keeps_gaps():
+    x = np.arange(1000)
+    y = np.full(1000, 100.0)
+    y[400:500] = np.nan
+    points_x, points_y = downsample(x, y, 100)
+    gaps = np.flatnonzero(np.isnan(points_y))
+    # One NaN inside the gap, so the line breaks there
+    assert len(gaps) == 1
+    assert 400 <= points_x[gaps[0]] < 500
+    assert len(points_x) <= 101
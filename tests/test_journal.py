@@ -0,0 +1,137 @@
+import csv
+import json
+import os
+import shutil
+import subprocess
+import sys
+import pytest
+from binary_format import RECORD
+from journal import JOURNAL_HEADER, journal_path, metadata_path, needs_recovery, recover
+from recorder import BinaryRecorder, CsvRecorder
+
+# Heart rate and raw RR intervals (1/1024 s) per notification; the third needs a continuation record
+SAMPLES = [(70, (850,)), (72, ()), (75, (800, 810, 790, 805, 795, 800)), (74, (820, 815))]
+
+
+def dead_pid():
+    # The id of a process that has finished
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def set_pid(data_path, pid):
+    # Pretend another process recorded it
+    with open(journal_path(data_path), "rb+") as f:
+        header = list(JOURNAL_HEADER.unpack(f.read(JOURNAL_HEADER.size)))
+        header[4] = pid
+        f.seek(0)
+        f.write(JOURNAL_HEADER.pack(*header))
+
+
+def record(path):
+    """
+    Record SAMPLES with a gap in between and return a copy of the data file
+    and journal as they were on disk before the recording was closed, left
+    behind by a process that crashed.
+    """
+    recorder_class = BinaryRecorder if path.suffix == ".hrb" else CsvRecorder
+    recorder = recorder_class(str(path), flush_interval=3600, fsync_interval=3600)
+    for heart_rate, rr_intervals in SAMPLES[:2]:
+        recorder.write_sample(heart_rate, rr_intervals)
+    recorder.write_gap()
+    for heart_rate, rr_intervals in SAMPLES[2:]:
+        recorder.write_sample(heart_rate, rr_intervals)
+    recorder.flush()
+
+    crashed = path.parent / "crashed" / path.name
+    crashed.parent.mkdir()
+    shutil.copy(path, crashed)
+    shutil.copy(journal_path(str(path)), journal_path(str(crashed)))
+    set_pid(str(crashed), dead_pid())
+    recorder.close()
+    with open(metadata_path(str(crashed)), "w") as f:
+        json.dump({"name": "alex", "finalised": False}, f)
+    return crashed
+
+
+def truncate(path, size):
+    with open(path, "rb+") as f:
+        f.truncate(os.path.getsize(path) - size)
+
+
+def test_recover_binary_after_truncated_write(tmp_path):
+    path = tmp_path / "heartrate_data_alex_20241101_180000.hrb"
+    crashed = record(path)
+    # The last record of both files was only partly written
+    truncate(crashed, 7)
+    truncate(journal_path(str(crashed)), 3)
+    assert not os.path.exists(journal_path(str(path)))
+    assert needs_recovery(str(crashed))
+
+    assert recover(str(crashed)) == len(SAMPLES) - 1
+    # Everything up to the torn record, exactly as the recorder wrote it
+    assert crashed.read_bytes() == path.read_bytes()[:-RECORD.size]
+    assert not os.path.exists(journal_path(str(crashed)))
+    assert not needs_recovery(str(crashed))
+    with open(metadata_path(str(crashed))) as f:
+        meta_data = json.load(f)
+    assert meta_data["finalised"] and meta_data["recovered"]
+    assert meta_data["samples"] == len(SAMPLES) - 1
+    assert len(meta_data["gaps"]) == 1
+
+
+def test_recover_csv_after_truncated_write(tmp_path):
+    path = tmp_path / "heartrate_data_alex_20241101_180000.csv"
+    crashed = record(path)
+    truncate(crashed, 5)
+    truncate(journal_path(str(crashed)), 3)
+
+    assert recover(str(crashed)) == len(SAMPLES) - 1
+    with open(path, newline="") as f:
+        expected = list(csv.reader(f))[:-1]
+    with open(crashed, newline="") as f:
+        rows = list(csv.reader(f))
+    # The journal keeps the time in ns, the recorder writes whole seconds, so only compare the values
+    assert [row[1:] for row in rows] == [row[1:] for row in expected]
+    assert rows[3] == [rows[3][0], "", ""]
+
+
+def test_recover_without_journal(tmp_path):
+    path = tmp_path / "heartrate_data_alex_20241101_180000.csv"
+    crashed = record(path)
+    os.remove(journal_path(str(crashed)))
+    truncate(crashed, 5)
+    assert needs_recovery(str(crashed))
+
+    # The partly written row is cut off
+    assert recover(str(crashed)) == len(SAMPLES) - 1
+    assert crashed.read_bytes() == path.read_bytes()[:crashed.stat().st_size]
+    assert crashed.read_bytes().endswith(b"\n")
+
+
+def test_old_recordings_need_no_recovery(tmp_path):
+    path = tmp_path / "heartrate_data_alex_20241101_180000.csv"
+    path.write_text("Timestamp,Heart Rate,RR Intervals\n")
+    # Metadata from before there were journals has no "finalised"
+    with open(metadata_path(str(path)), "w") as f:
+        json.dump({"name": "alex"}, f)
+    assert not needs_recovery(str(path))
+
+
+def test_live_recordings_are_left_alone(tmp_path):
+    path = tmp_path / "heartrate_data_alex_20241101_180000.hrb"
+    recorder = BinaryRecorder(str(path), flush_interval=3600, fsync_interval=3600)
+    recorder.write_sample(70, (850,))
+    recorder.flush()
+    with open(metadata_path(str(path)), "w") as f:
+        json.dump({"name": "alex", "finalised": False}, f)
+
+    # This process is still recording it
+    assert not needs_recovery(str(path))
+    with pytest.raises(ValueError):
+        recover(str(path))
+
+    # Closing doesn't fail if the journal was removed meanwhile
+    os.remove(journal_path(str(path)))
+    recorder.close()
@@ -0,0 +1,67 @@
+import pytest
+from hrv import RollingHrv, hrv_metrics
+from measurement import parse_heart_rate_measurement, encode_heart_rate_measurement, rr_to_ms
+
+
+def test_parse_8_bit_heart_rate_only():
+    assert parse_heart_rate_measurement(bytearray([0x00, 72])) == (72, None, None, ())
+
+
+def test_parse_full_packet():
+    # 16 bit heart rate, contact detected, energy expended and two RR intervals
+    data = bytearray([0x1F, 0x2C, 0x01, 0x34, 0x12, 0x00, 0x04, 0x10, 0x04])
+    heart_rate, sensor_contact, energy_expended, rr_intervals = parse_heart_rate_measurement(data)
+    assert (heart_rate, sensor_contact, energy_expended) == (300, True, 0x1234)
+    assert list(rr_intervals) == [1024, 1040]
+
+
+def test_parse_contact_supported_but_lost():
+    assert parse_heart_rate_measurement(bytearray([0x04, 60]))[1] is False
+
+
+def test_parse_ignores_an_odd_trailing_byte():
+    assert list(parse_heart_rate_measurement(bytearray([0x10, 60, 0x00, 0x04, 0x07]))[3]) == [1024]
+
+
+@pytest.mark.parametrize("heart_rate, rr_intervals, sensor_contact, energy_expended", [
+    (60, (), None, None),
+    (180, (400, 410, 395), True, None),
+    (300, (1024,), False, 500),
+])
+def test_encode_round_trip(heart_rate, rr_intervals, sensor_contact, energy_expended):
+    data = encode_heart_rate_measurement(heart_rate, rr_intervals, sensor_contact, energy_expended)
+    parsed = parse_heart_rate_measurement(data)
+    assert parsed[:3] == (heart_rate, sensor_contact, energy_expended)
+    assert tuple(parsed[3]) == rr_intervals
+
+
+def test_rr_to_ms():
+    assert rr_to_ms(1024) == 1000
+    assert rr_to_ms(512) == 500
+
+
+def test_rolling_hrv_matches_whole_recording():
+    rr_ms = [800, 810, 870, 790, 805, 860, 795, 800, 920, 815]
+    hrv = RollingHrv(window=len(rr_ms))
+    for rr in rr_ms:
+        hrv.update(rr)
+    rmssd, sdnn, pnn50 = hrv_metrics(rr_ms)
+    assert round(hrv.rmssd, 1) == rmssd
+    assert round(hrv.sdnn, 1) == sdnn
+    assert round(hrv.pnn50, 1) == pnn50
+
+
+def test_rolling_hrv_window_and_reset():
+    rr_ms = [800, 900, 700, 810, 820, 815, 805]
+    hrv = RollingHrv(window=4)
+    for rr in rr_ms:
+        hrv.update(rr)
+    # Only the last four intervals count
+    rmssd, sdnn, pnn50 = hrv_metrics(rr_ms[-4:])
+    assert list(hrv.rr) == rr_ms[-4:]
+    assert round(hrv.rmssd, 1) == rmssd
+    assert round(hrv.sdnn, 1) == sdnn
+    assert hrv.pnn50 == pnn50 == 0
+
+    hrv.reset()
+    assert hrv.rmssd is None and hrv.sdnn is None and hrv.pnn50 is None
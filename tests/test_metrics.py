@@ -0,0 +1,54 @@
+from metrics import Histogram, Metrics, render_prometheus
+
+
+def test_quantile_is_the_upper_bound_of_its_bucket():
+    histogram = Histogram([1, 2, 5, 10])
+    for value in (0.5, 1.5, 1.8, 3, 4, 4.5, 8, 9, 9.5, 9.9):
+        histogram.observe(value)
+    assert histogram.quantile(0.1) == 1
+    assert histogram.quantile(0.3) == 2
+    assert histogram.quantile(0.5) == 5
+    assert histogram.count == 10
+    assert histogram.mean == sum((0.5, 1.5, 1.8, 3, 4, 4.5, 8, 9, 9.5, 9.9)) / 10
+
+
+def test_quantile_never_exceeds_the_largest_observation():
+    histogram = Histogram([1, 2, 5, 10])
+    histogram.observe(0.2)
+    histogram.observe(3)
+    assert histogram.quantile(0.5) == 1
+    # The bucket of 3 ends at 5, but nothing was that slow
+    assert histogram.quantile(0.99) == 3
+    assert histogram.quantile(1.0) == 3
+
+
+def test_quantile_above_the_last_bound():
+    histogram = Histogram([1, 2])
+    histogram.observe(30)
+    assert histogram.quantile(0.5) == 30
+
+
+def test_empty_histogram():
+    histogram = Histogram([1, 2])
+    assert histogram.quantile(0.5) is None
+    assert histogram.mean is None
+
+
+def test_disabled_metrics_record_nothing():
+    metrics = Metrics("AA", enabled=False)
+    start = metrics.arrival()
+    metrics.lap("decode", start)
+    metrics.count("errors")
+    assert metrics.stages == {}
+    assert metrics.counters["notifications"] == metrics.counters["errors"] == 0
+
+
+def test_prometheus_buckets_are_cumulative():
+    metrics = Metrics("AA")
+    for _ in range(3):
+        metrics.lap("decode", metrics.clock())
+    metrics.count("errors")
+    text = render_prometheus([metrics])
+    assert 'heartrate_errors_total{device="AA"} 1' in text
+    assert 'heartrate_stage_seconds_bucket{device="AA",stage="decode",le="+Inf"} 3' in text
+    assert 'heartrate_stage_seconds_count{device="AA",stage="decode"} 3' in text
@@ -0,0 +1,48 @@
+import statistics
+import pytest
+from utilities import RunningStats, calories_per_minute
+from zones import ZoneModel
+
+
+def test_count_mean_variance_and_extremes():
+    heart_rates = [72, 80, 95, 110, 104, 99, 120, 87]
+    stats = RunningStats()
+    for second, heart_rate in enumerate(heart_rates):
+        stats.update(heart_rate, second)
+    assert stats.count == len(heart_rates)
+    assert stats.mean == pytest.approx(statistics.mean(heart_rates))
+    assert stats.variance == pytest.approx(statistics.variance(heart_rates))
+    assert (stats.min, stats.max) == (72, 120)
+
+
+def test_empty():
+    stats = RunningStats()
+    assert stats.count == 0
+    assert stats.variance == 0.0
+    assert stats.min is None and stats.max is None
+
+
+def test_time_in_zone_and_kcal():
+    # Zone 1 starts at 95 bpm, zone 2 at 114 bpm (hrmax model, max_hr 190)
+    stats = RunningStats(age=30, weight=70, sex="male", zones=ZoneModel.from_profile({"max_hr": 190}))
+    stats.update(90, 0)
+    stats.update(100, 10)
+    stats.update(120, 40)
+    stats.update(120, 100)
+    # The time until the next sample counts for the current heart rate
+    assert stats.zone_seconds["rest"] == 10
+    assert stats.zone_seconds["zone1"] == 30
+    assert stats.zone_seconds["zone2"] == 60
+    expected = sum(calories_per_minute(30, 70, hr, "male") * seconds / 60 for hr, seconds in [(90, 10), (100, 30), (120, 60)])
+    assert stats.kcal == pytest.approx(expected)
+
+
+def test_gap_is_not_counted():
+    stats = RunningStats(zones=ZoneModel.from_profile({"max_hr": 190}))
+    stats.update(100, 0)
+    stats.update(100, 10)
+    stats.mark_gap()
+    stats.update(100, 500)
+    stats.update(100, 505)
+    assert sum(stats.zone_seconds.values()) == 15
+    assert stats.count == 4
@@ -0,0 +1,86 @@
+import asyncio
+import json
+from stream_server import StreamServer
+
+
+async def get(server, path, last_event_id=None):
+    port = server.server.sockets[0].getsockname()[1]
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    headers = f"Last-Event-ID: {last_event_id}\r\n" if last_event_id is not None else ""
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n{headers}\r\n".encode())
+    await writer.drain()
+    await reader.readuntil(b"\r\n\r\n")
+    return reader, writer
+
+
+async def read_ids(reader, count):
+    # Ids of the next count events
+    ids = []
+    while len(ids) < count:
+        event = (await asyncio.wait_for(reader.readuntil(b"\n\n"), 2)).decode()
+        for line in event.splitlines():
+            if line.startswith("id: "):
+                ids.append(int(line[4:]))
+    return ids
+
+
+def run(test, **options):
+    async def main():
+        server = await StreamServer(port=0, **options).start()
+        try:
+            await test(server)
+        finally:
+            await server.close()
+    asyncio.run(main())
+
+
+def publish(server, count):
+    for _ in range(count):
+        server.publish(json.dumps({"hr": 100 + server.next_id}))
+
+
+def test_replay_sends_the_kept_history_then_live():
+    async def test(server):
+        publish(server, 8)
+        reader, writer = await get(server, "/replay")
+        # Only the last five are kept
+        assert await read_ids(reader, 5) == [3, 4, 5, 6, 7]
+        publish(server, 1)
+        assert await read_ids(reader, 1) == [8]
+        writer.close()
+    run(test, max_history=5)
+
+
+def test_events_are_live_only():
+    async def test(server):
+        publish(server, 3)
+        reader, writer = await get(server, "/events")
+        await asyncio.sleep(0.05)
+        publish(server, 2)
+        assert await read_ids(reader, 2) == [3, 4]
+        writer.close()
+    run(test)
+
+
+def test_resume_after_last_event_id():
+    async def test(server):
+        publish(server, 10)
+        reader, writer = await get(server, "/events", last_event_id=6)
+        assert await read_ids(reader, 3) == [7, 8, 9]
+        writer.close()
+
+        # Older than the history: continue from the oldest kept sample
+        reader, writer = await get(server, "/events", last_event_id=1)
+        assert await read_ids(reader, 5) == [5, 6, 7, 8, 9]
+        writer.close()
+    run(test, max_history=5)
+
+
+def test_unknown_path():
+    async def test(server):
+        port = server.server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"GET /nothing HTTP/1.1\r\n\r\n")
+        assert (await reader.readline()).startswith(b"HTTP/1.1 404")
+        writer.close()
+    run(test)
@@ -0,0 +1,69 @@
+import csv
+import numpy as np
+import pandas as pd
+import pytest
+from cleaning import remove_artifacts
+from convert_recording import csv_to_binary
+from analyse_workout import analyse_workout_streaming
+from streaming_analysis import analyse_stream
+from zones import ZoneModel
+
+ZONE_MODEL = ZoneModel.from_profile({"max_hr": 190})
+
+
+@pytest.fixture(scope="module")
+def recording(tmp_path_factory):
+    # Five minutes of samples every second with dropouts, spikes and a connection gap
+    rng = np.random.default_rng(1)
+    heart_rates = np.round(120 + 40 * np.sin(np.arange(300) / 40) + rng.normal(0, 3, 300)).astype(int)
+    heart_rates[rng.choice(300, 10, replace=False)] = 0
+    heart_rates[[50, 51, 200]] = [230, 20, 60]
+
+    path = tmp_path_factory.mktemp("data") / "heartrate_data_alex_20241101_180000.csv"
+    start = pd.Timestamp("2024-11-01 18:00:00")
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Timestamp", "Heart Rate", "RR Intervals"])
+        for second, heart_rate in enumerate(heart_rates):
+            timestamp = (start + pd.Timedelta(seconds=second)).strftime("%Y-%m-%d %H:%M:%S")
+            writer.writerow([timestamp, "" if 100 <= second < 110 else heart_rate, ""])
+    return path
+
+
+def single_pass(path):
+    # The whole recording in memory at once
+    df = pd.read_csv(path)
+    times_ns = pd.to_datetime(df["Timestamp"]).to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    heart_rates = remove_artifacts(df["Heart Rate"].to_numpy(dtype=float))
+    return times_ns, heart_rates
+
+
+@pytest.mark.parametrize("file_format", ["csv", "binary"])
+@pytest.mark.parametrize("chunksize", [1, 7, None])
+def test_chunked_matches_single_pass(recording, file_format, chunksize):
+    times_ns, heart_rates = single_pass(recording)
+    path = recording
+    if file_format == "binary":
+        path = recording.with_suffix(".hrb")
+        csv_to_binary(str(recording), str(path))
+
+    accumulator = analyse_stream(str(path), ZONE_MODEL, chunksize or len(times_ns))
+
+    assert accumulator.hr_count == np.count_nonzero(~np.isnan(heart_rates))
+    assert accumulator.avg_hr == round(np.nanmean(heart_rates), 1)
+    assert accumulator.max_hr == np.nanmax(heart_rates)
+    assert accumulator.min_hr == np.nanmin(heart_rates)
+    assert accumulator.duration == pd.Timedelta(times_ns[-1] - times_ns[0])
+    np.testing.assert_array_equal(accumulator.zone_ns, ZONE_MODEL.durations(times_ns, heart_rates))
+
+
+def test_recording_without_samples(tmp_path):
+    # Only dropouts, so cleaning leaves nothing
+    path = tmp_path / "heartrate_data_alex_20241101_180000.csv"
+    path.write_text("Timestamp,Heart Rate,RR Intervals\n2024-11-01 18:00:00,0,\n2024-11-01 18:00:01,0,\n")
+
+    accumulator = analyse_stream(str(path))
+    assert accumulator.hr_count == 0
+    assert accumulator.avg_hr is None
+    assert accumulator.max_hr is None
+    assert analyse_workout_streaming(str(path)) == {"workout": path.stem, "error": "no samples"}
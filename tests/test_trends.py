@@ -0,0 +1,68 @@
+import pytest
+from catalogue import WorkoutCatalogue, ZONE_COLUMNS
+from trends import refresh, trends
+
+
+def workout(path, start, duration_s, avg_hr, min_hr, max_hr, zones=(0, 0, 0, 0, 0, 0), name="alex"):
+    row = {
+        "path": path, "workout": path, "name": name, "start": start, "duration_s": duration_s,
+        "avg_hr": avg_hr, "min_hr": min_hr, "max_hr": max_hr, "kcal": duration_s / 10,
+    }
+    row.update(zip(ZONE_COLUMNS, zones))
+    return row
+
+
+@pytest.fixture
+def catalogue(tmp_path):
+    with WorkoutCatalogue(str(tmp_path / "catalogue.sqlite")) as catalogue:
+        # Monday and Wednesday of one week, Sunday of the next (in the next month)
+        catalogue.add(workout("a", "2024-10-28 18:00:00", 3600, 120, 60, 170, (0, 600, 1200, 1800, 0, 0)))
+        catalogue.add(workout("b", "2024-10-30 07:00:00", 1800, 150, 70, 180, (0, 0, 0, 600, 600, 600)))
+        catalogue.add(workout("c", "2024-11-10 09:00:00", 600, 100, 55, 130))
+        yield catalogue
+
+
+def test_weekly_totals(catalogue):
+    # Two weeks and two months
+    assert refresh(catalogue) == 4
+    weeks = trends(catalogue, "alex", "week")
+    assert [week["start"] for week in weeks] == ["2024-10-28", "2024-11-04"]
+    first = weeks[0]
+    assert first["workouts"] == 2
+    assert first["duration_s"] == 5400
+    # Average weighted by duration
+    assert first["avg_hr"] == 130
+    assert (first["resting_hr"], first["peak_hr"]) == (60, 180)
+    assert first["kcal"] == 540
+    # Edwards' TRIMP: minutes in zone times the zone number
+    assert first["load"] == (600 * 1 + 1200 * 2 + 2400 * 3 + 600 * 4 + 600 * 5) / 60
+    assert first["zone3_s"] == 2400
+
+
+def test_monthly_totals(catalogue):
+    refresh(catalogue)
+    months = trends(catalogue, period="month")
+    assert [(month["start"], month["workouts"]) for month in months] == [("2024-10-01", 2), ("2024-11-01", 1)]
+
+
+def test_refresh_only_recomputes_stale_periods(catalogue):
+    refresh(catalogue)
+    assert refresh(catalogue) == 0
+
+    # A new workout touches one week and one month
+    catalogue.add(workout("d", "2024-11-05 18:00:00", 1200, 140, 65, 175))
+    assert refresh(catalogue) == 2
+    assert [week["workouts"] for week in trends(catalogue, "alex", "week")] == [2, 2]
+
+    # Periods without workouts disappear
+    catalogue.remove(["c", "d"])
+    refresh(catalogue)
+    assert [week["start"] for week in trends(catalogue, "alex", "week")] == ["2024-10-28"]
+    assert [month["start"] for month in trends(catalogue, "alex", "month")] == ["2024-10-01"]
+
+
+def test_profiles_are_separate(catalogue):
+    catalogue.add(workout("e", "2024-10-29 18:00:00", 600, 90, 50, 120, name="sam"))
+    refresh(catalogue)
+    assert [week["workouts"] for week in trends(catalogue, "sam", "week")] == [1]
+    assert trends(catalogue, "alex", "week", since="2024-11-01")[0]["start"] == "2024-11-04"
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from zones import ZoneModel, zone_bounds, ZONE_NAMES
+
+MODEL = ZoneModel([100, 120, 140, 160, 180])
+
+
+def test_zone_bounds():
+    assert zone_bounds({"max_hr": 200}) == [100, 120, 140, 160, 180]
+    assert zone_bounds({"max_hr": 200, "resting_hr": 50, "zone_model": "karvonen"}) == [125, 140, 155, 170, 185]
+    assert zone_bounds({"max_hr": 200, "zone_model": "custom", "hr_zones": [90, 110, 130, 150, 170]}) == [90, 110, 130, 150, 170]
+    with pytest.raises(ValueError):
+        zone_bounds({"max_hr": 200, "zone_model": "custom", "hr_zones": [90, 80, 130, 150, 170]})
+
+
+def test_zone_bounds_are_inclusive_below():
+    assert [MODEL.name(hr) for hr in (99, 100, 139, 140, 200)] == ["rest", "zone1", "zone2", "zone3", "zone5"]
+    assert MODEL.index([99, 100, 139, 140, 200]).tolist() == [0, 1, 2, 3, 5]
+
+
+def test_durations_weight_by_time():
+    times_ns = np.array([0, 10, 40, 100, 101]) * 10**9
+    durations = MODEL.durations(times_ns, [90, 125, 185, 150, 150])
+    # Each interval counts for the heart rate at its start; the last sample has none
+    assert durations.tolist() == [10e9, 0, 30e9, 1e9, 0, 60e9]
+    assert len(durations) == len(ZONE_NAMES)
+
+
+def test_durations_skip_gaps():
+    times_ns = np.array([0, 10, 20, 30, 40]) * 10**9
+    durations = MODEL.durations(times_ns, [110, np.nan, 110, 110, np.nan])
+    # Only 20 s -> 30 s has a heart rate at both ends
+    assert durations.tolist() == [0, 10e9, 0, 0, 0, 0]
+
+
+def test_durations_of_a_single_sample():
+    assert MODEL.durations([0], [120]).tolist() == [0] * len(ZONE_NAMES)
+
+
+def test_durations_agree_with_running_stats():
+    from utilities import RunningStats
+
+    rng = np.random.default_rng(3)
+    heart_rates = rng.integers(80, 200, 500)
+    times_ns = np.cumsum(rng.integers(500, 1500, 500)) * 10**6
+    stats = RunningStats(zones=MODEL)
+    for time_ns, heart_rate in zip(times_ns, heart_rates):
+        stats.update(int(heart_rate), time_ns / 1e9)
+    assert MODEL.durations(times_ns, heart_rates) / 1e9 == pytest.approx(list(stats.zone_seconds.values()))
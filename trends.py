@@ -0,0 +1,159 @@
+"""
+Long-term trends per profile (weekly and monthly)
+
+Totals of every week and month are kept in the catalogue (table trends):
+number of workouts, time, time in each zone, training load, kcal, average,
+lowest and highest heart rate. They are materialised, so showing years of
+workouts is one indexed read. refresh() only recomputes the periods of the
+days the catalogue marked as stale (new, changed or deleted workouts), each
+from the catalogue rows of that period, not from the recordings.
+
+Training load is Edwards' TRIMP: minutes in zone 1 to 5 weighted by the
+zone number. The recordings have no separate resting measurement, so the
+resting heart rate trend is the lowest heart rate of the period.
+"""
+import os
+from datetime import datetime
+from catalogue import ZONE_COLUMNS
+from zones import ZONE_LABELS, ZONE_COLOURS
+
+# SQLite date modifiers from a day to the start of its period, and from there to the next period
+PERIODS = {
+    "week": (("weekday 0", "-6 days"), "+7 days"),
+    "month": (("start of month",), "+1 month"),
+}
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS trends (
+    name TEXT NOT NULL,
+    period TEXT NOT NULL,
+    start TEXT NOT NULL,
+    workouts INTEGER,
+    duration_s REAL,
+    {", ".join(f"{column} REAL" for column in ZONE_COLUMNS)},
+    load REAL,
+    kcal REAL,
+    avg_hr REAL,
+    resting_hr INTEGER,
+    peak_hr INTEGER,
+    PRIMARY KEY (name, period, start)
+);
+"""
+
+# Totals of the workouts of one profile between two days
+AGGREGATE = f"""
+INSERT OR REPLACE INTO trends
+SELECT ?, ?, ?, count(*), sum(duration_s),
+    {", ".join(f"sum({column})" for column in ZONE_COLUMNS)},
+    sum({" + ".join(f"{zone} * coalesce({column}, 0)" for zone, column in enumerate(ZONE_COLUMNS) if zone)}) / 60,
+    sum(kcal), sum(avg_hr * duration_s) / sum(CASE WHEN avg_hr IS NOT NULL THEN duration_s END), min(min_hr), max(max_hr)
+FROM workouts
+WHERE name = ? AND start >= ? AND start < date(?, ?)
+"""
+
+
+def refresh(catalogue):
+    """
+    Recompute the periods that contain stale days. Returns the number of periods recomputed.
+    """
+    connection = catalogue.connection
+    new = not connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'trends'").fetchone()
+    connection.executescript(SCHEMA)
+    with connection:
+        if new:
+            # Workouts that were indexed before there were trends
+            connection.execute("INSERT OR IGNORE INTO stale_days SELECT DISTINCT name, substr(start, 1, 10) FROM workouts")
+
+        periods = []
+        for period, (modifiers, _) in PERIODS.items():
+            starts = connection.execute(
+                f"SELECT DISTINCT name, date(day, {', '.join('?' * len(modifiers))}) FROM stale_days", modifiers
+            )
+            periods += [(name, period, start) for name, start in starts]
+
+        for name, period, start in periods:
+            connection.execute(AGGREGATE, (name, period, start, name, start, start, PERIODS[period][1]))
+        # Periods that have no workouts left
+        connection.execute("DELETE FROM trends WHERE workouts = 0")
+        connection.execute("DELETE FROM stale_days")
+    return len(periods)
+
+
+def trends(catalogue, name=None, period="week", since=None, until=None):
+    """
+    Totals (as dicts, oldest first) of every period with workouts, optionally of one profile and between two days.
+    """
+    conditions = ["period = ?"]
+    parameters = [period]
+    if name:
+        conditions.append("name = ?")
+        parameters.append(name)
+    if since:
+        conditions.append("start >= ?")
+        parameters.append(since)
+    if until:
+        conditions.append("start <= ?")
+        parameters.append(until)
+    rows = catalogue.connection.execute(
+        f"SELECT * FROM trends WHERE {' AND '.join(conditions)} ORDER BY name, start", parameters
+    )
+    return [dict(row) for row in rows]
+
+
+def print_trends(rows):
+    print(f"{'Name':<10} {'Start':<10} {'Workouts':>8} {'Time':>7} {'Zones 1-5 (min)':>24} {'Load':>6} {'kcal':>7} {'Avg':>5} {'Low':>4} {'Peak':>4}")
+    for row in rows:
+        minutes = int((row["duration_s"] or 0) // 60)
+        zones = " ".join(f"{(row[column] or 0) / 60:>4.0f}" for column in ZONE_COLUMNS[1:])
+        kcal = "" if row["kcal"] is None else f"{row['kcal']:.0f}"
+        avg_hr = "" if row["avg_hr"] is None else f"{row['avg_hr']:.0f}"
+        print(
+            f"{row['name']:<10} {row['start']:<10} {row['workouts']:>8} {minutes // 60:>4}:{minutes % 60:02d} {zones:>24} "
+            f"{row['load'] or 0:>6.0f} {kcal:>7} {avg_hr:>5} {row['resting_hr'] or '':>4} {row['peak_hr'] or '':>4}"
+        )
+
+
+def plot_trends(rows, name, period, directory="workout_plots"):
+    """
+    Save a plot of one profile's trends (time in zone and load, heart rates, kcal). Returns its path.
+    """
+    import matplotlib.pyplot as plt
+
+    dates = [datetime.strptime(row["start"], "%Y-%m-%d") for row in rows]
+    width = 5 if period == "week" else 25
+
+    fig, ax = plt.subplots(3, 1, figsize=(12, 10), sharex=True)
+
+    # Hours in each zone as stacked bars, training load on top
+    bottom = [0.0] * len(rows)
+    for column, label, colour in zip(ZONE_COLUMNS, ZONE_LABELS, ZONE_COLOURS):
+        hours = [(row[column] or 0) / 3600 for row in rows]
+        ax[0].bar(dates, hours, width, bottom=bottom, label=label, color=colour, edgecolor="grey", linewidth=0.3)
+        bottom = [total + value for total, value in zip(bottom, hours)]
+    ax[0].set_ylabel("Time (h)")
+    # Above the bars, so it never covers them
+    ax[0].legend(loc="lower center", bbox_to_anchor=(0.5, 1.0), ncol=len(ZONE_LABELS), fontsize="small")
+    load_ax = ax[0].twinx()
+    load_ax.plot(dates, [row["load"] or 0 for row in rows], color="black", marker=".")
+    load_ax.set_ylabel("Training load (TRIMP)")
+
+    # Lowest and highest heart rate
+    ax[1].plot(dates, [row["resting_hr"] for row in rows], color="#3AD3F4", marker=".", label="Lowest")
+    ax[1].plot(dates, [row["peak_hr"] for row in rows], color="#E70067", marker=".", label="Peak")
+    ax[1].plot(dates, [row["avg_hr"] for row in rows], color="grey", linestyle="--", label="Average")
+    ax[1].set_ylabel("Heart Rate (bpm)")
+    ax[1].legend(loc="upper left", fontsize="small")
+
+    # Energy
+    ax[2].bar(dates, [row["kcal"] or 0 for row in rows], width, color="#FFD100")
+    ax[2].set_ylabel("kcal")
+    ax[2].set_xlabel(period.capitalize())
+
+    plt.suptitle(f"{period.capitalize()}ly trends of {name}", fontsize=16)
+    fig.autofmt_xdate()
+
+    os.makedirs(directory, exist_ok=True)
+    plot_path = os.path.join(directory, f"trends_{name}_{period}.png")
+    plt.savefig(plot_path)
+    plt.close(fig)
+    return plot_path
@@ -1,10 +1,8 @@
 from datetime import datetime
 import json 
 import os
-import subprocess
-import sys
 
-def current_summary (start_time, y, name, age, weight, sex):
+def current_summary(start_time, stats, name):
     # Get current time 
     now = datetime.now()
 
@@ -12,20 +10,14 @@ def current_summary (start_time, y, name, age, weight, sex):
     time_diff = now - start_time
     time_diff_str = str(time_diff).split(".")[0]
 
-    # Calculate the maximum and average heart rate and round to 1 decimal
-    max_hr = max(y)
-    avg_hr = round(sum(y) / len(y), 1)
+    # Read the maximum and average heart rate from the running statistics
+    max_hr = stats.max
+    avg_hr = round(stats.mean, 1)
 
     # Check if calories burned can be calculated
     if name != "default": 
-        # Calculate the time difference in minutes
-        duration = (datetime.now() - start_time).total_seconds() / 60
-
-        # calculate_calories_burned(age, weight, heart_rate, duration, sex)
-        cb = calculate_calories_burned(age, weight, avg_hr, duration, sex)
-
         # Create one string with all the information
-        summary = f"Time Elapsed: {time_diff_str}, Max HR: {max_hr}, Avg HR: {avg_hr}, kcal: {cb}"
+        summary = f"Time Elapsed: {time_diff_str}, Max HR: {max_hr}, Avg HR: {avg_hr}, kcal: {round(stats.kcal, 1)}"
     else:
         # Create one string with all the information
         summary = f"Time Elapsed: {time_diff_str}, Max HR: {max_hr}, Avg HR: {avg_hr}"
@@ -33,6 +25,77 @@ def current_summary (start_time, y, name, age, weight, sex):
     # Return the summary
     return summary
 
+class RunningStats:
+    """
+    Running heart rate statistics updated in constant time per sample.
+    """
+    zone_names = ["rest", "zone1", "zone2", "zone3", "zone4", "zone5"]
+
+    def __init__(self, age=0, weight=0, sex="unknown", zones=None):
+        # zones is a zones.ZoneModel (or None to skip time in zone)
+        self.age = age
+        self.weight = weight
+        self.sex = sex
+        self.zones = zones
+
+        self.count = 0
+        self.mean = 0.0
+        self.max = None
+        self.min = None
+        self.kcal = 0.0
+        self.zone_seconds = {zone: 0.0 for zone in self.zone_names}
+
+        # Sum of squared differences from the mean (Welford's algorithm)
+        self._m2 = 0.0
+        self._last_hr = None
+        self._last_time = None
+
+    def update(self, heart_rate, timestamp):
+        """
+        Add one sample; timestamp is in seconds.
+        """
+        # Count, mean and variance
+        self.count += 1
+        delta = heart_rate - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (heart_rate - self.mean)
+
+        # Extremes
+        if self.max is None or heart_rate > self.max:
+            self.max = heart_rate
+        if self.min is None or heart_rate < self.min:
+            self.min = heart_rate
+
+        # Attribute the time since the previous sample to the previous heart rate
+        if self._last_time is not None:
+            duration = timestamp - self._last_time
+            if self.zones:
+                self.zone_seconds[self.get_zone(self._last_hr)] += duration
+            if self.sex in ("male", "female"):
+                self.kcal += calories_per_minute(self.age, self.weight, self._last_hr, self.sex) * duration / 60
+
+        self._last_hr = heart_rate
+        self._last_time = timestamp
+
+    def mark_gap(self):
+        """
+        Don't count the time until the next sample (e.g. while disconnected).
+        """
+        self._last_hr = None
+        self._last_time = None
+
+    def get_zone(self, heart_rate):
+        """
+        Name of the heart rate zone that contains heart_rate.
+        """
+        return self.zones.name(heart_rate)
+
+    @property
+    def variance(self):
+        if self.count < 2:
+            return 0.0
+        return self._m2 / (self.count - 1)
+
 def ask_for_profile_input():
     # Ask for the user's DOB, weight and sex
     dob = input("Enter your date of birth (YYYY-MM-DD): ")
@@ -151,16 +214,24 @@ def calculate_calories_burned(age, weight, heart_rate, duration, sex):
     #     H – Your average heart rate in beats per minute;
     #     W – Your weight in kilograms; and
     #     A – Your age in years.
-    if sex == "female":
-        calories_burned = duration * (0.4472 * heart_rate - 0.1263 * weight + 0.074 * age - 20.4022) / 4.184
-    elif sex == "male":
-        calories_burned = duration * (0.6309 * heart_rate + 0.1988 * weight + 0.2017 * age - 55.0969) / 4.184
+    if sex == "female" or sex == "male":
+        calories_burned = duration * calories_per_minute(age, weight, heart_rate, sex)
     else:
         print("Error: cannot calculate calories burned without correct sex. It needs to be 'male' or 'female'.")
         calories_burned = 0
    
     return round(calories_burned, 1) 
 
+def calories_per_minute(age, weight, heart_rate, sex):
+    """
+    Unrounded calories burned per minute (same formula as calculate_calories_burned)
+    """
+    if sex == "female":
+        return (0.4472 * heart_rate - 0.1263 * weight + 0.074 * age - 20.4022) / 4.184
+    elif sex == "male":
+        return (0.6309 * heart_rate + 0.1988 * weight + 0.2017 * age - 55.0969) / 4.184
+    return 0.0
+
 
 def get_heart_rate_zones(max_hr_meta):
     # Calculate the heart rate zones
@@ -179,28 +250,3 @@ def get_heart_rate_zones(max_hr_meta):
         "zone5": [0.9 * max_hr_meta, max_hr_meta]
         }
     return zones
-
-def play_warning_sound():
-    """
-    Play a warning sound based on the operating system in the background
-    """
-    try:
-        if sys.platform == "linux" or sys.platform == "linux2":
-            # Use speaker-test for a reliable beep on Ubuntu/Linux, run in background
-            subprocess.Popen(['speaker-test', '-t', 'sine', '-f', '800', '-l', '1', '-c', '1'], 
-                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-                         
-        elif sys.platform == "darwin":  # macOS
-            subprocess.Popen(['afplay', '/System/Library/Sounds/Glass.aiff'], 
-                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        elif sys.platform == "win32":  # Windows
-            import winsound
-            # Windows winsound.Beep is already non-blocking
-            winsound.Beep(1000, 500)  # 1000 Hz for 500ms
-        else:
-            # Fallback: system bell
-            print('\a', end='', flush=True)
-            
-    except Exception:
-        # Fallback to system bell if everything else fails
-        print('\a', end='', flush=True)
\ No newline at end of file
@@ -0,0 +1,93 @@
+"""
+Heart rate zones
+
+A zone model is the lower bound of zones 1 to 5; everything below zone 1 is
+"rest" and zone 5 has no upper bound. Profiles can choose the model with
+"zone_model":
+    "hrmax"     percentages of the maximum heart rate (default, see get_heart_rate_zones)
+    "karvonen"  percentages of the heart rate reserve, needs "resting_hr"
+    "custom"    five lower bounds in bpm in "hr_zones"
+"""
+from bisect import bisect_right
+from utilities import get_heart_rate_zones
+
+ZONE_NAMES = ["rest", "zone1", "zone2", "zone3", "zone4", "zone5"]
+ZONE_LABELS = ["Rest", "Very light", "Light", "Moderate", "Hard", "Maximum"]
+ZONE_COLOURS = ["#FFFFFF", "#C8C8C8", "#3AD3F4", "#73B42B", "#FFD100", "#E70067"]
+
+# Fractions of the heart rate reserve at the lower bounds of zones 1 to 5
+RESERVE_FRACTIONS = [0.5, 0.6, 0.7, 0.8, 0.9]
+
+
+def zone_bounds(profile, model=None):
+    """
+    Lower bounds (bpm) of zones 1 to 5 for a profile.
+    """
+    model = model or profile.get("zone_model", "hrmax")
+    max_hr = float(profile["max_hr"])
+
+    if model == "hrmax":
+        zones = get_heart_rate_zones(max_hr)
+        return [zones[zone][0] for zone in ZONE_NAMES[1:]]
+    if model == "karvonen":
+        resting_hr = float(profile["resting_hr"])
+        return [resting_hr + fraction * (max_hr - resting_hr) for fraction in RESERVE_FRACTIONS]
+    if model == "custom":
+        bounds = [float(bound) for bound in profile["hr_zones"]]
+        if len(bounds) != 5 or bounds != sorted(bounds):
+            raise ValueError("'hr_zones' needs the five lower zone bounds in increasing order")
+        return bounds
+    raise ValueError(f"Unknown zone model '{model}' (use 'hrmax', 'karvonen' or 'custom')")
+
+
+class ZoneModel:
+    """
+    Maps heart rates to zone indices (0 = rest, 5 = zone 5), one at a time for
+    the live monitor or vectorised for whole recordings.
+    """
+    def __init__(self, bounds):
+        self.bounds = list(bounds)
+
+    @classmethod
+    def from_profile(cls, profile, model=None):
+        return cls(zone_bounds(profile, model))
+
+    def zone(self, heart_rate):
+        """
+        Index of the zone that contains heart_rate.
+        """
+        # Same [lower, upper) bins as np.digitize below
+        return bisect_right(self.bounds, heart_rate)
+
+    def name(self, heart_rate):
+        return ZONE_NAMES[self.zone(heart_rate)]
+
+    def index(self, heart_rates):
+        """
+        Zone indices of an array of heart rates.
+        """
+        # NumPy is only needed for offline analysis
+        import numpy as np
+
+        return np.digitize(heart_rates, self.bounds)
+
+    def durations(self, times_ns, heart_rates):
+        """
+        Time (ns) spent in each zone. The time until the next sample counts
+        towards the zone of the current sample; intervals that start or end
+        in a gap (NaN heart rate) are not counted.
+        """
+        import numpy as np
+
+        times_ns = np.asarray(times_ns, dtype=np.int64)
+        heart_rates = np.asarray(heart_rates, dtype=float)
+        if len(heart_rates) < 2:
+            return np.zeros(len(ZONE_NAMES))
+
+        valid = ~np.isnan(heart_rates[:-1]) & ~np.isnan(heart_rates[1:])
+        # Whole nanoseconds add up exactly in float64, whatever the order
+        return np.bincount(
+            self.index(heart_rates[:-1][valid]),
+            weights=np.diff(times_ns)[valid],
+            minlength=len(ZONE_NAMES),
+        )